@@ -0,0 +1,160 @@
+"""多帧图片（GIF / APNG 动画）处理（不依赖 Qt）
+
+- 每帧按同一个背景检测规则计算背景掩码，所有帧按合并后的不透明区域统一裁剪（与单帧相同的规则：删除在所有帧中都透明的行和列），帧之间保持对齐
+- 不抖动时所有帧拼接后一起去重，所有帧颜色的并集只匹配一次；抖动时每帧使用单独的匹配器
+  （误差扩散和有序抖动的位置不能跨帧）
+- 每帧生成一个网格，统计每帧和所有帧合计的色号数量
+- 各帧的缩小、抖动匹配、渲染和保存在线程池中并行
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import ImageSequence
+
+from dithering import DITHER_NONE, create_matcher
+from image_grid import ColorCounter
+from image_output import DEFAULT_COMPRESS_LEVEL, OUTPUT_PNG, frame_output_path, save_output_image
+from pipeline import background_mask, build_grid, normalize_source
+from profiling import span
+from rendering import (DEFAULT_AXIS_SIZE, DEFAULT_BLOCK_SIZE, RENDER_THREADS, build_block_tiles, load_fonts,
+                       render_full_image_parallel)
+from resampling import RESAMPLE_AREA, downscale_masked, fit_grid_size
+
+
+def is_animated(img):
+    """图片是否包含多帧"""
+    return getattr(img, 'n_frames', 1) > 1
+
+
+def load_frames(img):
+    """读取所有帧，返回 (帧像素数组 (帧数, 高, 宽, 通道), 每帧时长毫秒列表)
+
+    各帧统一为 RGB 或 RGBA 模式（有任意一帧带透明通道时全部转换为 RGBA）。
+    """
+    frames = []
+    durations = []
+    for frame in ImageSequence.Iterator(img):
+        frames.append(normalize_source(frame).copy())  # 迭代器每次返回同一个图片对象
+        durations.append(frame.info.get('duration', 0))
+    mode = 'RGBA' if any(frame.mode == 'RGBA' for frame in frames) else 'RGB'
+    return np.stack([np.asarray(frame.convert(mode)) for frame in frames]), durations
+
+
+def trim_frames(frames, masks=None):
+    """删除在所有帧中都透明的行和列，返回 (裁剪后的帧数组, 保留行掩码, 保留列掩码)（可传入每帧的背景掩码）"""
+    if masks is None:
+        masks = background_mask(frames)
+    opaque = ~masks.all(axis=0)
+    keep_rows = opaque.any(axis=1)
+    keep_cols = opaque.any(axis=0)
+    return frames[:, keep_rows][:, :, keep_cols], keep_rows, keep_cols
+
+
+def _map(function, items, threads):
+    """在线程池中按顺序处理各帧（只有一帧或单线程时直接处理）"""
+    items = list(items)
+    threads = min(threads or RENDER_THREADS, len(items))
+    if threads <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(function, items))
+
+
+def match_frames(frames, palette, method, codes, color_replacement=None, dither=DITHER_NONE, quality=None,
+                 threads=None, masks=None):
+    """匹配所有帧（masks 为每帧的背景掩码），返回索引数组 (帧数, 高, 宽)"""
+    frame_count, height, width = frames.shape[:3]
+    if masks is None:
+        masks = background_mask(frames)
+    if dither == DITHER_NONE:
+        # 拼接为一幅图片匹配：所有帧的颜色一起去重，每种颜色只匹配一次
+        matcher = create_matcher(palette, method, codes, color_replacement, quality=quality)
+        stacked = frames.reshape(frame_count * height, width, -1)
+        stacked_mask = masks.reshape(frame_count * height, width)
+        return matcher.match(stacked, stacked_mask).reshape(frame_count, height, width)
+
+    def match(item):
+        frame, mask = item
+        return create_matcher(palette, method, codes, color_replacement, dither).match(frame, mask)
+    return np.stack(_map(match, zip(frames, masks), threads))
+
+
+def aggregate_statistics(grids):
+    """所有帧合计的色号数量 {色号: 数量}（按首次出现顺序）"""
+    statistics = {}
+    for grid in grids:
+        counter = ColorCounter(grid.codes)
+        counter.add(grid.indices)
+        for code, number in counter.statistics().items():
+            statistics[code] = statistics.get(code, 0) + number
+    return statistics
+
+
+def process_animation(img, palette, method, codes, color_replacement=None, dither=DITHER_NONE,
+                      target_size=(None, None), resample=RESAMPLE_AREA, block_size=DEFAULT_BLOCK_SIZE,
+                      axis_size=DEFAULT_AXIS_SIZE, quality=None, threads=None, background=None):
+    """处理多帧图片，返回结果字典（每帧的网格和时长、尺寸、每帧和合计的色号统计）
+
+    background 为背景检测规则（BackgroundDetector），默认与单帧图片相同。
+    """
+    with span('load'):
+        frames, durations = load_frames(img)
+    frame_count, height, width = frames.shape[:3]
+
+    with span('trim'):
+        masks = background_mask(frames, background)
+        trimmed, keep_rows, keep_cols = trim_frames(frames, masks)
+        masks = masks[:, keep_rows][:, :, keep_cols]
+    new_height, new_width = trimmed.shape[1:3]
+    if new_height <= 0 or new_width <= 0:
+        raise ValueError('图片所有帧完全透明，无法处理！')
+
+    grid_width, grid_height = fit_grid_size(new_width, new_height, *target_size)
+    with span('resample'):
+        resized = _map(lambda item: downscale_masked(item[0], item[1], grid_width, grid_height, resample),
+                       zip(trimmed, masks), threads)
+        trimmed = np.stack([frame for frame, _ in resized])
+        masks = np.stack([mask for _, mask in resized])
+
+    with span('match'):
+        indices = match_frames(trimmed, palette, method, codes, color_replacement, dither, quality, threads,
+                               masks)
+
+    with span('grid'):
+        grids = _map(lambda frame_indices: build_grid(frame_indices, codes, block_size, axis_size),
+                     indices, threads)
+    return {
+        'grids': grids,
+        'durations': durations,
+        'frame_count': frame_count,
+        'original_size': (width, height),
+        'trimmed_size': (new_width, new_height),
+        'grid_size': (grid_width, grid_height),
+        'frame_statistics': [grid.color_statistics() for grid in grids],
+        'color_statistics': aggregate_statistics(grids),
+    }
+
+
+def render_frames(grids, color_lookup, show_color_codes=True, threads=None):
+    """并行渲染每帧的完整图片（色号表相同的帧共用色块贴图），返回 PIL 图片列表"""
+    font, _ = load_fonts()
+    tiles = {}
+    for grid in grids:
+        key = (grid.block_size, tuple(grid.codes))
+        if key not in tiles:
+            tiles[key] = build_block_tiles(grid.codes, color_lookup, grid.block_size, show_color_codes, font)
+
+    def render(grid):
+        return render_full_image_parallel(grid, color_lookup, show_color_codes, threads=1,
+                                          tiles=tiles[(grid.block_size, tuple(grid.codes))])
+    return _map(render, grids, threads)
+
+
+def save_frames(images, base_name, output_format=OUTPUT_PNG, compress_level=DEFAULT_COMPRESS_LEVEL,
+                threads=None):
+    """并行保存每帧的图片，返回 [(输出路径, 实际使用的格式)]"""
+    def save(item):
+        index, image = item
+        path = frame_output_path(base_name, index, output_format)
+        return path, save_output_image(image, path, output_format, compress_level)
+    return _map(save, enumerate(images), threads)
@@ -0,0 +1,139 @@
+"""背景（透明）检测（不依赖 Qt）
+
+背景像素在裁剪时删除（全部为背景的行和列），匹配时保持空白。检测规则：
+- 透明度阈值：RGBA 图片中 A 通道不超过阈值的像素（默认 0，即只有全透明的像素）
+- 背景色和容差：与背景色每个通道的差都不超过容差的像素。未指定背景色时为白色，
+  只用于没有透明通道的图片（默认容差 5，即各通道都 >= 250）；指定背景色时 RGBA 图片同样使用
+- 边缘连通：颜色规则只保留与图片边缘连通的部分（透明像素可以连通），图案内部与背景同色的区域不会被删除
+
+检测结果为一个布尔掩码数组，同时用于裁剪、缩小和匹配。
+"""
+import numpy as np
+
+WHITE = (255, 255, 255)
+DEFAULT_ALPHA_THRESHOLD = 0
+DEFAULT_TOLERANCE = 5
+
+
+def parse_color(text):
+    """解析 '#RRGGBB' 或 'R,G,B' 格式的颜色，空字符串返回 None，格式错误时抛出 ValueError"""
+    text = text.strip()
+    if not text:
+        return None
+    if text.startswith('#') and len(text) == 7:
+        return tuple(int(text[i:i + 2], 16) for i in (1, 3, 5))
+    parts = [part.strip() for part in text.split(',')]
+    if len(parts) == 3 and all(part.isdigit() and int(part) <= 255 for part in parts):
+        return tuple(int(part) for part in parts)
+    raise ValueError(f'无法识别的背景色: {text}')
+
+
+def _find_roots(parent):
+    """指针跳跃直到每个节点都直接指向根节点"""
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def edge_connected(passable):
+    """计算与图片边缘连通（4 邻接）的可通行像素
+
+    每行中连续的可通行像素为一个节点，上下相邻的节点之间有边；用向量化的并查集
+    （按边合并根节点、指针跳跃压缩路径）求连通分量，保留包含边缘像素的分量。
+    """
+    height, width = passable.shape
+    starts = passable.copy()
+    starts[:, 1:] &= ~passable[:, :-1]
+    run_ids = np.cumsum(starts.ravel()).reshape(height, width) - 1  # 可通行像素所在的行内连续段编号
+    run_count = int(run_ids[-1, -1]) + 1
+    if not run_count:
+        return np.zeros_like(passable)
+    run_ids = np.maximum(run_ids, 0)
+
+    # 上下相邻的连续段之间的边（去重）
+    vertical = passable[:-1] & passable[1:]
+    edges = np.unique(run_ids[:-1][vertical].astype(np.int64) * run_count + run_ids[1:][vertical])
+    upper, lower = edges // run_count, edges % run_count
+
+    parent = np.arange(run_count)
+    while True:
+        parent = _find_roots(parent)
+        upper_roots, lower_roots = parent[upper], parent[lower]
+        different = upper_roots != lower_roots
+        if not different.any():
+            break
+        # 较大的根节点指向较小的根节点（父节点编号不大于自身，不会形成环）
+        low = np.minimum(upper_roots[different], lower_roots[different])
+        high = np.maximum(upper_roots[different], lower_roots[different])
+        np.minimum.at(parent, high, low)
+        upper, lower = upper[different], lower[different]  # 已在同一分量的边不再参与合并
+
+    border = np.zeros_like(passable)
+    border[[0, -1]] = True
+    border[:, [0, -1]] = True
+    reached = np.zeros(run_count, dtype=bool)
+    reached[parent[run_ids[border & passable]]] = True
+    return passable & reached[parent[run_ids]]
+
+
+class BackgroundDetector:
+    """背景检测规则"""
+
+    def __init__(self, alpha_threshold=DEFAULT_ALPHA_THRESHOLD, tolerance=DEFAULT_TOLERANCE, key_color=None,
+                 edge_connected=False):
+        self.alpha_threshold = alpha_threshold  # A 通道不超过此值的像素为背景
+        self.tolerance = tolerance  # 与背景色每个通道的最大差值
+        self.key_color = tuple(key_color) if key_color else None  # 指定的背景色（None 为白色，仅无透明通道时）
+        self.edge_connected = edge_connected  # 颜色规则是否只保留与边缘连通的部分
+
+    def alpha_mask(self, pixels):
+        """按透明度阈值计算的背景掩码（RGB 图片为 None）"""
+        if pixels.shape[-1] != 4:
+            return None
+        return pixels[..., 3] <= self.alpha_threshold
+
+    def color_mask(self, pixels):
+        """按背景色和容差计算的背景掩码（不使用颜色规则时为 None）"""
+        color = self.key_color
+        if color is None:
+            if pixels.shape[-1] == 4:
+                return None
+            color = WHITE
+        lower = np.array([max(0, c - self.tolerance) for c in color], dtype=np.uint8)
+        upper = np.array([min(255, c + self.tolerance) for c in color], dtype=np.uint8)
+        rgb = pixels[..., :3]
+        return np.all((rgb >= lower) & (rgb <= upper), axis=-1)
+
+    def mask(self, pixels):
+        """计算像素数组 (高, 宽, 3/4) 的背景掩码；边缘连通检测时也可传入多帧数组 (帧数, 高, 宽, 3/4)"""
+        alpha = self.alpha_mask(pixels)
+        color = self.color_mask(pixels)
+        if color is not None and self.edge_connected:
+            color = self.connect(alpha, color)
+        if alpha is None:
+            return color
+        if color is None:
+            return alpha
+        return alpha | color
+
+    def connect(self, alpha, color):
+        """颜色规则只保留与边缘连通的部分（透明像素可以连通），多帧时逐帧计算"""
+        passable = color if alpha is None else alpha | color
+        if passable.ndim == 3:
+            return np.stack([frame_color & edge_connected(frame_passable)
+                             for frame_color, frame_passable in zip(color, passable)])
+        return color & edge_connected(passable)
+
+    def options(self):
+        """检测规则（可 JSON 序列化），用于计算结果缓存键"""
+        return {
+            'alpha_threshold': self.alpha_threshold,
+            'tolerance': self.tolerance,
+            'key_color': list(self.key_color) if self.key_color else None,
+            'edge_connected': self.edge_connected,
+        }
+
+
+DEFAULT_BACKGROUND = BackgroundDetector()
@@ -0,0 +1,267 @@
+"""处理流水线基准测试（无需图形界面）
+
+生成不同尺寸的合成像素画，在不同大小的调色板上分别计时每个处理阶段：
+裁剪、颜色匹配（每种方法）、网格构建、统计、完整图片渲染、缩略图渲染和保存，
+输出每个阶段的耗时、吞吐量（像素/秒）和峰值内存。
+
+用法：
+    python benchmark.py                                  # 默认：64/256/1024，Mard144/Mard221/merged
+    python benchmark.py --sizes 64 256 --palettes Mard221 --repeat 5
+    python benchmark.py --stages trim match grid statistics --json results.json
+    python benchmark.py --sizes 256 --profile-json profile.json --cprofile profile.prof
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from boards import BOARD_SIZES, split_boards
+from comparison import compare_methods
+from matching import MATCHING_METHODS, PaletteMatcher
+from palette import default_palette_files, load_palette, merge_palettes
+from pipeline import build_grid, match_pixels, trim_transparent
+from profiling import PROFILER
+from image_output import DEFAULT_COMPRESS_LEVEL, OUTPUT_FORMATS, OUTPUT_PNG, save_output_image
+from rendering import (calculate_stats_height, render_full_image, render_full_image_mapped, render_full_image_parallel,
+                       render_thumbnail)
+
+DEFAULT_SIZES = [64, 256, 1024]
+DEFAULT_PALETTES = ['Mard144', 'Mard221', 'merged']
+STAGES = ['trim', 'match', 'compare', 'grid', 'statistics', 'render', 'render_parallel', 'thumbnail', 'boards', 'save', 'save_mapped']
+MATCH_STAGE_PREFIX = 'match:'
+
+
+def generate_pixel_art(size, num_colors=24, seed=0):
+    """生成合成像素画（RGBA）：色块区域 + 少量杂色 + 透明边框"""
+    rng = np.random.default_rng(seed)
+    colors = rng.integers(0, 256, (num_colors, 3), dtype=np.uint8)
+
+    # 低分辨率随机色块放大成区域
+    cell = max(1, size // 16)
+    coarse = rng.integers(0, num_colors, (size // cell + 1, size // cell + 1))
+    regions = np.repeat(np.repeat(coarse, cell, axis=0), cell, axis=1)[:size, :size]
+
+    # 约2%的像素为杂色
+    noise = rng.random((size, size)) < 0.02
+    regions[noise] = rng.integers(0, num_colors, int(noise.sum()))
+
+    pixels = np.empty((size, size, 4), dtype=np.uint8)
+    pixels[..., :3] = colors[regions]
+    pixels[..., 3] = 255
+
+    # 透明边框（用于测试裁剪）
+    margin = max(1, size // 32)
+    pixels[:margin, :, 3] = 0
+    pixels[-margin:, :, 3] = 0
+    pixels[:, :margin, 3] = 0
+    pixels[:, -margin:, 3] = 0
+    return pixels
+
+
+def load_benchmark_palettes(names):
+    """加载调色板，'merged' 为所有颜色数据文件合并后的调色板"""
+    files = {os.path.splitext(os.path.basename(path))[0]: path for path in default_palette_files()}
+    palettes = {}
+    for name in names:
+        if name == 'merged':
+            palettes[name] = merge_palettes([load_palette(path) for path in files.values()])
+        elif name in files:
+            palettes[name] = load_palette(files[name])
+        else:
+            raise ValueError(f'未知的调色板: {name}（可选: {", ".join(list(files) + ["merged"])}）')
+    return palettes
+
+
+def _read_proc_status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def _can_reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _read_proc_status('VmHWM') is not None
+    except OSError:
+        return False
+
+
+def measure_peak_memory(func):
+    """测量函数执行期间新增的峰值内存（字节）
+
+    Linux 下使用进程常驻内存峰值（包含 PIL 等原生分配），其他平台使用 tracemalloc。
+    """
+    if _can_reset_peak_rss():
+        baseline = _read_proc_status('VmRSS')
+        func()
+        return max(0, _read_proc_status('VmHWM') - baseline)
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def time_stage(func, repeat):
+    """多次运行取最短耗时（秒），返回 (耗时, 最后一次结果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(size, palette, stages, methods, repeat, output_dir, measure_memory=True, threads=None,
+                  output_format=OUTPUT_PNG, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """对一个尺寸和调色板运行所有阶段，返回结果列表"""
+    pixels = generate_pixel_art(size)
+    codes = list(palette.codes)
+    color_lookup = palette.color_lookup()
+    results = []
+
+    def record(stage, func, pixel_count):
+        elapsed, value = time_stage(PROFILER.profiled(stage)(func), repeat)
+        peak = measure_peak_memory(func) if measure_memory else None
+        results.append({
+            'size': size,
+            'palette': palette.name,
+            'palette_colors': len(palette),
+            'stage': stage,
+            'seconds': elapsed,
+            'pixels': pixel_count,
+            'pixels_per_second': pixel_count / elapsed if elapsed > 0 else float('inf'),
+            'peak_bytes': peak,
+        })
+        return value
+
+    trimmed, _, _ = trim_transparent(pixels)
+    if 'trim' in stages:
+        record('trim', lambda: trim_transparent(pixels), pixels.shape[0] * pixels.shape[1])
+    cells = trimmed.shape[0] * trimmed.shape[1]
+
+    indices = None
+    for method in methods:
+        match_color = PaletteMatcher(palette, method)
+        match = lambda: match_pixels(trimmed, match_color, codes)
+        if 'match' in stages:
+            indices = record(MATCH_STAGE_PREFIX + method, match, cells)
+        elif indices is None:
+            indices = match()
+    if indices is None:
+        indices = match_pixels(trimmed, PaletteMatcher(palette, 'LAB色彩空间'), codes)
+
+    if 'compare' in stages:
+        record('compare', lambda: compare_methods(trimmed, [palette], methods), cells)
+
+    build = lambda: build_grid(indices, codes)
+    grid = record('grid', build, cells) if 'grid' in stages else build()
+
+    if 'statistics' in stages:
+        record('statistics', grid.color_statistics, cells)
+
+    if 'thumbnail' in stages:
+        record('thumbnail', lambda: render_thumbnail(grid, color_lookup), cells)
+
+    if 'boards' in stages:
+        record('boards', lambda: split_boards(grid, *BOARD_SIZES['29×29']), cells)
+
+    if {'render', 'render_parallel', 'save', 'save_mapped'} & set(stages):
+        output_width = grid.width * grid.block_size + grid.axis_size
+        output_height = (grid.height * grid.block_size + grid.axis_size +
+                         calculate_stats_height(grid.color_statistics(), output_width))
+        output_pixels = output_width * output_height
+        render = lambda: render_full_image(grid, color_lookup)
+        image = None
+        if 'render' in stages:
+            image = record('render', render, output_pixels)
+        elif 'save' in stages:
+            image = render()
+        if 'render_parallel' in stages:
+            record('render_parallel', lambda: render_full_image_parallel(grid, color_lookup, threads=threads),
+                   output_pixels)
+        if 'save' in stages:
+            output_path = os.path.join(output_dir, f'benchmark_{size}_{palette.name}{OUTPUT_FORMATS[output_format]}')
+            record('save', lambda: save_output_image(image, output_path, output_format, compress_level),
+                   output_pixels)
+        if 'save_mapped' in stages:
+            mapped_path = os.path.join(output_dir, f'benchmark_{size}_{palette.name}_mapped.png')
+            record('save_mapped', lambda: render_full_image_mapped(grid, color_lookup, mapped_path,
+                                                                    compress_level=compress_level,
+                                                                    threads=threads),
+                   output_pixels)
+    return results
+
+
+def format_results(results):
+    """格式化结果表格"""
+    lines = [f'{"尺寸":>6} {"调色板":<10} {"阶段":<22} {"耗时(ms)":>11} {"吞吐(Mpx/s)":>12} {"峰值(MB)":>9}']
+    for item in results:
+        peak = '-' if item['peak_bytes'] is None else f'{item["peak_bytes"] / (1 << 20):.1f}'
+        lines.append(f'{item["size"]:>6} {item["palette"]:<10} {item["stage"]:<22} '
+                     f'{item["seconds"] * 1000:>11.2f} {item["pixels_per_second"] / 1e6:>12.2f} {peak:>9}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='处理流水线基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='图片边长（像素）')
+    parser.add_argument('--palettes', nargs='+', default=DEFAULT_PALETTES, help='调色板名称')
+    parser.add_argument('--methods', nargs='+', default=list(MATCHING_METHODS), help='匹配方法')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES, help='要计时的阶段')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段重复次数（取最短耗时）')
+    parser.add_argument('--no-memory', action='store_true', help='不测量峰值内存')
+    parser.add_argument('--output-dir', help='保存阶段输出图片的目录（默认临时目录）')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('--profile-json', help='将各阶段的累计耗时和计数器写入JSON文件')
+    parser.add_argument('--cprofile', help='使用 cProfile 采样并将结果写入 .prof 文件')
+    parser.add_argument('--threads', type=int, help='并行渲染的线程数（默认按CPU核数）')
+    parser.add_argument('--save-format', default=OUTPUT_PNG, choices=list(OUTPUT_FORMATS), help='保存阶段的图片格式')
+    parser.add_argument('--compress-level', type=int, default=DEFAULT_COMPRESS_LEVEL, choices=range(10),
+                        help='保存阶段的压缩级别（0 最快，9 文件最小）')
+    args = parser.parse_args(argv)
+
+    unknown = [method for method in args.methods if method not in MATCHING_METHODS]
+    if unknown:
+        parser.error(f'未知的匹配方法: {", ".join(unknown)}')
+
+    # 关闭 PIL 的内存块缓存，使每个阶段的峰值内存不受前一阶段释放内存的影响
+    Image.core.set_blocks_max(0)
+
+    PROFILER.set_cprofile(bool(args.cprofile))
+    palettes = load_benchmark_palettes(args.palettes)
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_dir = args.output_dir or temp_dir
+        for size in args.sizes:
+            for palette in palettes.values():
+                batch = run_benchmark(size, palette, args.stages, args.methods, args.repeat,
+                                      output_dir, measure_memory=not args.no_memory,
+                                      threads=args.threads, output_format=args.save_format,
+                                      compress_level=args.compress_level)
+                print(format_results(batch), flush=True)
+                results.extend(batch)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.profile_json:
+        PROFILER.dump_json(args.profile_json)
+    if args.cprofile:
+        PROFILER.dump_cprofile(args.cprofile)
+    return results
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
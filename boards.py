@@ -0,0 +1,100 @@
+"""按拼豆板尺寸分板输出（不依赖 Qt）
+
+将图片网格划分为固定尺寸的拼豆板（如 29×29、52×52），每块板单独渲染为一页：
+坐标轴为板内坐标，色号统计只包含这块板上的色块。
+- 对齐方式：左上对齐时多出的空白都在右侧和下方；居中（对称）时空白平均分布在两侧，
+  分板线相对图案中心对称，左右 / 上下对称的图案在对称位置的板上内容也对称
+- 各板的统计通过一次 bincount 计算（板编号 × 色号数 + 色号索引）
+- 各板的渲染和保存在线程池中并行，共用一套色块贴图
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from image_grid import ImageGrid
+from image_output import DEFAULT_COMPRESS_LEVEL, OUTPUT_PNG, board_output_path, save_output_image
+from profiling import span
+from rendering import RENDER_THREADS, build_block_tiles, load_fonts, render_full_image_parallel
+
+BOARD_SIZES = {  # 名称 -> (宽, 高)
+    '29×29': (29, 29),
+    '52×52': (52, 52),
+}
+ALIGN_TOP_LEFT = '左上对齐'
+ALIGN_CENTER = '居中（对称）'
+BOARD_ALIGNMENTS = [ALIGN_CENTER, ALIGN_TOP_LEFT]
+
+
+def board_layout(width, height, board_width, board_height, align=ALIGN_CENTER):
+    """计算分板布局，返回 (板列数, 板行数, 图案在拼板区域中的 x 偏移, y 偏移)"""
+    columns = -(-width // board_width)
+    rows = -(-height // board_height)
+    if align == ALIGN_CENTER:
+        return columns, rows, (columns * board_width - width) // 2, (rows * board_height - height) // 2
+    return columns, rows, 0, 0
+
+
+def board_indices(grid, board_width, board_height, align=ALIGN_CENTER):
+    """将网格索引按拼板布局补齐空白，返回形状为 (板行数, 板列数, 板高, 板宽) 的索引数组"""
+    columns, rows, offset_x, offset_y = board_layout(grid.width, grid.height, board_width, board_height, align)
+    padded = np.full((rows * board_height, columns * board_width), grid.empty_index, dtype=grid.indices.dtype)
+    padded[offset_y:offset_y + grid.height, offset_x:offset_x + grid.width] = grid.indices
+    return padded.reshape(rows, board_height, columns, board_width).swapaxes(1, 2)
+
+
+def board_counts(boards, num_codes):
+    """统计每块板上每个色号的数量，返回形状为 (板行数, 板列数, 色号数) 的数组（空白不计）"""
+    rows, columns = boards.shape[:2]
+    board_count = rows * columns
+    values = boards.reshape(board_count, -1).astype(np.int64)
+    values = np.where(values < num_codes, values, num_codes)  # 空白统一为 num_codes
+    keys = np.arange(board_count)[:, None] * (num_codes + 1) + values
+    counts = np.bincount(keys.ravel(), minlength=board_count * (num_codes + 1))
+    return counts.reshape(rows, columns, num_codes + 1)[..., :num_codes]
+
+
+def split_boards(grid, board_width, board_height, align=ALIGN_CENTER, skip_empty=True):
+    """划分拼豆板，返回 [{'row', 'column', 'grid', 'color_statistics'}]（行、列从 0 开始）"""
+    boards = board_indices(grid, board_width, board_height, align)
+    counts = board_counts(boards, len(grid.codes))
+    result = []
+    for row in range(boards.shape[0]):
+        for column in range(boards.shape[1]):
+            board_count = counts[row, column]
+            if skip_empty and not board_count.any():
+                continue
+            board_grid = ImageGrid(board_width, board_height, grid.block_size, grid.axis_size, grid.codes)
+            board_grid.indices = np.ascontiguousarray(boards[row, column])
+            board_grid.original_indices = board_grid.indices.copy()
+            board_grid.show_color_codes = grid.show_color_codes
+            result.append({
+                'row': row,
+                'column': column,
+                'grid': board_grid,
+                'color_statistics': {grid.codes[i]: int(board_count[i]) for i in np.flatnonzero(board_count)},
+            })
+    return result
+
+
+def save_boards(grid, color_lookup, base_name, board_width, board_height, align=ALIGN_CENTER,
+                show_color_codes=True, output_format=OUTPUT_PNG, compress_level=DEFAULT_COMPRESS_LEVEL,
+                threads=None):
+    """分板渲染并保存，返回 [(输出路径, 实际使用的格式)]（按板的行列顺序）"""
+    with span('split'):
+        boards = split_boards(grid, board_width, board_height, align)
+    font, _ = load_fonts()
+    tiles = build_block_tiles(grid.codes, color_lookup, grid.block_size, show_color_codes, font)
+
+    def save(board):
+        # 每个线程渲染并保存一块板（渲染时复制数组、编码时释放 GIL）
+        image = render_full_image_parallel(board['grid'], color_lookup, show_color_codes,
+                                           board['color_statistics'], threads=1, tiles=tiles)
+        path = board_output_path(base_name, board['row'], board['column'], output_format)
+        return path, save_output_image(image, path, output_format, compress_level)
+
+    threads = min(threads or RENDER_THREADS, max(1, len(boards)))
+    with span('render'):
+        if threads <= 1:
+            return [save(board) for board in boards]
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(save, boards))
@@ -1,82 +1,59 @@
 import sys
 import json
+import time
 import warnings
 import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QFileDialog,
                            QVBoxLayout, QHBoxLayout, QWidget, QLabel, QLineEdit,
                            QScrollArea, QDesktopWidget, QComboBox, QRadioButton,
-                           QButtonGroup)
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QFont, QWheelEvent, QMouseEvent
-from PyQt5.QtCore import Qt, QSize
+                           QButtonGroup, QCheckBox, QGridLayout, QSpinBox)
+from PyQt5.QtGui import QPixmap, QPainter, QFont, QWheelEvent, QMouseEvent
+from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal
 from PIL import Image, ImageDraw, ImageFont
-import numpy as np
+
+import animation
+import boards
+from background import DEFAULT_ALPHA_THRESHOLD, DEFAULT_TOLERANCE, BackgroundDetector, parse_color
+import rendering
+from comparison import compare_methods
+from dithering import DITHER_MODES, create_matcher
+from image_grid import ImageGrid
+from image_output import DEFAULT_COMPRESS_LEVEL, OUTPUT_FORMATS, OUTPUT_PNG, output_path_for, save_output_image
+from match_quality import MatchQuality, format_quality
+from matching import (closest_color_ciede2000, closest_color_cie94, closest_color_hsv_weighted, closest_color_lab,
+                      closest_color_rgb, nearest_substitutes, palette_code_mapping, substitute_table)
+from palette import load_palette, rgb_to_hsv_array, rgb_to_lab_array
+from pattern_export import EXPORT_FORMATS, export_pattern
+from pipeline import build_grid, load_source_pixels, process_image_streaming, trim_transparent
+from profiling import PROFILER, count, profiled, span
+from reduction import plan_color_reduction
+from resampling import RESAMPLE_METHODS, downscale_masked, fit_grid_size
+from result_cache import ResultCache, file_digest, match_options, result_info, result_key
+from project_file import PROJECT_EXTENSION, load_project, referenced_codes, save_project
+from qt_image import array_to_pixmap, pil_to_pixmap
+from rendering import AXIS_SIZE_RANGE, BLOCK_SIZE_RANGE, DEFAULT_AXIS_SIZE, DEFAULT_BLOCK_SIZE
 
 # 忽略 PyQt5 的废弃警告
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-class ColorBlock:
-    """单个色块类"""
-    def __init__(self, x, y, color_code, original_color_code):
-        self.x = x  # 色块在网格中的X坐标
-        self.y = y  # 色块在网格中的Y坐标
-        self.color_code = color_code  # 当前颜色代码
-        self.original_color_code = original_color_code  # 原始颜色代码
-        self.pixmap = None  # 缓存的色块图像
-        self.modified = False  # 是否被修改过
-        
-    def update_color(self, new_color_code):
-        """更新色块颜色"""
-        self.color_code = new_color_code
-        self.modified = True
-        self.pixmap = None  # 清除缓存，需要重新生成
-
-class ImageGrid:
-    """图片网格管理类"""
-    def __init__(self, width, height, block_size=20, axis_size=30):
-        self.width = width  # 网格宽度
-        self.height = height  # 网格高度
-        self.block_size = block_size  # 色块大小
-        self.axis_size = axis_size  # 坐标轴区域大小
-        self.blocks = {}  # 存储所有色块 {(x,y): ColorBlock}
-        self.background_pixmap = None  # 背景图像（坐标轴、统计等）
-        self.composite_pixmap = None  # 合成后的显示图像
-        self.show_color_codes = True  # 是否显示色号
-        
-    def add_block(self, x, y, color_code, original_color_code):
-        """添加色块"""
-        self.blocks[(x, y)] = ColorBlock(x, y, color_code, original_color_code)
-        
-    def update_block_color(self, x, y, new_color_code):
-        """更新色块颜色"""
-        if (x, y) in self.blocks:
-            self.blocks[(x, y)].update_color(new_color_code)
-            return True
-        return False
-        
-    def get_block_color(self, x, y):
-        """获取色块颜色"""
-        if (x, y) in self.blocks:
-            return self.blocks[(x, y)].color_code
-        return None
-        
-    def get_modified_blocks(self):
-        """获取所有修改过的色块"""
-        return [(x, y) for (x, y), block in self.blocks.items() if block.modified]
-        
-    def reset_modifications(self):
-        """重置所有修改标记"""
-        for block in self.blocks.values():
-            block.modified = False
+BLOCK_PIXMAP_CACHE_LIMIT = 4096  # 色块QPixmap缓存的条目上限
+BLOCK_TILES_CACHE_LIMIT = 8  # 色块贴图数组缓存的条目上限
+OVERVIEW_CELL_PIXELS = 4  # 缩小到每个色块显示不足此像素数时，改为显示缩略图（每个色块一个像素放大）
+MIN_ZOOM = 0.02
+MAX_ZOOM = 5.0
 
 class ZoomableLabel(QLabel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.zoom_factor = 1.0
         self.original_pixmap = None
+        self.overview_pixmap = None  # 缩小查看时使用的缩略图（需要时向父窗口获取）
+        self.overview_active = False  # 当前是否显示缩略图
         self.parent_window = None  # 存储父窗口引用
         
     def setPixmap(self, pixmap):
         self.original_pixmap = pixmap
+        self.overview_pixmap = None  # 网格内容可能已变化，缩略图需要重新生成
         self._update_pixmap()
         
     def setParentWindow(self, parent):
@@ -95,7 +72,7 @@ class ZoomableLabel(QLabel):
                 self.zoom_factor *= 0.9  # 缩小10%
                 
             # 限制缩放范围
-            self.zoom_factor = max(0.1, min(5.0, self.zoom_factor))
+            self.zoom_factor = max(MIN_ZOOM, min(MAX_ZOOM, self.zoom_factor))
             
             self._update_pixmap()
             
@@ -108,6 +85,9 @@ class ZoomableLabel(QLabel):
             super().mousePressEvent(event)
             
     def _update_pixmap(self):
+        if self.original_pixmap and self._update_overview():
+            return
+        self.overview_active = False
         if self.original_pixmap:
             # 计算新的尺寸
             new_size = self.original_pixmap.size() * self.zoom_factor
@@ -116,6 +96,67 @@ class ZoomableLabel(QLabel):
                 new_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
             super().setPixmap(scaled_pixmap)
 
+    def _update_overview(self):
+        """缩小到色块很小时显示缩略图（最近邻放大，不缩放完整的大图），返回是否已显示"""
+        if not self.parent_window:
+            return False
+        cell_pixels = self.parent_window.block_size * self.zoom_factor
+        if cell_pixels >= OVERVIEW_CELL_PIXELS:
+            return False
+        if self.overview_pixmap is None:
+            self.overview_pixmap = self.parent_window.overview_pixmap()
+            if self.overview_pixmap is None:
+                return False
+        new_size = self.overview_pixmap.size() * cell_pixels
+        super().setPixmap(self.overview_pixmap.scaled(new_size, Qt.KeepAspectRatio, Qt.FastTransformation))
+        self.overview_active = True
+        return True
+
+class ImageSaveThread(QThread):
+    """在后台线程中编码并写出图片，界面保持响应"""
+    saved = pyqtSignal(str, str, str, float)  # 输出路径, 选择的格式, 实际格式, 耗时（秒）
+    failed = pyqtSignal(str)
+
+    def __init__(self, image, output_path, output_format, compress_level):
+        super().__init__()
+        self.image = image
+        self.output_path = output_path
+        self.output_format = output_format
+        self.compress_level = compress_level
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            used_format = save_output_image(self.image, self.output_path, self.output_format,
+                                            self.compress_level)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.saved.emit(self.output_path, self.output_format, used_format, time.perf_counter() - start)
+
+
+class MappedImageSaveThread(ImageSaveThread):
+    """在后台线程中渲染到磁盘上的内存映射画布并流式编码为PNG（超大图片）"""
+
+    def __init__(self, grid, color_lookup, show_color_codes, tiles, output_path, output_format, compress_level):
+        super().__init__(None, output_path, output_format, compress_level)
+        self.grid = grid
+        self.color_lookup = color_lookup
+        self.show_color_codes = show_color_codes
+        self.tiles = tiles
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            rendering.render_full_image_mapped(self.grid, self.color_lookup, self.output_path,
+                                               self.show_color_codes, compress_level=self.compress_level,
+                                               tiles=self.tiles)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.saved.emit(self.output_path, self.output_format, OUTPUT_PNG, time.perf_counter() - start)
+
+
 class ColorMatcher(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -129,7 +170,9 @@ class ColorMatcher(QMainWindow):
         self.matching_methods = {
             'RGB欧氏距离': self.find_closest_color_rgb,
             'LAB色彩空间': self.find_closest_color_lab,
-            'HSV加权': self.find_closest_color_hsv_weighted
+            'HSV加权': self.find_closest_color_hsv_weighted,
+            'CIE94': self.find_closest_color_cie94,
+            'CIEDE2000': self.find_closest_color_ciede2000
         }
         self.current_method = 'LAB色彩空间'
         
@@ -147,6 +190,8 @@ class ColorMatcher(QMainWindow):
         
         # 图片处理控制
         self.processed_image = None  # 存储处理后的图片
+        self.save_threads = []  # 正在后台保存图片的线程
+        self.result_cache = ResultCache()  # 匹配结果缓存（按图片内容和匹配选项）
         
         # 画笔功能
         self.brush_mode = False  # 画笔模式开关
@@ -155,8 +200,12 @@ class ColorMatcher(QMainWindow):
         
         # 图片网格管理
         self.image_grid = None  # 图片网格管理器
-        self.block_size = 20  # 色块大小
-        self.axis_size = 30  # 坐标轴区域大小
+        self.frame_grids = []  # 多帧图片每帧的网格（当前帧与 image_grid 相同）
+        self.current_frame = 0
+        self.block_size = DEFAULT_BLOCK_SIZE  # 色块大小
+        self.axis_size = DEFAULT_AXIS_SIZE  # 坐标轴区域大小
+        self.block_pixmaps = {}  # (色块大小, 是否显示色号, 色号, 颜色) -> 色块QPixmap
+        self.block_tiles = {}  # (色块大小, 是否显示色号, 色号和颜色) -> 色块贴图数组（保存图片用）
         
         self.init_ui()
         
@@ -169,25 +218,13 @@ class ColorMatcher(QMainWindow):
                     self.color_sources[name] = os.path.join('color', file)
     
     def load_color_data(self, source_name):
-        """根据选择的源加载颜色数据"""
+        """根据选择的源加载颜色数据（使用编译后的调色板缓存，文件未变化时不重新解析JSON）"""
         file_path = self.color_sources[source_name]
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            
-        # 保存原始数据
-        self.color_data = data
-            
-        if source_name == '自选颜色':
-            # 原有格式处理
-            self.color_lookup = {k: np.array(v['rgb']) for k, v in data.items() 
-                               if not v.get('is_placeholder', False)}
-        else:
-            # 新格式处理（十六进制颜色代码）
-            self.color_lookup = {}
-            for item in data['data']:
-                hex_color = item['color'].lstrip('#')
-                rgb = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-                self.color_lookup[item['colorCode']] = np.array(rgb)
+        self.palette = load_palette(file_path, source_name)
+        self.color_lookup = self.palette.color_lookup()
+        
+        # 预先计算当前匹配方法下的色号距离矩阵和替代色表（用于推荐替换色和限制颜色数）
+        substitute_table(self.palette, self.method_combo.currentText())
     
     def init_ui(self):
         central_widget = QWidget()
@@ -206,6 +243,7 @@ class ColorMatcher(QMainWindow):
         source_label = QLabel('颜色数据源：')
         source_layout.addWidget(source_label)
         
+        self.source_radios = {}  # 颜色源单选按钮 {源名称: QRadioButton}
         for i, source_name in enumerate(self.color_sources.keys()):
             radio = QRadioButton(source_name)
             if source_name == self.current_source:
@@ -214,6 +252,7 @@ class ColorMatcher(QMainWindow):
                                 self.on_source_changed(name) if checked else None)
             source_group.addButton(radio)
             source_layout.addWidget(radio)
+            self.source_radios[source_name] = radio
         
         left_control.addLayout(source_layout)
         
@@ -234,6 +273,22 @@ class ColorMatcher(QMainWindow):
         self.save_btn.setEnabled(False)
         btn_layout.addWidget(self.save_btn)
         
+        # 工程文件按钮
+        self.save_project_btn = QPushButton('保存工程', self)
+        self.save_project_btn.clicked.connect(self.save_project)
+        self.save_project_btn.setEnabled(False)
+        btn_layout.addWidget(self.save_project_btn)
+        
+        self.open_project_btn = QPushButton('打开工程', self)
+        self.open_project_btn.clicked.connect(self.open_project)
+        btn_layout.addWidget(self.open_project_btn)
+        
+        # 导出图案数据按钮（色号图和用料清单）
+        self.export_btn = QPushButton('导出数据', self)
+        self.export_btn.clicked.connect(self.export_pattern_data)
+        self.export_btn.setEnabled(False)
+        btn_layout.addWidget(self.export_btn)
+        
         # 色号显示控制按钮
         self.show_codes_btn = QPushButton('隐藏色号', self)
         self.show_codes_btn.setCheckable(True)
@@ -245,6 +300,21 @@ class ColorMatcher(QMainWindow):
         self.replace_colors_btn.clicked.connect(self.show_color_replacement_dialog)
         btn_layout.addWidget(self.replace_colors_btn)
         
+        # 限制颜色数按钮（合并用量少的色号或限制为库存色号）
+        self.reduce_colors_btn = QPushButton('限制颜色数', self)
+        self.reduce_colors_btn.clicked.connect(self.show_color_reduction_dialog)
+        btn_layout.addWidget(self.reduce_colors_btn)
+        
+        # 转换颜色源按钮（将当前图案转换到其他颜色源，保留编辑）
+        self.convert_source_btn = QPushButton('转换颜色源', self)
+        self.convert_source_btn.clicked.connect(self.show_convert_source_dialog)
+        btn_layout.addWidget(self.convert_source_btn)
+        
+        # 对比匹配方法按钮（所有方法共用一次裁剪和颜色去重）
+        self.compare_methods_btn = QPushButton('对比匹配方法', self)
+        self.compare_methods_btn.clicked.connect(self.show_method_comparison_dialog)
+        btn_layout.addWidget(self.compare_methods_btn)
+        
         # 撤销替换按钮
         self.undo_replacement_btn = QPushButton('撤销替换', self)
         self.undo_replacement_btn.clicked.connect(self.undo_last_replacement)
@@ -273,8 +343,133 @@ class ColorMatcher(QMainWindow):
         self.method_combo.setCurrentText(self.current_method)
         method_layout.addWidget(method_label)
         method_layout.addWidget(self.method_combo)
+        
+        # 抖动模式选择
+        dither_label = QLabel('抖动：')
+        self.dither_combo = QComboBox()
+        self.dither_combo.addItems(DITHER_MODES)
+        method_layout.addWidget(dither_label)
+        method_layout.addWidget(self.dither_combo)
+        
+        # 结果缓存（相同图片和匹配选项再次处理时跳过匹配）
+        self.result_cache_checkbox = QCheckBox('结果缓存')
+        self.result_cache_checkbox.setChecked(True)
+        method_layout.addWidget(self.result_cache_checkbox)
+        
+        # 匹配质量统计（平均/最大ΔE、接近并列的像素，仅不抖动时）
+        self.quality_checkbox = QCheckBox('匹配质量')
+        self.quality_checkbox.setChecked(True)
+        method_layout.addWidget(self.quality_checkbox)
+        
+        # 流式处理开关（大图按行带处理并直接写出PNG）
+        self.streaming_checkbox = QCheckBox('流式处理（大图）')
+        method_layout.addWidget(self.streaming_checkbox)
+        
+        # 性能统计（各阶段耗时显示在状态栏，可导出JSON和cProfile结果）
+        self.profile_checkbox = QCheckBox('性能统计')
+        method_layout.addWidget(self.profile_checkbox)
+        self.cprofile_checkbox = QCheckBox('cProfile')
+        self.cprofile_checkbox.toggled.connect(PROFILER.set_cprofile)
+        method_layout.addWidget(self.cprofile_checkbox)
+        self.export_profile_btn = QPushButton('导出性能数据', self)
+        self.export_profile_btn.clicked.connect(self.export_profile_data)
+        method_layout.addWidget(self.export_profile_btn)
         left_control.addLayout(method_layout)
         
+        # 目标网格尺寸（留空则一个像素对应一个色块，只填一边时按比例计算）
+        resample_layout = QHBoxLayout()
+        resample_layout.addWidget(QLabel('目标网格尺寸：'))
+        self.target_width_input = QLineEdit(self)
+        self.target_width_input.setPlaceholderText('宽（色块数）')
+        resample_layout.addWidget(self.target_width_input)
+        self.target_height_input = QLineEdit(self)
+        self.target_height_input.setPlaceholderText('高（色块数）')
+        resample_layout.addWidget(self.target_height_input)
+        self.resample_combo = QComboBox()
+        self.resample_combo.addItems(RESAMPLE_METHODS)
+        resample_layout.addWidget(self.resample_combo)
+        left_control.addLayout(resample_layout)
+        
+        # 保存格式（压缩级别 0 最快、9 文件最小；流式处理只输出PNG）
+        save_format_layout = QHBoxLayout()
+        save_format_layout.addWidget(QLabel('保存格式：'))
+        self.save_format_combo = QComboBox()
+        self.save_format_combo.addItems(list(OUTPUT_FORMATS))
+        save_format_layout.addWidget(self.save_format_combo)
+        save_format_layout.addWidget(QLabel('压缩级别：'))
+        self.compress_level_combo = QComboBox()
+        self.compress_level_combo.addItems([str(level) for level in range(10)])
+        self.compress_level_combo.setCurrentIndex(DEFAULT_COMPRESS_LEVEL)
+        save_format_layout.addWidget(self.compress_level_combo)
+        self.background_save_checkbox = QCheckBox('后台保存')
+        self.background_save_checkbox.setChecked(True)
+        save_format_layout.addWidget(self.background_save_checkbox)
+        left_control.addLayout(save_format_layout)
+        
+        # 分板保存（按拼豆板尺寸切分，每块板一页，坐标和色号统计为板内的）
+        board_layout = QHBoxLayout()
+        board_layout.addWidget(QLabel('拼板：'))
+        self.board_size_combo = QComboBox()
+        self.board_size_combo.addItems(list(boards.BOARD_SIZES))
+        board_layout.addWidget(self.board_size_combo)
+        self.board_align_combo = QComboBox()
+        self.board_align_combo.addItems(boards.BOARD_ALIGNMENTS)
+        board_layout.addWidget(self.board_align_combo)
+        self.board_save_btn = QPushButton('分板保存', self)
+        self.board_save_btn.clicked.connect(self.save_boards)
+        self.board_save_btn.setEnabled(False)
+        board_layout.addWidget(self.board_save_btn)
+        board_layout.addStretch()
+        left_control.addLayout(board_layout)
+        
+        # 色块大小和坐标轴区域大小（修改后从现有网格重新排版，不重新匹配）
+        layout_size_layout = QHBoxLayout()
+        layout_size_layout.addWidget(QLabel('色块大小：'))
+        self.block_size_spin = QSpinBox()
+        self.block_size_spin.setRange(*BLOCK_SIZE_RANGE)
+        self.block_size_spin.setValue(self.block_size)
+        self.block_size_spin.setKeyboardTracking(False)
+        self.block_size_spin.valueChanged.connect(self.change_layout_sizes)
+        layout_size_layout.addWidget(self.block_size_spin)
+        layout_size_layout.addWidget(QLabel('坐标轴：'))
+        self.axis_size_spin = QSpinBox()
+        self.axis_size_spin.setRange(*AXIS_SIZE_RANGE)
+        self.axis_size_spin.setValue(self.axis_size)
+        self.axis_size_spin.setKeyboardTracking(False)
+        self.axis_size_spin.valueChanged.connect(self.change_layout_sizes)
+        layout_size_layout.addWidget(self.axis_size_spin)
+        layout_size_layout.addStretch()
+        
+        # 背景检测（透明度阈值、背景色和容差、是否只删除与边缘连通的背景）
+        background_layout = QHBoxLayout()
+        background_layout.addWidget(QLabel('背景：透明度阈值'))
+        self.alpha_threshold_spin = QSpinBox()
+        self.alpha_threshold_spin.setRange(0, 254)
+        self.alpha_threshold_spin.setValue(DEFAULT_ALPHA_THRESHOLD)
+        background_layout.addWidget(self.alpha_threshold_spin)
+        background_layout.addWidget(QLabel('颜色容差'))
+        self.background_tolerance_spin = QSpinBox()
+        self.background_tolerance_spin.setRange(0, 255)
+        self.background_tolerance_spin.setValue(DEFAULT_TOLERANCE)
+        background_layout.addWidget(self.background_tolerance_spin)
+        self.background_color_input = QLineEdit(self)
+        self.background_color_input.setPlaceholderText('背景色（默认白色，#RRGGBB 或 R,G,B）')
+        background_layout.addWidget(self.background_color_input)
+        self.edge_connected_checkbox = QCheckBox('仅边缘连通')
+        background_layout.addWidget(self.edge_connected_checkbox)
+        left_control.addLayout(background_layout)
+        
+        # 多帧图片（GIF / APNG）的帧选择
+        self.frame_label = QLabel('帧：')
+        self.frame_spin = QSpinBox()
+        self.frame_spin.setKeyboardTracking(False)
+        self.frame_spin.valueChanged.connect(self.show_frame)
+        layout_size_layout.addWidget(self.frame_label)
+        layout_size_layout.addWidget(self.frame_spin)
+        self.frame_label.setVisible(False)
+        self.frame_spin.setVisible(False)
+        left_control.addLayout(layout_size_layout)
+        
         # 新颜色输入控件（仅在自选颜色模式下显示）
         self.color_input_widget = QWidget()
         color_input_layout = QHBoxLayout(self.color_input_widget)
@@ -340,6 +535,8 @@ class ColorMatcher(QMainWindow):
         # 状态标签
         self.status_label = QLabel('')
         main_layout.addWidget(self.status_label)
+        self.profile_summary = ''  # 状态栏末尾显示的性能统计
+        PROFILER.add_listener(self.show_profile_summary)
         
         # 加载初始颜色数据
         self.load_color_data(self.current_source)
@@ -370,6 +567,169 @@ class ColorMatcher(QMainWindow):
         
         # 清空图片网格
         self.image_grid = None
+        self.clear_frames()
+
+    def show_convert_source_dialog(self):
+        """显示转换颜色源对话框"""
+        if not self.image_grid:
+            self.status_label.setText('请先加载并处理图片！')
+            return
+            
+        dialog = QWidget()
+        dialog.setWindowTitle('转换颜色源')
+        dialog.setFixedSize(400, 150)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(f'将当前图案从 {self.current_source} 转换到（按当前匹配方法选择最接近的颜色）：'))
+        
+        target_combo = QComboBox()
+        target_combo.addItems([name for name in self.color_sources if name != self.current_source])
+        layout.addWidget(target_combo)
+        
+        button_layout = QHBoxLayout()
+        convert_btn = QPushButton('转换')
+        convert_btn.clicked.connect(lambda: self.convert_pattern(target_combo.currentText(), dialog))
+        button_layout.addWidget(convert_btn)
+        
+        cancel_btn = QPushButton('取消')
+        cancel_btn.clicked.connect(dialog.close)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+        
+        dialog.show()
+
+    def convert_pattern(self, target_source, dialog):
+        """将当前图案转换到目标颜色源（查表映射网格索引，保留画笔修改和颜色替换）"""
+        if not self.image_grid or target_source not in self.color_sources:
+            return
+            
+        source_source = self.current_source
+        grid = self.image_grid
+        try:
+            start = time.perf_counter()
+            target_palette = load_palette(self.color_sources[target_source], target_source)
+            
+            # 源颜色源的所有色号（包括替换映射和画笔记录中的色号）映射到目标颜色源
+            codes = list(dict.fromkeys(self.palette.codes + grid.codes))
+            mapping = palette_code_mapping(self.palette, target_palette, self.method_combo.currentText(), codes)
+            new_grid = grid.converted(mapping, target_palette.codes)
+        except Exception as e:
+            self.status_label.setText(f'转换失败: {str(e)}')
+            return
+        dialog.close()
+        
+        def convert_replacement(replacement):
+            converted = {}
+            for source, target in replacement.items():
+                source, target = mapping.get(source, source), mapping.get(target, target)
+                if source != target:
+                    converted.setdefault(source, target)
+            return converted
+        
+        color_replacement = convert_replacement(self.color_replacement)
+        replacement_history = [convert_replacement(state) for state in self.replacement_history]
+        brush_changes = [dict(change, old_color=mapping.get(change['old_color'], change['old_color']),
+                              new_color=mapping.get(change['new_color'], change['new_color']))
+                         for change in self.brush_changes]
+        
+        # 切换颜色源（会清空当前的编辑状态），然后恢复转换后的网格和编辑记录
+        self.source_radios[target_source].setChecked(True)
+        self.color_replacement = color_replacement
+        self.replacement_history = replacement_history
+        self.undo_replacement_btn.setEnabled(bool(self.replacement_history))
+        self.brush_changes = brush_changes
+        self.undo_brush_btn.setEnabled(bool(self.brush_changes))
+        
+        self.image_grid = new_grid
+        self.processed_image = None
+        self.update_all_blocks_display()
+        
+        merged = len(grid.color_statistics()) - len(new_grid.color_statistics())
+        elapsed = (time.perf_counter() - start) * 1000
+        status = f'图案已从 {source_source} 转换到 {target_source} ({elapsed:.1f} ms)'
+        if merged > 0:
+            status += f', {merged} 种颜色合并为相同色号'
+        self.status_label.setText(status)
+
+    def show_method_comparison_dialog(self):
+        """显示匹配方法对比对话框（缩略图、颜色数和平均ΔE）"""
+        if not hasattr(self, 'image_path') or not self.image_path:
+            self.status_label.setText('请先加载图片！')
+            return
+            
+        try:
+            # 与处理图片相同的裁剪和缩小，只做一次
+            start = time.perf_counter()
+            img_array = load_source_pixels(Image.open(self.image_path))
+            mask = self.get_background_detector().mask(img_array)
+            trimmed, keep_rows, keep_cols = trim_transparent(img_array, mask)
+            if not trimmed.size:
+                self.status_label.setText('图片完全透明，无法处理！')
+                return
+            grid_width, grid_height = fit_grid_size(trimmed.shape[1], trimmed.shape[0],
+                                                    *self.get_target_grid_size())
+            pixels, mask = downscale_masked(trimmed, mask[keep_rows][:, keep_cols], grid_width, grid_height,
+                                            self.resample_combo.currentText())
+            prepare_seconds = time.perf_counter() - start
+        except Exception as e:
+            self.status_label.setText(f'对比出错: {str(e)}')
+            return
+            
+        dialog = QWidget()
+        dialog.setWindowTitle('对比匹配方法')
+        dialog.resize(960, 640)
+        layout = QVBoxLayout(dialog)
+        
+        all_sources_checkbox = QCheckBox('对比所有颜色源')
+        layout.addWidget(all_sources_checkbox)
+        summary_label = QLabel('')
+        layout.addWidget(summary_label)
+        
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        results_widget = QWidget()
+        scroll_area.setWidget(results_widget)
+        layout.addWidget(scroll_area)
+        
+        def fill_results(all_sources):
+            # 替换结果区域的内容
+            results_widget = QWidget()
+            grid_layout = QGridLayout(results_widget)
+            start = time.perf_counter()
+            sources = list(self.color_sources) if all_sources else [self.current_source]
+            palettes = [self.palette if name == self.current_source else
+                        load_palette(self.color_sources[name], name) for name in sources]
+            results = compare_methods(pixels, palettes, list(self.matching_methods), mask=mask)
+            elapsed = time.perf_counter() - start + prepare_seconds
+            
+            columns = len(self.matching_methods)
+            for i, result in enumerate(results):
+                cell = QVBoxLayout()
+                thumbnail_label = QLabel()
+                thumbnail_label.setPixmap(array_to_pixmap(result['thumbnail']))
+                cell.addWidget(thumbnail_label)
+                cell.addWidget(QLabel(f"{result['palette']} / {result['method']}\n"
+                                      f"颜色数: {result['color_count']}\n"
+                                      f"平均ΔE: {result['mean_delta_e']:.2f}  最大ΔE: {result['max_delta_e']:.2f}"))
+                use_btn = QPushButton('使用此设置')
+                use_btn.clicked.connect(lambda checked, source=result['palette'], method=result['method']:
+                                        self.apply_compared_method(source, method, dialog))
+                cell.addWidget(use_btn)
+                grid_layout.addLayout(cell, i // columns, i % columns)
+            scroll_area.setWidget(results_widget)
+            summary_label.setText(f'网格大小: {grid_width}x{grid_height}，{len(results)} 种组合，'
+                                  f'耗时 {elapsed * 1000:.1f} ms（ΔE 使用 CIEDE2000 计算）')
+        
+        all_sources_checkbox.toggled.connect(fill_results)
+        fill_results(False)
+        dialog.show()
+
+    def apply_compared_method(self, source_name, method, dialog):
+        """使用对比结果中选择的颜色源和匹配方法重新处理图片"""
+        dialog.close()
+        if source_name != self.current_source:
+            self.source_radios[source_name].setChecked(True)
+        self.method_combo.setCurrentText(method)
+        self.process_image()
 
     def toggle_color_codes(self):
         """切换色号显示状态"""
@@ -395,7 +755,7 @@ class ColorMatcher(QMainWindow):
         # 创建对话框
         dialog = QWidget()
         dialog.setWindowTitle('颜色替换')
-        dialog.setFixedSize(400, 300)
+        dialog.setFixedSize(400, 340)
         
         layout = QVBoxLayout(dialog)
         
@@ -423,6 +783,35 @@ class ColorMatcher(QMainWindow):
         target_layout.addWidget(target_combo)
         layout.addLayout(target_layout)
         
+        # 推荐替换色（按当前匹配方法与源颜色最接近的色号，点击选为目标颜色）
+        suggestion_layout = QHBoxLayout()
+        suggestion_layout.addWidget(QLabel('推荐：'))
+        suggestion_buttons = []
+        for _ in range(5):
+            button = QPushButton()
+            button.clicked.connect(lambda checked, b=button: target_combo.setCurrentText(b.text()))
+            suggestion_layout.addWidget(button)
+            suggestion_buttons.append(button)
+        layout.addLayout(suggestion_layout)
+        
+        def update_suggestions():
+            suggestions = nearest_substitutes(self.palette, source_combo.currentText(),
+                                              self.method_combo.currentText(), len(suggestion_buttons))
+            for i, button in enumerate(suggestion_buttons):
+                if i < len(suggestions):
+                    code = suggestions[i][0]
+                    color = self.color_lookup[code]
+                    text_color = rendering.text_color_for(color)
+                    button.setText(code)
+                    button.setStyleSheet(f"background-color: rgb({color[0]}, {color[1]}, {color[2]}); "
+                                         f"color: rgb({text_color[0]}, {text_color[1]}, {text_color[2]});")
+                    button.show()
+                else:
+                    button.hide()
+        
+        source_combo.currentTextChanged.connect(update_suggestions)
+        update_suggestions()
+        
         # 预览区域
         preview_label = QLabel('预览：')
         layout.addWidget(preview_label)
@@ -552,6 +941,89 @@ class ColorMatcher(QMainWindow):
         # 更新统计区域
         self.update_statistics_display()
 
+    def show_color_reduction_dialog(self):
+        """显示限制颜色数对话框"""
+        if not self.image_grid:
+            self.status_label.setText('请先加载并处理图片！')
+            return
+            
+        dialog = QWidget()
+        dialog.setWindowTitle('限制颜色数')
+        dialog.setFixedSize(400, 200)
+        layout = QVBoxLayout(dialog)
+        
+        used_count = len(self.image_grid.color_statistics())
+        layout.addWidget(QLabel(f'当前使用 {used_count} 种颜色，用量少的色号将合并到最接近的颜色：'))
+        
+        # 最大颜色数
+        max_layout = QHBoxLayout()
+        max_layout.addWidget(QLabel('最大颜色数：'))
+        max_colors_input = QLineEdit()
+        max_colors_input.setPlaceholderText('留空则不限制')
+        max_layout.addWidget(max_colors_input)
+        layout.addLayout(max_layout)
+        
+        # 库存色号
+        inventory_layout = QHBoxLayout()
+        inventory_layout.addWidget(QLabel('库存色号：'))
+        inventory_input = QLineEdit()
+        inventory_input.setPlaceholderText('用逗号或空格分隔，留空则使用全部色号')
+        inventory_layout.addWidget(inventory_input)
+        layout.addLayout(inventory_layout)
+        
+        button_layout = QHBoxLayout()
+        apply_btn = QPushButton('应用')
+        apply_btn.clicked.connect(lambda: self.apply_color_reduction(
+            max_colors_input.text(), inventory_input.text(), dialog))
+        button_layout.addWidget(apply_btn)
+        
+        cancel_btn = QPushButton('取消')
+        cancel_btn.clicked.connect(dialog.close)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+        
+        dialog.show()
+
+    def apply_color_reduction(self, max_colors_text, inventory_text, dialog):
+        """合并色号以满足最大颜色数/库存限制（可通过撤销替换恢复）"""
+        max_colors_text = max_colors_text.strip()
+        if max_colors_text and not (max_colors_text.isdigit() and int(max_colors_text) > 0):
+            self.status_label.setText('最大颜色数必须为正整数！')
+            return
+        max_colors = int(max_colors_text) if max_colors_text else None
+        inventory = inventory_text.replace('，', ',').replace(',', ' ').split() or None
+        if max_colors is None and inventory is None:
+            self.status_label.setText('请输入最大颜色数或库存色号！')
+            return
+            
+        color_statistics = self.image_grid.color_statistics()
+        try:
+            mapping = plan_color_reduction(color_statistics, self.palette, self.method_combo.currentText(),
+                                           max_colors, inventory)
+        except ValueError as e:
+            self.status_label.setText(str(e))
+            return
+        dialog.close()
+        if not mapping:
+            self.status_label.setText('颜色数已满足要求，无需合并')
+            return
+            
+        # 保存当前状态到历史记录，并将合并结果并入颜色替换映射
+        self.replacement_history.append(self.color_replacement.copy())
+        self.color_replacement = {source: mapping.get(target, target)
+                                  for source, target in self.color_replacement.items()}
+        for source, target in mapping.items():
+            self.color_replacement.setdefault(source, target)
+        
+        # 一次性重映射网格并更新显示
+        changed = self.image_grid.remap_colors(mapping)
+        self.batch_update_blocks_display(changed)
+        self.update_statistics_display()
+        self.undo_replacement_btn.setEnabled(True)
+        
+        self.status_label.setText(f'颜色数已从 {len(color_statistics)} 减少到 '
+                                  f'{len(self.image_grid.color_statistics())}，修改 {len(changed)} 个色块')
+
     def batch_update_blocks_display(self, blocks_to_update):
         """批量更新色块显示"""
         if not self.image_grid or not blocks_to_update:
@@ -581,17 +1053,14 @@ class ColorMatcher(QMainWindow):
             # 更新显示
             self.processed_image_label.setPixmap(self.image_grid.composite_pixmap)
 
+    @profiled('update_statistics_display')
     def update_statistics_display(self):
         """更新统计区域显示"""
         if not self.image_grid:
             return
             
         # 计算当前的颜色统计
-        color_statistics = {}
-        for block in self.image_grid.blocks.values():
-            color_code = block.color_code
-            if color_code:
-                color_statistics[color_code] = color_statistics.get(color_code, 0) + 1
+        color_statistics = self.image_grid.color_statistics()
         
         # 重新生成背景图像（包含更新的统计）
         base_width = self.image_grid.width * self.block_size + self.axis_size
@@ -782,16 +1251,19 @@ class ColorMatcher(QMainWindow):
             img_y < 0 or img_y >= pixmap_size.height()):
             return
             
+        # 显示缩略图时没有坐标轴和统计区域，直接按比例换算色块索引
+        if self.processed_image_label.overview_active:
+            block_x = img_x * self.image_grid.width // pixmap_size.width()
+            block_y = img_y * self.image_grid.height // pixmap_size.height()
+            self.apply_brush_change(block_x, block_y)
+            return
+            
         # 计算缩放比例
         base_width = self.image_grid.width * self.block_size + self.axis_size
         base_height = self.image_grid.height * self.block_size + self.axis_size
         
         # 计算统计区域所需高度
-        color_statistics = {}
-        for block in self.image_grid.blocks.values():
-            color_code = block.color_code
-            if color_code:
-                color_statistics[color_code] = color_statistics.get(color_code, 0) + 1
+        color_statistics = self.image_grid.color_statistics()
         
         stats_height = self.calculate_stats_height(color_statistics, base_width)
         total_width = base_width
@@ -900,8 +1372,8 @@ class ColorMatcher(QMainWindow):
             new_color_code = change['new_color']
             
             # 计算色块在图片中的位置
-            block_size = 20
-            axis_size = 30
+            block_size = self.block_size
+            axis_size = self.axis_size
             
             start_x = block_x * block_size + axis_size
             start_y = block_y * block_size + axis_size
@@ -946,47 +1418,68 @@ class ColorMatcher(QMainWindow):
 
     def generate_block_pixmap(self, block, color_lookup, show_color_codes=True):
         """生成单个色块的QPixmap"""
-        # 创建色块图像
-        block_img = Image.new('RGB', (self.block_size, self.block_size), 'white')
-        draw = ImageDraw.Draw(block_img)
-        
-        # 获取颜色
-        color_code = block.color_code
-        if color_code in color_lookup:
-            color = tuple(color_lookup[color_code])
-        else:
-            color = (255, 255, 255)  # 默认白色
-            
-        # 填充色块（不绘制边框，因为背景层已有辅助线）
-        draw.rectangle([0, 0, self.block_size-1, self.block_size-1], fill=color)
-        
-        # 绘制色号
-        if show_color_codes and color_code:
-            try:
-                font = ImageFont.truetype("arial.ttf", 8)
-            except:
-                font = ImageFont.load_default()
-            
-            # 计算文字颜色
-            brightness = sum(color) / 3
-            text_color = (255, 255, 255) if brightness < 128 else (0, 0, 0)
-            
-            # 获取文字大小
-            text_bbox = draw.textbbox((0, 0), color_code, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            # 计算文字位置（居中）
-            text_x = (self.block_size - text_width) // 2
-            text_y = (self.block_size - text_height) // 2
-            
-            # 绘制文字
-            draw.text((text_x, text_y), color_code, fill=text_color, font=font)
-        
-        # 转换为QPixmap
-        img_data = block_img.convert("RGBA").tobytes("raw", "RGBA")
-        qimg = QImage(img_data, block_img.width, block_img.height, QImage.Format_RGBA8888)
-        return QPixmap.fromImage(qimg)
+        # 直接绘制为色块贴图数组（与保存图片使用相同的贴图），包装为QPixmap；
+        # 相同色块大小和颜色的色块共用一个QPixmap，切换色块大小后再切换回来无需重新绘制
+        # 不在颜色表中的色号与 build_block_tiles 相同，按白色绘制
+        key = (self.block_size, show_color_codes, block.color_code,
+               tuple(color_lookup.get(block.color_code, (255, 255, 255))))
+        pixmap = self.block_pixmaps.get(key)
+        if pixmap is None:
+            if len(self.block_pixmaps) >= BLOCK_PIXMAP_CACHE_LIMIT:
+                self.block_pixmaps.clear()
+            font, _ = rendering.load_fonts()
+            tile = rendering.build_block_tiles([block.color_code], color_lookup, self.block_size,
+                                               show_color_codes, font)[0]
+            pixmap = self.block_pixmaps[key] = array_to_pixmap(tile)
+            count('pixmaps_generated')
+        return pixmap
+
+    def get_block_tiles(self, codes, show_color_codes):
+        """获取当前色块大小下网格色号的贴图数组（按色块大小、是否显示色号和颜色缓存）"""
+        key = (self.block_size, show_color_codes,
+               tuple((code, tuple(self.color_lookup.get(code, (255, 255, 255)))) for code in codes))
+        tiles = self.block_tiles.get(key)
+        if tiles is None:
+            if len(self.block_tiles) >= BLOCK_TILES_CACHE_LIMIT:
+                self.block_tiles.clear()
+            font, _ = rendering.load_fonts()
+            tiles = self.block_tiles[key] = rendering.build_block_tiles(
+                codes, self.color_lookup, self.block_size, show_color_codes, font)
+        return tiles
+
+    def change_layout_sizes(self):
+        """修改色块大小或坐标轴大小：从现有网格重新排版和渲染（不重新匹配）"""
+        block_size = self.block_size_spin.value()
+        axis_size = self.axis_size_spin.value()
+        if (block_size, axis_size) == (self.block_size, self.axis_size):
+            return
+        self.block_size = block_size
+        self.axis_size = axis_size
+        if not self.image_grid:
+            return
+        start = time.perf_counter()
+        self.image_grid.block_size = block_size
+        self.image_grid.axis_size = axis_size
+        for grid in self.frame_grids:
+            grid.block_size = block_size
+            grid.axis_size = axis_size
+        self.processed_image = None
+        self.update_all_blocks_display()
+        elapsed = (time.perf_counter() - start) * 1000
+        output_width = self.image_grid.width * block_size + axis_size
+        output_height = (self.image_grid.height * block_size + axis_size +
+                         self.calculate_stats_height(self.image_grid.color_statistics(), output_width))
+        self.status_label.setText(f'已重新排版：色块大小 {block_size}, 坐标轴 {axis_size}, '
+                                  f'输出大小: {output_width}x{output_height} ({elapsed:.1f} ms)')
+
+    def sync_layout_sizes(self, block_size, axis_size):
+        """使用网格（如打开的工程）的色块大小和坐标轴大小，更新输入框但不触发重新排版"""
+        self.block_size = block_size
+        self.axis_size = axis_size
+        for spin, value in ((self.block_size_spin, block_size), (self.axis_size_spin, axis_size)):
+            spin.blockSignals(True)
+            spin.setValue(value)
+            spin.blockSignals(False)
 
     def generate_background_pixmap(self, width, height, color_statistics=None):
         """生成背景图像（坐标轴、统计等）"""
@@ -1033,9 +1526,8 @@ class ColorMatcher(QMainWindow):
             self.draw_color_statistics(draw, color_statistics, total_width, total_height, font)
         
         # 转换为QPixmap
-        img_data = bg_img.convert("RGBA").tobytes("raw", "RGBA")
-        qimg = QImage(img_data, bg_img.width, bg_img.height, QImage.Format_RGBA8888)
-        return QPixmap.fromImage(qimg)
+        count('pixmaps_generated')
+        return pil_to_pixmap(bg_img)
 
     def update_single_block_display(self, x, y):
         """更新单个色块的显示"""
@@ -1066,12 +1558,14 @@ class ColorMatcher(QMainWindow):
             return
             
         # 重新生成所有色块的图像
-        for (x, y), block in self.image_grid.blocks.items():
-            block.pixmap = self.generate_block_pixmap(block, self.color_lookup, self.show_color_codes)
+        with span('block_pixmaps'):
+            for (x, y), block in self.image_grid.blocks.items():
+                block.pixmap = self.generate_block_pixmap(block, self.color_lookup, self.show_color_codes)
         
         # 重新合成图像
         self.composite_display_image()
 
+    @profiled('composite_display_image')
     def composite_display_image(self):
         """合成显示图像"""
         if not self.image_grid:
@@ -1082,11 +1576,7 @@ class ColorMatcher(QMainWindow):
         base_height = self.image_grid.height * self.block_size + self.axis_size
         
         # 计算统计区域所需高度
-        color_statistics = {}
-        for block in self.image_grid.blocks.values():
-            color_code = block.color_code
-            if color_code:
-                color_statistics[color_code] = color_statistics.get(color_code, 0) + 1
+        color_statistics = self.image_grid.color_statistics()
         
         stats_height = self.calculate_stats_height(color_statistics, base_width)
         
@@ -1095,8 +1585,9 @@ class ColorMatcher(QMainWindow):
         total_height = base_height + stats_height
         
         # 重新生成背景图像（包含更新的统计）
-        self.image_grid.background_pixmap = self.generate_background_pixmap(
-            self.image_grid.width, self.image_grid.height, color_statistics)
+        with span('background'):
+            self.image_grid.background_pixmap = self.generate_background_pixmap(
+                self.image_grid.width, self.image_grid.height, color_statistics)
         
         composite_pixmap = QPixmap(total_width, total_height)
         composite_pixmap.fill(Qt.white)
@@ -1108,11 +1599,13 @@ class ColorMatcher(QMainWindow):
             painter.drawPixmap(0, 0, self.image_grid.background_pixmap)
         
         # 绘制所有色块
-        for (x, y), block in self.image_grid.blocks.items():
-            if block.pixmap:
-                display_x = x * self.block_size + self.axis_size
-                display_y = y * self.block_size + self.axis_size
-                painter.drawPixmap(display_x, display_y, block.pixmap)
+        with span('paint'):
+            for (x, y), block in self.image_grid.blocks.items():
+                if block.pixmap:
+                    display_x = x * self.block_size + self.axis_size
+                    display_y = y * self.block_size + self.axis_size
+                    painter.drawPixmap(display_x, display_y, block.pixmap)
+            count('cells_rendered', len(self.image_grid.blocks))
         
         painter.end()
         
@@ -1120,99 +1613,221 @@ class ColorMatcher(QMainWindow):
         self.image_grid.composite_pixmap = composite_pixmap
         self.processed_image_label.setPixmap(composite_pixmap)
 
+    @profiled('save_image')
     def save_image(self):
         """保存处理后的图片"""
         if not self.image_grid:
             self.status_label.setText('没有可保存的图片！')
             return
             
+        if self.frame_grids:
+            self.save_animation_frames()
+            return
+            
         # 获取原始文件名和扩展名
         base_name = os.path.splitext(os.path.basename(self.image_path))[0]
-        output_path = f"{base_name}_processed.png"
+        output_format = self.save_format_combo.currentText()
+        compress_level = self.compress_level_combo.currentIndex()
+        output_path = output_path_for(base_name, output_format)
+        
+        # 超大图片渲染到磁盘上的内存映射画布，流式编码为PNG，不在内存中合成完整图片
+        width, height = rendering.output_size(self.image_grid)
+        if width * height > rendering.MAPPED_RENDER_PIXELS:
+            self.save_image_mapped(base_name, output_format, compress_level)
+            return
         
         # 从网格数据合成完整图片
-        self.composite_full_image()
+        with span('render'):
+            self.composite_full_image()
+        
+        # 后台保存（合成的图片不再被修改，可直接交给保存线程）
+        if self.background_save_checkbox.isChecked():
+            thread = ImageSaveThread(self.processed_image, output_path, output_format, compress_level)
+            thread.saved.connect(self.on_image_saved)
+            thread.failed.connect(lambda error: self.status_label.setText(f'保存图片失败: {error}'))
+            thread.finished.connect(lambda: self.save_threads.remove(thread))
+            self.save_threads.append(thread)
+            thread.start()
+            self.status_label.setText(f'正在后台保存: {output_path}')
+            return
         
         # 保存图片
-        self.processed_image.save(output_path)
-        self.status_label.setText(f'图片已保存为: {output_path}')
+        start = time.perf_counter()
+        with span('encode'):
+            used_format = save_output_image(self.processed_image, output_path, output_format, compress_level)
+        self.on_image_saved(output_path, output_format, used_format, time.perf_counter() - start)
+
+    def on_image_saved(self, output_path, output_format, used_format, elapsed):
+        """图片保存完成后更新状态"""
+        status = f'图片已保存为: {output_path} ({elapsed:.2f} s)'
+        if used_format != output_format:
+            status += f'，颜色数超过256，已按{used_format}保存'
+        self.status_label.setText(status)
+
+    def save_image_mapped(self, base_name, output_format, compress_level):
+        """渲染到磁盘上的内存映射画布并按PNG保存（网格和颜色表的副本交给渲染，编辑不影响正在保存的图片）"""
+        output_path = output_path_for(base_name, OUTPUT_PNG)
+        grid = self.image_grid
+        snapshot = ImageGrid(grid.width, grid.height, grid.block_size, grid.axis_size, grid.codes)
+        snapshot.indices = grid.indices.copy()
+        tiles = self.get_block_tiles(grid.codes, self.show_color_codes)
+        thread = MappedImageSaveThread(snapshot, dict(self.color_lookup), self.show_color_codes, tiles,
+                                       output_path, output_format, compress_level)
+        thread.saved.connect(self.on_mapped_image_saved)
+        thread.failed.connect(lambda error: self.status_label.setText(f'保存图片失败: {error}'))
+        if not self.background_save_checkbox.isChecked():
+            with span('render'):
+                thread.run()
+            return
+        thread.finished.connect(lambda: self.save_threads.remove(thread))
+        self.save_threads.append(thread)
+        thread.start()
+        width, height = rendering.output_size(snapshot)
+        self.status_label.setText(f'图片较大（{width}x{height}），正在后台通过磁盘画布渲染并保存: {output_path}')
+
+    def on_mapped_image_saved(self, output_path, output_format, used_format, elapsed):
+        """磁盘画布渲染保存完成后更新状态"""
+        status = f'图片已通过磁盘画布渲染保存为: {output_path} ({elapsed:.2f} s)'
+        if used_format != output_format:
+            status += f'，超大图片只支持流式写出{used_format}'
+        self.status_label.setText(status)
+
+    def closeEvent(self, event):
+        """关闭窗口前等待后台保存完成"""
+        for thread in list(self.save_threads):
+            thread.wait()
+        super().closeEvent(event)
 
     def composite_full_image(self):
         """从网格数据合成完整图片"""
         if not self.image_grid:
             return
             
-        # 计算基础尺寸（不包含统计区域）
-        base_width = self.image_grid.width * self.block_size + self.axis_size
-        base_height = self.image_grid.height * self.block_size + self.axis_size
-        
-        # 生成色号统计
-        color_statistics = {}
-        for block in self.image_grid.blocks.values():
-            color_code = block.color_code
-            if color_code:
-                color_statistics[color_code] = color_statistics.get(color_code, 0) + 1
-        
-        # 计算统计区域所需高度
-        stats_height = self.calculate_stats_height(color_statistics, base_width)
-        
-        # 计算总尺寸
-        total_width = base_width
-        total_height = base_height + stats_height
-        
-        # 创建完整图片
-        full_image = Image.new('RGB', (total_width, total_height), 'white')
-        draw = ImageDraw.Draw(full_image)
-        
-        # 尝试加载字体
+        # 更新处理后的图片
+        tiles = self.get_block_tiles(self.image_grid.codes, self.show_color_codes)
+        self.processed_image = rendering.render_full_image_parallel(
+            self.image_grid, self.color_lookup, self.show_color_codes, tiles=tiles)
+
+    def composite_thumbnail_image(self, scale=1):
+        """从网格数据生成缩略图（每个色块 scale×scale 像素，无坐标轴和色号），返回数组"""
+        if not self.image_grid:
+            return None
+        with span('thumbnail'):
+            return rendering.render_thumbnail(self.image_grid, self.color_lookup, scale)
+
+    def overview_pixmap(self):
+        """缩小查看时显示的缩略图QPixmap（每个色块一个像素）"""
+        thumbnail = self.composite_thumbnail_image()
+        if thumbnail is None:
+            return None
+        count('pixmaps_generated')
+        return array_to_pixmap(thumbnail)
+
+    def save_project(self):
+        """保存工程文件（网格索引、替换映射和画笔记录）"""
+        if not self.image_grid:
+            self.status_label.setText('没有可保存的工程！')
+            return
+            
+        base_name = os.path.splitext(os.path.basename(self.image_path))[0]
+        file_name, _ = QFileDialog.getSaveFileName(self, "保存工程", f"{base_name}{PROJECT_EXTENSION}",
+                                                   f"工程文件 (*{PROJECT_EXTENSION})")
+        if not file_name:
+            return
+            
         try:
-            font = ImageFont.truetype("arial.ttf", 8)
-            axis_font = ImageFont.truetype("arial.ttf", 10)
-        except:
-            font = ImageFont.load_default()
-            axis_font = ImageFont.load_default()
-        
-        # 绘制坐标轴
-        self.draw_coordinate_axes(draw, self.image_grid.width, self.image_grid.height, 
-                                self.block_size, self.axis_size, axis_font)
-        
-        # 绘制所有色块
-        for (x, y), block in self.image_grid.blocks.items():
-            # 计算色块位置
-            start_x = x * self.block_size + self.axis_size
-            start_y = y * self.block_size + self.axis_size
-            end_x = start_x + self.block_size
-            end_y = start_y + self.block_size
-            
-            # 获取颜色
-            color_code = block.color_code
-            if color_code in self.color_lookup:
-                color = tuple(self.color_lookup[color_code])
-            else:
-                color = (255, 255, 255)
+            start = time.perf_counter()
+            save_project(file_name, self.image_grid, self.current_source,
+                         self.color_replacement, self.replacement_history, self.brush_changes,
+                         image_path=self.image_path, show_color_codes=self.show_color_codes)
+            elapsed = (time.perf_counter() - start) * 1000
+            self.status_label.setText(f'工程已保存为: {file_name} ({elapsed:.1f} ms)')
+        except Exception as e:
+            self.status_label.setText(f'保存工程失败: {str(e)}')
+
+    def export_pattern_data(self):
+        """导出色号图和用料清单（JSON/CSV/二进制），直接从网格数据生成"""
+        if not self.image_grid:
+            self.status_label.setText('没有可导出的图案！')
+            return
             
-            # 填充色块
-            draw.rectangle([start_x, start_y, end_x - 1, end_y - 1], fill=color)
+        base_name = os.path.splitext(os.path.basename(self.image_path))[0]
+        filters = ';;'.join(f'{name} (*{ext})' for ext, name in EXPORT_FORMATS.items())
+        file_name, _ = QFileDialog.getSaveFileName(self, "导出数据", f"{base_name}.json", filters)
+        if not file_name:
+            return
             
-            # 绘制色号
-            if self.show_color_codes and color_code:
-                brightness = sum(color) / 3
-                text_color = (255, 255, 255) if brightness < 128 else (0, 0, 0)
+        try:
+            written = export_pattern(self.image_grid, file_name, self.color_lookup, self.current_source)
+            self.status_label.setText(f'数据已导出: {", ".join(written)}')
+        except Exception as e:
+            self.status_label.setText(f'导出失败: {str(e)}')
+
+    def open_project(self):
+        """打开工程文件，恢复编辑会话（无需重新匹配颜色）"""
+        file_name, _ = QFileDialog.getOpenFileName(self, "打开工程", "",
+                                                   f"工程文件 (*{PROJECT_EXTENSION})")
+        if not file_name:
+            return
+            
+        try:
+            start = time.perf_counter()
+            project = load_project(file_name)
+            
+            source_name = project['source']
+            if source_name not in self.color_sources:
+                self.status_label.setText(f'工程使用的颜色源 {source_name} 不存在！')
+                return
                 
-                text_bbox = draw.textbbox((0, 0), color_code, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
+            # 修改任何状态之前检查颜色源中是否包含工程用到的所有色号
+            color_lookup = load_palette(self.color_sources[source_name], source_name).color_lookup()
+            missing_codes = sorted(code for code in referenced_codes(project) if code not in color_lookup)
+            if missing_codes:
+                self.status_label.setText(f'颜色源 {source_name} 中缺少工程使用的色号: '
+                                          f'{", ".join(missing_codes)}，无法打开工程')
+                return
                 
-                text_x = start_x + (self.block_size - text_width) // 2
-                text_y = start_y + (self.block_size - text_height) // 2
+            # 切换颜色源（会清空当前的编辑状态）
+            if source_name != self.current_source:
+                self.source_radios[source_name].setChecked(True)
                 
-                draw.text((text_x, text_y), color_code, fill=text_color, font=font)
-        
-        # 绘制色号统计
-        self.draw_color_statistics(draw, color_statistics, total_width, total_height, axis_font)
-        
-        # 更新处理后的图片
-        self.processed_image = full_image
+            # 恢复编辑状态
+            self.color_replacement = project['color_replacement']
+            self.replacement_history = project['replacement_history']
+            self.undo_replacement_btn.setEnabled(bool(self.replacement_history))
+            self.brush_changes = project['brush_changes']
+            self.undo_brush_btn.setEnabled(bool(self.brush_changes))
+            
+            self.show_color_codes = project['show_color_codes']
+            self.show_codes_btn.setText('隐藏色号' if self.show_color_codes else '显示色号')
+            
+            # 恢复原始图片（若仍存在）
+            image_path = project['image_path']
+            if image_path and os.path.exists(image_path):
+                self.image_path = image_path
+                self.show_original_image(image_path)
+                self.process_btn.setEnabled(True)
+            else:
+                self.image_path = file_name
+                
+            # 恢复网格并重新生成显示
+            self.image_grid = project['grid']
+            self.clear_frames()
+            self.sync_layout_sizes(self.image_grid.block_size, self.image_grid.axis_size)
+            self.processed_image = None
+            self.update_all_blocks_display()
+            
+            self.save_btn.setEnabled(True)
+            self.save_project_btn.setEnabled(True)
+            self.export_btn.setEnabled(True)
+            self.board_save_btn.setEnabled(True)
+            
+            elapsed = (time.perf_counter() - start) * 1000
+            status = (f'工程已加载: {file_name}, 网格大小: {self.image_grid.width}x{self.image_grid.height} '
+                      f'({elapsed:.1f} ms)')
+            self.status_label.setText(status)
+        except Exception as e:
+            self.status_label.setText(f'打开工程失败: {str(e)}')
 
     def update_display(self):
         """更新显示（不重新处理图片）"""
@@ -1238,9 +1853,7 @@ class ColorMatcher(QMainWindow):
         self.original_image_label.setPixmap(scaled_original)
         
         # 将PIL图片转换为QPixmap用于显示
-        img_data = self.processed_image.convert("RGBA").tobytes("raw", "RGBA")
-        qimg = QImage(img_data, self.processed_image.width, self.processed_image.height, QImage.Format_RGBA8888)
-        processed_pixmap = QPixmap.fromImage(qimg)
+        processed_pixmap = pil_to_pixmap(self.processed_image)
         
         scaled_processed = processed_pixmap.scaled(display_width, display_height, 
                                                  Qt.KeepAspectRatio,
@@ -1249,489 +1862,399 @@ class ColorMatcher(QMainWindow):
 
     def load_image(self):
         file_name, _ = QFileDialog.getOpenFileName(self, "选择图片", "", 
-                                                 "Image Files (*.png *.jpg *.bmp)")
+                                                 "Image Files (*.png *.jpg *.bmp *.gif *.webp)")
         if file_name:
             self.image_path = file_name
-            pixmap = QPixmap(file_name)
-            
-            # 计算适合左侧区域的缩放尺寸
-            label_width = int(self.width() * 0.3)
-            scaled_pixmap = pixmap.scaled(label_width, self.height() * 0.8, 
-                                        Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.original_image_label.setPixmap(scaled_pixmap)
+            self.show_original_image(file_name)
             self.process_btn.setEnabled(True)
 
+    def show_original_image(self, file_name):
+        """在左侧区域显示原始图片"""
+        pixmap = QPixmap(file_name)
+        
+        # 计算适合左侧区域的缩放尺寸
+        label_width = int(self.width() * 0.3)
+        scaled_pixmap = pixmap.scaled(label_width, int(self.height() * 0.8), 
+                                    Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.original_image_label.setPixmap(scaled_pixmap)
+
     def rgb_to_lab(self, rgb):
         """将RGB颜色转换为LAB色彩空间"""
-        # 首先转换到XYZ空间
-        r, g, b = rgb[0] / 255.0, rgb[1] / 255.0, rgb[2] / 255.0
-        
-        # sRGB到XYZ的转换
-        def to_linear(c):
-            if c <= 0.04045:
-                return c / 12.92
-            return ((c + 0.055) / 1.055) ** 2.4
-        
-        r, g, b = to_linear(r), to_linear(g), to_linear(b)
-        
-        x = r * 0.4124 + g * 0.3576 + b * 0.1805
-        y = r * 0.2126 + g * 0.7152 + b * 0.0722
-        z = r * 0.0193 + g * 0.1192 + b * 0.9505
-        
-        # XYZ到LAB的转换
-        def f(t):
-            if t > (6.0/29.0)**3:
-                return t**(1.0/3.0)
-            return (1.0/3.0) * ((29.0/6.0)**2) * t + 4.0/29.0
-        
-        xn, yn, zn = 0.95047, 1.0, 1.08883
-        
-        l = 116.0 * f(y/yn) - 16.0
-        a = 500.0 * (f(x/xn) - f(y/yn))
-        b = 200.0 * (f(y/yn) - f(z/zn))
-        
-        return np.array([l, a, b])
+        return rgb_to_lab_array(rgb)
 
     def rgb_to_hsv(self, rgb):
         """将RGB颜色转换为HSV色彩空间"""
-        r, g, b = rgb[0] / 255.0, rgb[1] / 255.0, rgb[2] / 255.0
-        max_val = max(r, g, b)
-        min_val = min(r, g, b)
-        diff = max_val - min_val
-        
-        # 计算色相 H
-        if diff == 0:
-            h = 0
-        elif max_val == r:
-            h = 60 * ((g - b) / diff % 6)
-        elif max_val == g:
-            h = 60 * ((b - r) / diff + 2)
-        else:
-            h = 60 * ((r - g) / diff + 4)
-        
-        # 计算饱和度 S
-        s = 0 if max_val == 0 else diff / max_val
-        
-        # 计算明度 V
-        v = max_val
-        
-        return np.array([h, s, v])
+        return rgb_to_hsv_array(rgb)
 
     def find_closest_color_rgb(self, target_rgb):
         """使用简单的RGB欧氏距离"""
-        min_distance = float('inf')
-        closest_code = None
-        target_rgb = np.array(target_rgb)
-        
-        for code, rgb in self.color_lookup.items():
-            distance = np.sum((target_rgb - rgb) ** 2)
-            if distance < min_distance:
-                min_distance = distance
-                closest_code = code
-                
-        return closest_code
+        return closest_color_rgb(self.palette, target_rgb)
 
     def find_closest_color_lab(self, target_rgb):
         """使用LAB色彩空间的颜色匹配"""
-        min_distance = float('inf')
-        closest_code = None
-        target_lab = self.rgb_to_lab(target_rgb)
-        
-        for code, rgb in self.color_lookup.items():
-            lab = self.rgb_to_lab(rgb)
-            # LAB空间中的欧氏距离
-            distance = np.sum((target_lab - lab) ** 2)
-            if distance < min_distance:
-                min_distance = distance
-                closest_code = code
-        
-        return closest_code
+        return closest_color_lab(self.palette, target_rgb)
 
     def find_closest_color_hsv_weighted(self, target_rgb):
         """使用HSV色彩空间的加权颜色匹配"""
-        min_distance = float('inf')
-        closest_code = None
-        target_hsv = self.rgb_to_hsv(target_rgb)
-        
-        # 权重设置：色相的权重更大，以更好地保持颜色的基本特征
-        weights = np.array([2.0, 1.0, 0.8])  # H权重大，S次之，V最小
-        
-        for code, rgb in self.color_lookup.items():
-            hsv = self.rgb_to_hsv(rgb)
-            
-            # 色相差异需要特殊处理（因为是环形的）
-            h_diff = min(abs(target_hsv[0] - hsv[0]), 360 - abs(target_hsv[0] - hsv[0])) / 180.0
-            sv_diff = target_hsv[1:] - hsv[1:]
-            
-            # 计算加权距离
-            distance = weights[0] * h_diff**2 + np.sum(weights[1:] * sv_diff**2)
-            
-            if distance < min_distance:
-                min_distance = distance
-                closest_code = code
-        
-        return closest_code
+        return closest_color_hsv_weighted(self.palette, target_rgb)
+
+    def find_closest_color_cie94(self, target_rgb):
+        """使用CIE94色差公式的颜色匹配"""
+        return closest_color_cie94(self.palette, target_rgb)
+
+    def find_closest_color_ciede2000(self, target_rgb):
+        """使用CIEDE2000色差公式的颜色匹配"""
+        return closest_color_ciede2000(self.palette, target_rgb)
 
+    @profiled('process_image')
     def process_image(self):
-        try:
-            # 打开图片并保持原始模式（可能是RGBA）
-            img = Image.open(self.image_path)
-            
-            # 获取原始文件名和扩展名
-            base_name = os.path.splitext(os.path.basename(self.image_path))[0]
-            output_path = f"{base_name}_processed.png"
-            
-            # 获取原始图片尺寸
-            width, height = img.size
-            
-            # 转换为numpy数组以便处理
-            img_array = np.array(img)
-            
-            # 分析透明区域，找出需要删除的行和列
-            transparent_rows = []
-            transparent_cols = []
-            
-            # 检查每一行是否全透明
-            for y in range(height):
-                row_transparent = True
-                for x in range(width):
-                    pixel_color = img_array[y][x]
-                    if len(pixel_color) == 4:  # RGBA模式
-                        if pixel_color[3] > 0:  # 不是完全透明
-                            row_transparent = False
-                            break
-                    elif len(pixel_color) == 3:  # RGB模式
-                        if not all(c >= 250 for c in pixel_color):  # 不是接近白色
-                            row_transparent = False
-                            break
-                if row_transparent:
-                    transparent_rows.append(y)
-            
-            # 检查每一列是否全透明
-            for x in range(width):
-                col_transparent = True
-                for y in range(height):
-                    pixel_color = img_array[y][x]
-                    if len(pixel_color) == 4:  # RGBA模式
-                        if pixel_color[3] > 0:  # 不是完全透明
-                            col_transparent = False
-                            break
-                    elif len(pixel_color) == 3:  # RGB模式
-                        if not all(c >= 250 for c in pixel_color):  # 不是接近白色
-                            col_transparent = False
-                            break
-                if col_transparent:
-                    transparent_cols.append(x)
-            
-            # 创建新的图片数组，删除透明行列
-            new_height = height - len(transparent_rows)
-            new_width = width - len(transparent_cols)
-            
-            if new_height <= 0 or new_width <= 0:
-                self.status_label.setText('图片完全透明，无法处理！')
-                return
-            
-            # 计算实际输出图片的大小
-            block_size = 20  # 每个像素扩大成20x20的方格
-            cell_size = block_size  # 每个单元格的大小（去掉边框）
-            
-            # 坐标轴区域大小
-            axis_size = 30  # 坐标轴区域的高度和宽度
-            
-            # 色号统计区域大小
-            stats_height = 80  # 统计区域高度
-            stats_margin = 20  # 统计区域与横坐标的间距
-            
-            # 创建新图片（考虑坐标轴和统计区域）
-            output_width = new_width * cell_size + axis_size  # 加上坐标轴区域
-            output_height = new_height * cell_size + axis_size + stats_margin + stats_height  # 加上坐标轴区域、间距和统计区域
-            new_img = Image.new('RGB', (output_width, output_height), 'white')  # 改为白色背景
-            draw = ImageDraw.Draw(new_img)
-            
-            # 尝试加载字体，如果失败则使用默认字体
-            try:
-                font = ImageFont.truetype("arial.ttf", 8)  # 减小字体大小以适应20x20的方格
-                axis_font = ImageFont.truetype("arial.ttf", 10)  # 坐标轴字体稍大
-            except:
-                font = ImageFont.load_default()
-                axis_font = ImageFont.load_default()
-            
-            result_codes = []
-            color_statistics = {}  # 用于统计色号数量
+        if self.is_animated_image(self.image_path):
+            self.process_animation()
+            return
+        if self.streaming_checkbox.isChecked():
+            self.process_image_streaming()
+            return
             
-            # 获取当前选择的匹配方法
+        try:
             current_method = self.method_combo.currentText()
-            matching_function = self.matching_methods[current_method]
-            
-            # 处理每个非透明像素点
-            new_y = 0
-            for y in range(height):
-                if y in transparent_rows:
-                    continue
-                    
-                row_codes = []
-                new_x = 0
-                for x in range(width):
-                    if x in transparent_cols:
-                        continue
-                        
-                    # 获取当前像素的颜色
-                    pixel_color = img_array[y][x]
-                    
-                    # 检查是否为透明色（RGBA模式下的A通道为0，或RGB模式下为白色/透明）
-                    is_transparent = False
-                    if len(pixel_color) == 4:  # RGBA模式
-                        if pixel_color[3] == 0:  # 完全透明
-                            is_transparent = True
-                    elif len(pixel_color) == 3:  # RGB模式
-                        # 检查是否为白色或接近白色（可能是透明背景）
-                        if all(c >= 250 for c in pixel_color):
-                            is_transparent = True
-                    
-                    if is_transparent:
-                        # 透明像素，跳过绘制色块，但绘制灰色分隔线
-                        row_codes.append(None)
-                        
-                        # 计算新图片中的位置（考虑坐标轴）
-                        block_x = new_x * cell_size + axis_size
-                        block_y = new_y * cell_size + axis_size
-                        
-                        # 绘制灰色分隔线（只在右边和下边绘制，避免重复）
-                        # 右边分隔线
-                        if new_x < new_width - 1:  # 不是最后一列
-                            draw.line([(block_x + block_size, block_y), 
-                                     (block_x + block_size, block_y + block_size)], 
-                                    fill=(200, 200, 200), width=1)
-                        
-                        # 下边分隔线
-                        if new_y < new_height - 1:  # 不是最后一行
-                            draw.line([(block_x, block_y + block_size), 
-                                     (block_x + block_size, block_y + block_size)], 
-                                    fill=(200, 200, 200), width=1)
-                        
-                        new_x += 1
-                        continue
-                    
-                    # 使用选定的方法找到最接近的颜色
-                    color_code = matching_function(pixel_color[:3])  # 只取RGB部分
-                    
-                    # 应用颜色替换
-                    color_code = self.get_replaced_color(color_code)
-                    
-                    row_codes.append(color_code)
-                    
-                    # 统计色号数量（使用替换后的颜色）
-                    if color_code not in color_statistics:
-                        color_statistics[color_code] = 0
-                    color_statistics[color_code] += 1
-                    
-                    # 计算新图片中的位置（考虑坐标轴）
-                    block_x = new_x * cell_size + axis_size
-                    block_y = new_y * cell_size + axis_size  # 恢复原始排列
-                    
-                    # 在新图片中填充色块
-                    matched_color = tuple(self.color_lookup[color_code])
-                    draw.rectangle([block_x, block_y, 
-                                  block_x + block_size - 1, 
-                                  block_y + block_size - 1], 
-                                 fill=matched_color)  # 去掉边框
-                    
-                    # 绘制灰色分隔线（只在右边和下边绘制，避免重复）
-                    # 右边分隔线
-                    if new_x < new_width - 1:  # 不是最后一列
-                        draw.line([(block_x + block_size, block_y), 
-                                 (block_x + block_size, block_y + block_size)], 
-                                fill=(200, 200, 200), width=1)
-                    
-                    # 下边分隔线
-                    if new_y < new_height - 1:  # 不是最后一行
-                        draw.line([(block_x, block_y + block_size), 
-                                 (block_x + block_size, block_y + block_size)], 
-                                fill=(200, 200, 200), width=1)
-                    
-                    # 只在启用色号显示时绘制文字
-                    if self.show_color_codes:
-                        # 计算文字颜色（深色背景用白色文字，浅色背景用黑色文字）
-                        brightness = sum(matched_color) / 3
-                        text_color = (255, 255, 255) if brightness < 128 else (0, 0, 0)
-                        
-                        # 获取文字大小
-                        text_bbox = draw.textbbox((0, 0), color_code, font=font)
-                        text_width = text_bbox[2] - text_bbox[0]
-                        text_height = text_bbox[3] - text_bbox[1]
-                        
-                        # 计算文字位置（居中）
-                        text_x = block_x + (block_size - text_width) // 2
-                        text_y = block_y + (block_size - text_height) // 2
-                        
-                        # 绘制文字
-                        draw.text((text_x, text_y), color_code, 
-                                fill=text_color, font=font)
-                        
-                        new_x += 1
-                            
-                result_codes.append(row_codes)
-                new_y += 1
-            
-            # 绘制坐标轴
-            self.draw_coordinate_axes(draw, new_width, new_height, cell_size, axis_size, axis_font)
-            
-            # 绘制色号统计
-            self.draw_color_statistics(draw, color_statistics, output_width, output_height, axis_font)
+            dither = self.dither_combo.currentText()
+            target_size = self.get_target_grid_size()
+            resample = self.resample_combo.currentText()
+            background = self.get_background_detector()
+            codes = list(self.color_lookup.keys())
+            
+            # 相同图片和匹配选项的结果直接从缓存读取（跳过裁剪、缩小和匹配）
+            cache_key = None
+            entry = None
+            if self.result_cache_checkbox.isChecked():
+                with span('cache'):
+                    cache_key = result_key(file_digest(self.image_path), self.palette, current_method,
+                                           match_options(dither, target_size, resample, self.color_replacement,
+                                                         background))
+                    entry = self.result_cache.get(cache_key)
+            
+            if entry is not None:
+                indices = entry['indices']
+                width, height = entry['info']['original_size']
+                new_width, new_height = entry['info']['trimmed_size']
+                grid_height, grid_width = indices.shape
+                quality_summary = entry['info'].get('quality')
+            else:
+                # 打开图片并转换为像素数组（保持原始模式，可能是RGBA）
+                with span('load'):
+                    img = Image.open(self.image_path)
+                    width, height = img.size
+                    img_array = load_source_pixels(img)
+                
+                # 计算背景掩码（裁剪、缩小和匹配共用），删除全部为背景的行和列
+                with span('trim'):
+                    mask = background.mask(img_array)
+                    trimmed, keep_rows, keep_cols = trim_transparent(img_array, mask)
+                    mask = mask[keep_rows][:, keep_cols]
+                new_height, new_width = trimmed.shape[:2]
+                
+                if new_height <= 0 or new_width <= 0:
+                    self.status_label.setText('图片完全透明，无法处理！')
+                    return
+                
+                # 缩小到目标网格尺寸
+                grid_width, grid_height = fit_grid_size(new_width, new_height, *target_size)
+                with span('resample'):
+                    trimmed, mask = downscale_masked(trimmed, mask, grid_width, grid_height, resample)
+                
+                # 使用选定的方法和抖动模式匹配颜色（不抖动时每种颜色只匹配一次），并应用颜色替换
+                quality = MatchQuality() if self.quality_checkbox.isChecked() else None
+                matcher = create_matcher(self.palette, current_method, codes, self.color_replacement, dither,
+                                         quality=quality)
+                with span('match'):
+                    indices = matcher.match(trimmed, mask)
+                quality_summary = quality.summary() if quality is not None and quality.pixels else None
             
             # 创建图片网格管理器
-            self.image_grid = ImageGrid(new_width, new_height, self.block_size, self.axis_size)
+            with span('grid'):
+                self.image_grid = build_grid(indices, codes, self.block_size, self.axis_size)
+            self.clear_frames()
             self.image_grid.show_color_codes = self.show_color_codes
             
-            # 添加所有色块到网格
-            for new_y in range(new_height):
-                for new_x in range(new_width):
-                    if result_codes[new_y][new_x] is not None:  # 非透明色块
-                        color_code = result_codes[new_y][new_x]
-                        self.image_grid.add_block(new_x, new_y, color_code, color_code)
-            
-            # 生成背景图像
-            self.image_grid.background_pixmap = self.generate_background_pixmap(new_width, new_height, color_statistics)
-            
             # 生成所有色块图像并合成显示
             self.update_all_blocks_display()
             
-            # 存储处理后的图片（用于保存）
-            self.processed_image = new_img
+            # 保存时从网格数据重新合成完整图片
+            self.processed_image = None
             
             # 启用保存按钮
             self.save_btn.setEnabled(True)
+            self.save_project_btn.setEnabled(True)
+            self.export_btn.setEnabled(True)
+            self.board_save_btn.setEnabled(True)
             
             # 更新状态信息
-            removed_rows = len(transparent_rows)
-            removed_cols = len(transparent_cols)
-            self.status_label.setText(
-                f'图片处理完成！原始大小: {width}x{height}, 处理后大小: {new_width}x{new_height}, '
-                f'删除透明行: {removed_rows}, 删除透明列: {removed_cols}, '
-                f'输出大小: {output_width}x{output_height}')
+            color_statistics = self.image_grid.color_statistics()
+            if cache_key is not None and entry is None:
+                with span('cache'):
+                    self.result_cache.put(cache_key, indices, codes, color_statistics,
+                                          result_info((width, height), (new_width, new_height), quality_summary))
+            output_width = grid_width * self.block_size + self.axis_size
+            output_height = (grid_height * self.block_size + self.axis_size +
+                             self.calculate_stats_height(color_statistics, output_width))
+            removed_rows = height - new_height
+            removed_cols = width - new_width
+            status = (f'图片处理完成！原始大小: {width}x{height}, 处理后大小: {new_width}x{new_height}, '
+                      f'删除透明行: {removed_rows}, 删除透明列: {removed_cols}, ')
+            if (grid_width, grid_height) != (new_width, new_height):
+                status += f'网格大小: {grid_width}x{grid_height}, '
+            status += f'输出大小: {output_width}x{output_height}'
+            if entry is not None:
+                status += '（使用缓存的匹配结果）'
+            if quality_summary and self.quality_checkbox.isChecked():
+                status += f'\n匹配质量: {format_quality(quality_summary)}'
+            self.status_label.setText(status)
             
         except Exception as e:
             self.status_label.setText(f'处理出错: {str(e)}')
 
-    def draw_coordinate_axes(self, draw, width, height, cell_size, axis_size, font):
-        """绘制坐标轴"""
-        # 绘制X轴刻度（列号）- 显示全部数字，横坐标在图片下面
-        for x in range(width):
-            tick_x = x * cell_size + axis_size + cell_size // 2
-            tick_y = height * cell_size + axis_size + 10  # X轴标签位置在图片下面
-            
-            # 绘制刻度标签
-            label = str(x + 1)  # 从1开始编号
-            text_bbox = draw.textbbox((0, 0), label, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_x = tick_x - text_width // 2
-            text_y = tick_y
-            draw.text((text_x, text_y), label, fill='black', font=font)
-        
-        # 绘制Y轴刻度（行号）- 显示全部数字，原点在左下角
-        for y in range(height):
-            tick_x = axis_size - 10  # Y轴标签位置
-            tick_y = y * cell_size + axis_size + cell_size // 2  # 保持原始排列，但原点在左下角
-            
-            # 绘制刻度标签（从下往上编号）
-            label = str(height - y)  # 从下往上编号
-            text_bbox = draw.textbbox((0, 0), label, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_x = tick_x - text_width - 5
-            text_y = tick_y - 5
-            draw.text((text_x, text_y), label, fill='black', font=font)
+    def get_background_detector(self):
+        """读取背景检测设置，背景色格式错误时抛出 ValueError"""
+        return BackgroundDetector(self.alpha_threshold_spin.value(), self.background_tolerance_spin.value(),
+                                  parse_color(self.background_color_input.text()),
+                                  self.edge_connected_checkbox.isChecked())
 
-    def draw_color_statistics(self, draw, color_statistics, output_width, output_height, font):
-        """绘制色号统计"""
-        if not color_statistics:
+    def is_animated_image(self, path):
+        """图片是否包含多帧（GIF / APNG 动画）"""
+        try:
+            with Image.open(path) as img:
+                return animation.is_animated(img)
+        except OSError:
+            return False
+
+    @profiled('process_animation')
+    def process_animation(self):
+        """处理多帧图片：统一裁剪，所有帧的颜色只匹配一次，每帧生成一个网格"""
+        try:
+            quality = MatchQuality() if self.quality_checkbox.isChecked() else None
+            with Image.open(self.image_path) as img:
+                result = animation.process_animation(
+                    img, self.palette, self.method_combo.currentText(), list(self.color_lookup.keys()),
+                    self.color_replacement, self.dither_combo.currentText(), self.get_target_grid_size(),
+                    self.resample_combo.currentText(), self.block_size, self.axis_size, quality,
+                    background=self.get_background_detector())
+        except Exception as e:
+            self.status_label.setText(f'处理出错: {str(e)}')
             return
             
-        # 计算统计区域所需的高度
-        stats_height = self.calculate_stats_height(color_statistics, output_width)
-        
-        # 统计区域位置（图片底部，增加间距避免覆盖横坐标）
-        # 增加额外的顶部间距，避免与坐标轴重叠
-        stats_start_y = output_height - stats_height + 20  # 额外增加20像素间距
+        self.frame_grids = result['grids']
+        for grid in self.frame_grids:
+            grid.show_color_codes = self.show_color_codes
+        self.current_frame = 0
+        self.frame_spin.blockSignals(True)
+        self.frame_spin.setRange(1, len(self.frame_grids))
+        self.frame_spin.setValue(1)
+        self.frame_spin.blockSignals(False)
+        self.frame_label.setVisible(True)
+        self.frame_spin.setVisible(True)
+        
+        self.image_grid = self.frame_grids[0]
+        self.update_all_blocks_display()
+        self.processed_image = None
+        self.save_btn.setEnabled(True)
+        self.save_project_btn.setEnabled(True)
+        self.export_btn.setEnabled(True)
+        self.board_save_btn.setEnabled(True)
+        
+        width, height = result['original_size']
+        new_width, new_height = result['trimmed_size']
+        grid_width, grid_height = result['grid_size']
+        color_statistics = result['color_statistics']
+        status = (f'动画处理完成！共 {result["frame_count"]} 帧, 原始大小: {width}x{height}, '
+                  f'处理后大小: {new_width}x{new_height}, ')
+        if (grid_width, grid_height) != (new_width, new_height):
+            status += f'网格大小: {grid_width}x{grid_height}, '
+        status += f'所有帧合计 {len(color_statistics)} 种颜色、{sum(color_statistics.values())} 个色块'
+        if quality is not None and quality.pixels:
+            status += f'\n匹配质量: {format_quality(quality.summary())}'
+        self.status_label.setText(status)
+
+    def show_frame(self, number):
+        """切换显示的帧（画笔等编辑只作用于当前帧）"""
+        if not self.frame_grids or number - 1 == self.current_frame:
+            return
+        self.frame_grids[self.current_frame] = self.image_grid  # 当前帧可能已被转换颜色源等替换
+        self.current_frame = number - 1
+        self.image_grid = self.frame_grids[self.current_frame]
+        self.image_grid.block_size = self.block_size
+        self.image_grid.axis_size = self.axis_size
+        self.image_grid.show_color_codes = self.show_color_codes
+        
+        # 画笔撤销记录只对应切换前的帧
+        self.brush_changes.clear()
+        self.undo_brush_btn.setEnabled(False)
         
-        # 计算每个统计项的显示
-        sorted_colors = sorted(color_statistics.items(), key=lambda x: x[1], reverse=True)
+        self.processed_image = None
+        self.update_all_blocks_display()
+        statistics = self.image_grid.color_statistics()
+        self.status_label.setText(f'第 {number}/{len(self.frame_grids)} 帧: {len(statistics)} 种颜色、'
+                                  f'{sum(statistics.values())} 个色块')
+
+    def clear_frames(self):
+        """清除多帧图片的帧网格，隐藏帧选择"""
+        self.frame_grids = []
+        self.current_frame = 0
+        self.frame_label.setVisible(False)
+        self.frame_spin.setVisible(False)
+
+    def save_animation_frames(self):
+        """并行渲染并保存多帧图片的每一帧"""
+        self.frame_grids[self.current_frame] = self.image_grid
+        base_name = os.path.splitext(os.path.basename(self.image_path))[0]
+        output_format = self.save_format_combo.currentText()
+        start = time.perf_counter()
+        try:
+            with span('render'):
+                images = animation.render_frames(self.frame_grids, self.color_lookup, self.show_color_codes)
+            with span('encode'):
+                saved = animation.save_frames(images, base_name, output_format,
+                                              self.compress_level_combo.currentIndex())
+        except Exception as e:
+            self.status_label.setText(f'保存图片失败: {str(e)}')
+            return
+        elapsed = time.perf_counter() - start
+        status = f'已保存 {len(saved)} 帧: {saved[0][0]} ~ {saved[-1][0]} ({elapsed:.2f} s)'
+        if any(used_format != output_format for _, used_format in saved):
+            status += '，部分帧颜色数超过256，已按PNG保存'
+        self.status_label.setText(status)
+
+    @profiled('save_boards')
+    def save_boards(self):
+        """按拼豆板尺寸分板，并行渲染并保存每块板（多帧图片为当前帧）"""
+        if not self.image_grid:
+            self.status_label.setText('没有可保存的图片！')
+            return
         
-        x_offset = 10
-        y_offset = stats_start_y + 10
+        base_name = os.path.splitext(os.path.basename(self.image_path))[0]
+        if self.frame_grids:
+            base_name += f'_frame{self.current_frame + 1:03d}'
+        board_width, board_height = boards.BOARD_SIZES[self.board_size_combo.currentText()]
+        align = self.board_align_combo.currentText()
+        output_format = self.save_format_combo.currentText()
+        start = time.perf_counter()
+        try:
+            saved = boards.save_boards(self.image_grid, self.color_lookup, base_name, board_width, board_height,
+                                       align, self.show_color_codes, output_format,
+                                       self.compress_level_combo.currentIndex())
+        except Exception as e:
+            self.status_label.setText(f'分板保存失败: {str(e)}')
+            return
+        if not saved:
+            self.status_label.setText('没有非空的拼豆板可保存！')
+            return
+        elapsed = time.perf_counter() - start
+        columns, rows, _, _ = boards.board_layout(self.image_grid.width, self.image_grid.height,
+                                                  board_width, board_height, align)
+        status = (f'已分板保存 {len(saved)} 页（共 {columns}x{rows} 块板，空板已跳过）: '
+                  f'{saved[0][0]} ~ {saved[-1][0]} ({elapsed:.2f} s)')
+        if any(used_format != output_format for _, used_format in saved):
+            status += '，部分板颜色数超过256，已按PNG保存'
+        self.status_label.setText(status)
+
+    def get_target_grid_size(self):
+        """读取目标网格尺寸输入，返回 (宽, 高)，未填写的一边为 None"""
+        size = []
+        for line_edit in (self.target_width_input, self.target_height_input):
+            text = line_edit.text().strip()
+            if not text:
+                size.append(None)
+            elif text.isdigit() and int(text) > 0:
+                size.append(int(text))
+            else:
+                raise ValueError('目标网格尺寸必须为正整数')
+        return tuple(size)
+
+    @profiled('process_image_streaming')
+    def process_image_streaming(self):
+        """流式处理大图：按行带缩小、匹配和渲染，输出直接写入PNG文件（不生成交互网格）"""
+        base_name = os.path.splitext(os.path.basename(self.image_path))[0]
+        output_path = output_path_for(base_name)
         
-        for color_code, count in sorted_colors:
-            # 绘制色块
-            color_rect_x = x_offset
-            color_rect_y = y_offset
-            color_rect_size = 20  # 与图片中的色块大小一致
-            
-            matched_color = tuple(self.color_lookup[color_code])
-            draw.rectangle([(color_rect_x, color_rect_y), 
-                          (color_rect_x + color_rect_size, color_rect_y + color_rect_size)], 
-                         fill=matched_color, outline='black')  # 黑色边框
-            
-            # 在色块上绘制色号
-            # 计算文字颜色（深色背景用白色文字，浅色背景用黑色文字）
-            brightness = sum(matched_color) / 3
-            text_color = (255, 255, 255) if brightness < 128 else (0, 0, 0)
-            
-            # 获取文字大小
-            text_bbox = draw.textbbox((0, 0), color_code, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            # 计算文字位置（居中）
-            text_x = color_rect_x + (color_rect_size - text_width) // 2
-            text_y = color_rect_y + (color_rect_size - text_height) // 2
-            
-            # 绘制色号
-            draw.text((text_x, text_y), color_code, fill=text_color, font=font)
-            
-            # 绘制数量
-            count_text = f" x {count}"
-            count_x = color_rect_x + color_rect_size + 5
-            count_y = color_rect_y + 5
-            draw.text((count_x, count_y), count_text, fill='black', font=font)
-            
-            # 更新位置
-            x_offset += 80  # 每个统计项占80像素宽度
+        try:
+            start = time.perf_counter()
+            current_method = self.method_combo.currentText()
+            codes = list(self.color_lookup.keys())
+            quality = MatchQuality() if self.quality_checkbox.isChecked() else None
+            matcher = create_matcher(self.palette, current_method, codes, self.color_replacement,
+                                     self.dither_combo.currentText(), quality=quality)
+            result = process_image_streaming(
+                self.image_path, output_path, None, self.color_lookup, self.color_replacement,
+                block_size=self.block_size, axis_size=self.axis_size,
+                show_color_codes=self.show_color_codes,
+                compress_level=self.compress_level_combo.currentIndex(), matcher=matcher,
+                background=self.get_background_detector(), target_size=self.get_target_grid_size(),
+                resample=self.resample_combo.currentText())
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            self.status_label.setText(f'处理出错: {str(e)}')
+            return
             
-            # 如果超出宽度，换行
-            if x_offset + 80 > output_width:
-                x_offset = 10
-                y_offset += 30
-                
-                # 如果超出高度，停止绘制
-                if y_offset + 30 > stats_start_y + stats_height:
-                    break
+        # 流式模式不保留交互网格，结果已直接写入文件
+        self.image_grid = None
+        self.clear_frames()
+        self.processed_image = None
+        self.save_btn.setEnabled(False)
+        self.save_project_btn.setEnabled(False)
+        self.export_btn.setEnabled(False)
+        self.board_save_btn.setEnabled(False)
+        
+        width, height = result['original_size']
+        new_width, new_height = result['trimmed_size']
+        grid_width, grid_height = result['grid_size']
+        output_width, output_height = result['output_size']
+        status = (f'流式处理完成！原始大小: {width}x{height}, 处理后大小: {new_width}x{new_height}, '
+                  f'删除透明行: {result["removed_rows"]}, 删除透明列: {result["removed_cols"]}, ')
+        if (grid_width, grid_height) != (new_width, new_height):
+            status += f'网格大小: {grid_width}x{grid_height}, '
+        status += f'输出大小: {output_width}x{output_height}, 已保存为: {output_path} ({elapsed:.1f} s)'
+        if result['quality'] and result['quality']['pixels']:
+            status += f'\n匹配质量: {format_quality(result["quality"])}'
+        self.status_label.setText(status)
+
+    def show_profile_summary(self, run):
+        """在状态栏末尾显示最近一次操作的各阶段耗时"""
+        if not self.profile_checkbox.isChecked():
+            return
+        text = self.status_label.text()
+        if self.profile_summary and text.endswith(self.profile_summary):
+            text = text[:-len(self.profile_summary)]
+        self.profile_summary = f'  |  耗时: {PROFILER.summary(run)}'
+        self.status_label.setText(text + self.profile_summary)
+
+    def export_profile_data(self):
+        """导出累计的性能统计（JSON），开启cProfile时同时导出 .prof 文件"""
+        file_name, _ = QFileDialog.getSaveFileName(self, "导出性能数据", "profile.json",
+                                                   "JSON (*.json)")
+        if not file_name:
+            return
+        try:
+            PROFILER.dump_json(file_name)
+            status = f'性能数据已导出: {file_name}'
+            if PROFILER.cprofile_enabled:
+                prof_path = os.path.splitext(file_name)[0] + '.prof'
+                PROFILER.dump_cprofile(prof_path)
+                status += f', {prof_path}'
+            self.status_label.setText(status)
+        except Exception as e:
+            self.status_label.setText(f'导出性能数据失败: {str(e)}')
+
+    def draw_coordinate_axes(self, draw, width, height, cell_size, axis_size, font):
+        """绘制坐标轴"""
+        rendering.draw_coordinate_axes(draw, width, height, cell_size, axis_size, font)
+
+    def draw_color_statistics(self, draw, color_statistics, output_width, output_height, font):
+        """绘制色号统计"""
+        rendering.draw_color_statistics(draw, color_statistics, self.color_lookup,
+                                        output_width, output_height, font)
 
     def calculate_stats_height(self, color_statistics, output_width):
         """计算色号统计区域所需的高度"""
-        if not color_statistics:
-            return 60  # 最小高度，包含间距和额外顶部间距
-            
-        # 每个统计项的布局：
-        # - 色块：20x20像素
-        # - 色号文字：在色块上居中
-        # - 数量文字：在色块右侧
-        # - 每个统计项总宽度：约80像素（色块20 + 间距5 + 数量文字约55）
-        # - 每个统计项高度：30像素（色块20 + 上下间距10）
-        
-        # 计算每行能容纳多少个统计项
-        items_per_row = max(1, (output_width - 20) // 80)  # 减去左右边距20像素
-        
-        # 计算需要多少行
-        num_items = len(color_statistics)
-        num_rows = (num_items + items_per_row - 1) // items_per_row  # 向上取整
-        
-        # 计算总高度：行数 * 每行高度 + 上下边距 + 额外顶部间距
-        total_height = num_rows * 30 + 20 + 20  # 20像素的上下边距 + 20像素的额外顶部间距
-        
-        # 设置最小高度和最大高度
-        min_height = 60  # 增加最小高度，包含额外间距
-        max_height = 320  # 增加最大高度限制，避免统计区域过大
-        
-        return max(min_height, min(total_height, max_height))
+        return rendering.calculate_stats_height(color_statistics, output_width)
 
     def add_new_color(self):
         try:
@@ -1746,18 +2269,21 @@ class ColorMatcher(QMainWindow):
             if not code:
                 raise ValueError("请输入颜色代码")
                 
-            # 添加新颜色到查找表
-            self.color_lookup[code] = np.array([r, g, b])
-            
             # 更新JSON数据
-            self.color_data[code] = {
+            with open('sample.json', 'r') as f:
+                color_data = json.load(f)
+            color_data[code] = {
                 "rgb": [r, g, b],
                 "is_placeholder": False
             }
             
             # 保存到文件
             with open('sample.json', 'w') as f:
-                json.dump(self.color_data, f, indent=4)
+                json.dump(color_data, f, indent=4)
+            
+            # 重新加载调色板（文件已变化，会重新编译缓存）
+            if self.current_source == '自选颜色':
+                self.load_color_data(self.current_source)
             
             self.status_label.setText(f'新颜色 {code} 添加成功！')
             
@@ -0,0 +1,91 @@
+"""匹配方法 / 颜色源对比（不依赖 Qt）
+
+颜色去重只做一次（prepare_comparison），之后每个 (颜色源, 匹配方法) 组合只对去重后的颜色
+批量匹配（与 PaletteMatcher 使用相同的距离核函数，结果与处理图片一致），统计：
+- 使用的颜色数
+- 平均 / 最大 ΔE：统一使用 CIEDE2000 衡量源颜色与匹配颜色的差异（与匹配方法无关，便于横向比较），
+  平均值按像素数加权
+- 缩略图：每个格子一个像素（透明为白色），按整数倍放大或等间隔抽样到缩略图尺寸
+"""
+import time
+
+import numpy as np
+
+from matching import delta_e_ciede2000, nearest_indices
+from palette import rgb_to_lab_array
+from pipeline import background_mask
+from profiling import span
+from rendering import GRID_BACKGROUND
+
+THUMBNAIL_SIZE = 160  # 缩略图最长边（像素）
+
+
+def prepare_comparison(pixels, mask=None):
+    """对（裁剪、缩小后的）像素数组做颜色去重，返回各组合共用的预处理结果（可传入背景掩码）"""
+    if mask is None:
+        mask = background_mask(pixels)
+    rgb = pixels[..., :3].astype(np.uint32)
+    packed = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+    unique_colors, inverse, counts = np.unique(packed[~mask], return_inverse=True, return_counts=True)
+
+    # 每个格子对应的去重颜色序号，透明格子为 -1
+    color_grid = np.full(mask.shape, -1, dtype=np.intp)
+    color_grid[~mask] = inverse
+    unique_rgb = np.stack([unique_colors >> 16, (unique_colors >> 8) & 0xFF, unique_colors & 0xFF],
+                          axis=1).astype(np.uint8)
+    return {
+        'rgb': unique_rgb,
+        'lab': rgb_to_lab_array(unique_rgb),
+        'counts': counts,
+        'color_grid': color_grid,
+    }
+
+
+def comparison_thumbnail(color_grid, colors, size=THUMBNAIL_SIZE):
+    """生成缩略图数组 (高, 宽, 3)：colors 为每个去重颜色匹配到的RGB"""
+    lut = np.vstack([colors, np.array([GRID_BACKGROUND], dtype=np.uint8)])
+    height, width = color_grid.shape
+    step = -(-max(height, width) // size)  # 网格大于缩略图时等间隔抽样
+    thumbnail = lut[color_grid[::step, ::step]]  # -1 取最后的背景色
+    scale = max(1, size // max(thumbnail.shape[:2]))
+    if scale > 1:
+        thumbnail = np.repeat(np.repeat(thumbnail, scale, axis=0), scale, axis=1)
+    return np.ascontiguousarray(thumbnail)
+
+
+def compare_match(prepared, palette, method, thumbnail_size=THUMBNAIL_SIZE):
+    """用一个颜色源和匹配方法匹配去重后的颜色，返回对比结果字典"""
+    start = time.perf_counter()
+    counts = prepared['counts']
+    if len(counts):
+        nearest = nearest_indices(palette, prepared['rgb'], method)
+        delta_e = delta_e_ciede2000(prepared['lab'], palette.lab[nearest])
+        color_count = int(np.unique(nearest).size)
+        mean_delta_e = float(np.average(delta_e, weights=counts))
+        max_delta_e = float(delta_e.max())
+    else:
+        nearest = np.empty(0, dtype=np.intp)
+        color_count = 0
+        mean_delta_e = max_delta_e = 0.0
+    thumbnail = comparison_thumbnail(prepared['color_grid'], palette.rgb[nearest], thumbnail_size)
+    return {
+        'palette': palette.name,
+        'method': method,
+        'color_count': color_count,
+        'mean_delta_e': mean_delta_e,
+        'max_delta_e': max_delta_e,
+        'thumbnail': thumbnail,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def compare_methods(pixels, palettes, methods, thumbnail_size=THUMBNAIL_SIZE, mask=None):
+    """对每个颜色源和匹配方法的组合进行对比（共用一次颜色去重），返回结果列表"""
+    with span('prepare'):
+        prepared = prepare_comparison(pixels, mask)
+    results = []
+    with span('match'):
+        for palette in palettes:
+            for method in methods:
+                results.append(compare_match(prepared, palette, method, thumbnail_size))
+    return results
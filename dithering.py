@@ -0,0 +1,226 @@
+"""抖动匹配（不依赖 Qt）
+
+- Bayer 有序抖动：按像素位置叠加阈值矩阵偏移后再按颜色匹配，完全向量化
+- Floyd-Steinberg 误差扩散（可选蛇形扫描）：普通扫描按斜对角线波前批量向量化，蛇形扫描逐行处理；
+  量化使用预先计算的 RGB -> 调色板索引查找表（每通道 5 位），不做字典查找
+
+匹配器与 pipeline.UniqueColorMatcher 接口相同（match(pixels) -> 索引数组），
+状态（行号、误差行）跨调用保留，可直接用于流式处理的行带。
+"""
+import numpy as np
+
+from image_grid import empty_index, index_dtype
+from matching import PaletteMatcher, nearest_indices
+from pipeline import UniqueColorMatcher, background_mask
+
+DITHER_NONE = '无抖动'
+DITHER_BAYER = 'Bayer有序抖动'
+DITHER_FLOYD_STEINBERG = 'Floyd-Steinberg'
+DITHER_SERPENTINE = 'Floyd-Steinberg（蛇形）'
+DITHER_MODES = [DITHER_NONE, DITHER_BAYER, DITHER_FLOYD_STEINBERG, DITHER_SERPENTINE]
+
+BAYER_SIZE = 8  # Bayer 矩阵边长
+LUT_BITS = 5  # 误差扩散量化查找表每通道的位数
+WAVEFRONT_MIN_ROWS = 8  # 普通扫描的误差扩散按斜对角线批量处理的最少行数（行数太少时批量太小）
+
+_quantization_luts = {}  # (调色板名, 匹配方法, 位数, 调色板RGB) -> 查找表
+
+
+def bayer_matrix(size):
+    """生成 size x size 的 Bayer 阈值矩阵（size 为 2 的幂，值为 0 ~ size²-1）"""
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2],
+                           [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
+
+
+def default_spread(palette):
+    """有序抖动的偏移幅度：调色板越小，相邻颜色间距越大"""
+    return 255.0 / max(1, len(palette)) ** (1.0 / 3.0)
+
+
+def quantization_lut(palette, method, bits=LUT_BITS):
+    """计算量化查找表：按每通道 bits 位划分的 RGB 格子中心 -> 最接近颜色的调色板索引"""
+    key = (palette.name, method, bits, palette.rgb.tobytes())
+    lut = _quantization_luts.get(key)
+    if lut is None:
+        shift = 8 - bits
+        levels = (np.arange(1 << bits) << shift) + (1 << shift) // 2
+        r, g, b = np.meshgrid(levels, levels, levels, indexing='ij')
+        centers = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+        lut = nearest_indices(palette, centers, method)
+        _quantization_luts[key] = lut
+    return lut
+
+
+class OrderedDitherMatcher(UniqueColorMatcher):
+    """Bayer 有序抖动匹配器：叠加位置相关的阈值偏移后按颜色去重匹配"""
+
+    def __init__(self, match_color, codes, color_replacement=None, spread=32.0, size=BAYER_SIZE):
+        super().__init__(match_color, codes, color_replacement)
+        self.threshold = (bayer_matrix(size) + 0.5) / (size * size) - 0.5  # -0.5 ~ 0.5
+        self.spread = spread
+        self.row = 0  # 已处理的行数（流式处理时保持阈值矩阵连续）
+
+    def match(self, pixels, mask=None):
+        if mask is None:
+            mask = background_mask(pixels)
+        height, width = pixels.shape[:2]
+        size = len(self.threshold)
+        rows = (np.arange(height) + self.row) % size
+        cols = np.arange(width) % size
+        offset = self.threshold[rows[:, None], cols[None, :]] * self.spread
+        self.row += height
+
+        dithered = pixels.copy()
+        dithered[..., :3] = np.clip(pixels[..., :3] + offset[..., None], 0, 255).astype(np.uint8)
+        # 透明判断使用抖动前的像素
+        return super().match(dithered, mask)
+
+
+class ErrorDiffusionMatcher:
+    """Floyd-Steinberg 误差扩散匹配器（serpentine=True 时奇数行反向扫描）
+
+    每个像素依赖同一行前一个像素扩散的误差，一行之内不能整体量化。普通扫描时像素 (y, x)
+    只依赖 x + 2y 更小的像素，按 x + 2y 相同的斜对角线（波前）整批向量化处理；蛇形扫描时
+    相邻行方向相反，下一行必须等上一行全部完成，只能逐像素处理（向下一行的扩散按行向量化）。
+    两种方式的误差累加顺序与逐像素扫描相同，结果完全一致。
+    """
+
+    def __init__(self, palette, method, codes, color_replacement=None, serpentine=False, bits=LUT_BITS):
+        color_replacement = color_replacement or {}
+        code_index = {code: i for i, code in enumerate(codes)}
+        self.dtype = index_dtype(len(codes))
+        self.empty = empty_index(self.dtype)
+        self.serpentine = serpentine
+        self.bits = bits
+        self.lut = quantization_lut(palette, method, bits)
+        self.palette_rgb = palette.rgb.astype(np.float64)
+        # 调色板索引 -> 色号表索引（应用颜色替换）
+        self.code_lut = np.array([code_index[color_replacement.get(code, code)] for code in palette.codes],
+                                 dtype=self.dtype)
+        self.carry = None  # 传递到下一行的误差 (宽 + 2, 3)（两端各留一格）
+        self.row = 0
+
+    def match(self, pixels, mask=None):
+        """扩散误差并量化，返回调色板索引数组（透明像素为空白标记）"""
+        if mask is None:
+            mask = background_mask(pixels)
+        height, width = pixels.shape[:2]
+        if self.carry is None:
+            self.carry = np.zeros((width + 2, 3))
+
+        values = pixels[..., :3].astype(np.float64)
+        opaque = ~mask
+        if self.serpentine or height < WAVEFRONT_MIN_ROWS:
+            result = self._diffuse_rows(values, opaque)
+        else:
+            result = self._diffuse_wavefront(values, opaque)
+        self.row += height
+
+        indices = np.full((height, width), self.empty, dtype=self.dtype)
+        valid = result >= 0
+        indices[valid] = self.code_lut[result[valid]]
+        return indices
+
+    def _quantize(self, values):
+        """(n, 3) 的已截断颜色 -> 调色板索引"""
+        shift = 8 - self.bits
+        levels = values.astype(np.intp) >> shift
+        return self.lut[levels[:, 0] << 2 * self.bits | levels[:, 1] << self.bits | levels[:, 2]]
+
+    def _diffuse_wavefront(self, values, opaque):
+        """普通扫描：按 x + 2y 相同的斜对角线批量量化和扩散误差"""
+        height, width = opaque.shape
+        errors = np.zeros((height + 1, width + 2, 3))  # errors[y, x + 1] 为像素 (y, x) 累计的误差
+        errors[0] = self.carry
+        result = np.full((height, width), -1, dtype=np.intp)
+        all_rows = np.arange(height)
+
+        for t in range(width + 2 * (height - 1)):
+            ys = all_rows[max(0, (t - width + 2) // 2):min(height, t // 2 + 1)]
+            xs = t - 2 * ys
+            keep = opaque[ys, xs]
+            ys, xs = ys[keep], xs[keep]
+            if not len(ys):
+                continue
+            value = np.clip(values[ys, xs] + errors[ys, xs + 1], 0.0, 255.0)
+            index = self._quantize(value)
+            result[ys, xs] = index
+            error = value - self.palette_rgb[index]
+
+            # 下一行左、中、右分别为 3/16、5/16、1/16，右侧 7/16；
+            # 同一批中右侧误差的目标可能是上一行像素向下扩散的目标，先向下扩散以保持与逐像素扫描相同的累加顺序
+            errors[ys + 1, xs] += error * 0.1875
+            errors[ys + 1, xs + 1] += error * 0.3125
+            errors[ys + 1, xs + 2] += error * 0.0625
+            errors[ys, xs + 2] += error * 0.4375
+
+        self.carry = errors[height]
+        return result
+
+    def _diffuse_rows(self, values, opaque):
+        """逐行扫描（蛇形扫描或行数很少时）：行内逐像素量化，向下一行的扩散按行向量化"""
+        height, width = opaque.shape
+        lut = self.lut.tolist()
+        palette_rgb = self.palette_rgb.tolist()
+        shift = 8 - self.bits
+        g_shift = self.bits
+        r_shift = 2 * self.bits
+        result = np.full((height, width), -1, dtype=np.intp)
+
+        for y in range(height):
+            reverse = self.serpentine and (self.row + y) % 2 == 1
+            row = values[y].tolist()
+            row_opaque = opaque[y].tolist()
+            current = self.carry.tolist()
+            row_errors = [(0.0, 0.0, 0.0)] * width
+            out = [-1] * width
+            ahead_r = ahead_g = ahead_b = 0.0  # 扫描方向上前一个像素扩散的 7/16 误差
+
+            for x in (range(width - 1, -1, -1) if reverse else range(width)):
+                if not row_opaque[x]:
+                    ahead_r = ahead_g = ahead_b = 0.0
+                    continue
+                pixel = row[x]
+                error = current[x + 1]
+                r = min(255.0, max(0.0, pixel[0] + (error[0] + ahead_r)))
+                g = min(255.0, max(0.0, pixel[1] + (error[1] + ahead_g)))
+                b = min(255.0, max(0.0, pixel[2] + (error[2] + ahead_b)))
+                index = lut[(int(r) >> shift) << r_shift | (int(g) >> shift) << g_shift | int(b) >> shift]
+                out[x] = index
+                color = palette_rgb[index]
+                er = r - color[0]
+                eg = g - color[1]
+                eb = b - color[2]
+                row_errors[x] = (er, eg, eb)
+                ahead_r = er * 0.4375
+                ahead_g = eg * 0.4375
+                ahead_b = eb * 0.4375
+
+            # 向下一行扩散：按扫描顺序，每个位置依次收到 1/16、5/16、3/16
+            row_errors = np.array(row_errors)
+            following = np.zeros((width + 2, 3))
+            if reverse:
+                following[:-2] += row_errors * 0.0625
+                following[1:-1] += row_errors * 0.3125
+                following[2:] += row_errors * 0.1875
+            else:
+                following[2:] += row_errors * 0.0625
+                following[1:-1] += row_errors * 0.3125
+                following[:-2] += row_errors * 0.1875
+            result[y] = out
+            self.carry = following
+        return result
+
+
+def create_matcher(palette, method, codes, color_replacement=None, dither=DITHER_NONE, quality=None):
+    """根据抖动模式创建匹配器（quality 为 MatchQuality 累加器，仅不抖动时统计匹配质量）"""
+    match_color = PaletteMatcher(palette, method)
+    if dither == DITHER_BAYER:
+        return OrderedDitherMatcher(match_color, codes, color_replacement, default_spread(palette))
+    if dither in (DITHER_FLOYD_STEINBERG, DITHER_SERPENTINE):
+        return ErrorDiffusionMatcher(palette, method, codes, color_replacement,
+                                     serpentine=dither == DITHER_SERPENTINE)
+    return UniqueColorMatcher(match_color, codes, color_replacement, quality)
@@ -0,0 +1,192 @@
+import numpy as np
+
+
+def index_dtype(num_codes):
+    """根据色号数量选择索引数组的数据类型（保留最大值作为空白标记）"""
+    if num_codes < np.iinfo(np.uint8).max:
+        return np.uint8
+    return np.uint16
+
+
+def empty_index(dtype):
+    """获取空白（透明）格子的索引标记值"""
+    return np.iinfo(dtype).max
+
+
+class ColorCounter:
+    """按首次出现顺序累计色号数量（与逐像素统计的顺序一致）"""
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.counts = np.zeros(len(codes), dtype=np.int64)
+        self.order = []  # 色号索引的首次出现顺序
+
+    def add(self, indices):
+        valid = indices[indices < len(self.codes)]
+        if not valid.size:
+            return
+        counts = np.bincount(valid, minlength=len(self.codes))
+        new = np.flatnonzero((counts > 0) & (self.counts == 0))
+        if new.size:
+            # 按在本行带中首次出现的位置排序
+            unique_values, first_positions = np.unique(valid, return_index=True)
+            first = dict(zip(unique_values.tolist(), first_positions.tolist()))
+            self.order.extend(sorted(new.tolist(), key=first.get))
+        self.counts += counts
+
+    def statistics(self):
+        """返回 {色号: 数量}"""
+        return {self.codes[i]: int(self.counts[i]) for i in self.order}
+
+
+class ColorBlock:
+    """单个色块类"""
+    def __init__(self, x, y, color_code, original_color_code):
+        self.x = x  # 色块在网格中的X坐标
+        self.y = y  # 色块在网格中的Y坐标
+        self.color_code = color_code  # 当前颜色代码
+        self.original_color_code = original_color_code  # 原始颜色代码
+        self.pixmap = None  # 缓存的色块图像
+        self.modified = False  # 是否被修改过
+
+    def update_color(self, new_color_code):
+        """更新色块颜色"""
+        self.color_code = new_color_code
+        self.modified = True
+        self.pixmap = None  # 清除缓存，需要重新生成
+
+class ImageGrid:
+    """图片网格管理类
+
+    除了 blocks 字典外，同时维护两个调色板索引数组（当前 / 原始），
+    索引对应 codes 色号表，空白格子使用数据类型最大值标记。
+    """
+    def __init__(self, width, height, block_size=20, axis_size=30, codes=None):
+        self.width = width  # 网格宽度
+        self.height = height  # 网格高度
+        self.block_size = block_size  # 色块大小
+        self.axis_size = axis_size  # 坐标轴区域大小
+        self.blocks = {}  # 存储所有色块 {(x,y): ColorBlock}
+        self.background_pixmap = None  # 背景图像（坐标轴、统计等）
+        self.composite_pixmap = None  # 合成后的显示图像
+        self.show_color_codes = True  # 是否显示色号
+
+        # 调色板索引数据
+        self.codes = list(codes) if codes else []  # 色号表（索引 -> 色号）
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        dtype = index_dtype(len(self.codes))
+        self.indices = np.full((height, width), empty_index(dtype), dtype=dtype)  # 当前索引
+        self.original_indices = self.indices.copy()  # 原始索引
+
+    @property
+    def empty_index(self):
+        """空白格子的索引标记值"""
+        return empty_index(self.indices.dtype)
+
+    def index_of(self, color_code):
+        """获取色号对应的索引，不存在时追加到色号表"""
+        index = self.code_index.get(color_code)
+        if index is None:
+            index = len(self.codes)
+            self._ensure_index_capacity(index + 1)
+            self.codes.append(color_code)
+            self.code_index[color_code] = index
+        return index
+
+    def _ensure_index_capacity(self, num_codes):
+        """色号表超出当前数据类型范围时升级索引数组"""
+        dtype = index_dtype(num_codes)
+        if np.dtype(dtype).itemsize <= self.indices.dtype.itemsize:
+            return
+        old_empty = self.empty_index
+        for name in ('indices', 'original_indices'):
+            old = getattr(self, name)
+            new = old.astype(dtype)
+            new[old == old_empty] = empty_index(dtype)
+            setattr(self, name, new)
+
+    def add_block(self, x, y, color_code, original_color_code):
+        """添加色块"""
+        self.blocks[(x, y)] = ColorBlock(x, y, color_code, original_color_code)
+        self.indices[y, x] = self.index_of(color_code)
+        self.original_indices[y, x] = self.index_of(original_color_code)
+
+    def update_block_color(self, x, y, new_color_code):
+        """更新色块颜色"""
+        if (x, y) in self.blocks:
+            self.blocks[(x, y)].update_color(new_color_code)
+            self.indices[y, x] = self.index_of(new_color_code)
+            return True
+        return False
+
+    def get_block_color(self, x, y):
+        """获取色块颜色"""
+        if (x, y) in self.blocks:
+            return self.blocks[(x, y)].color_code
+        return None
+
+    def get_modified_blocks(self):
+        """获取所有修改过的色块"""
+        return [(x, y) for (x, y), block in self.blocks.items() if block.modified]
+
+    def reset_modifications(self):
+        """重置所有修改标记"""
+        for block in self.blocks.values():
+            block.modified = False
+
+    def remap_colors(self, mapping):
+        """按 {原色号: 新色号} 一次性重映射当前索引，返回被修改的色块坐标列表"""
+        if not mapping:
+            return []
+        # 先登记新色号（可能升级索引数据类型），再构建索引查找表
+        pairs = [(self.index_of(old), self.index_of(new)) for old, new in mapping.items()]
+        lut = np.arange(np.iinfo(self.indices.dtype).max + 1, dtype=self.indices.dtype)
+        for old, new in pairs:
+            lut[old] = new
+        remapped = lut[self.indices]
+        ys, xs = np.nonzero(remapped != self.indices)
+        self.indices = remapped
+
+        # 同步色块字典
+        changed = list(zip(xs.tolist(), ys.tolist()))
+        for (x, y), index in zip(changed, remapped[ys, xs].tolist()):
+            self.blocks[(x, y)].update_color(self.codes[index])
+        return changed
+
+    def converted(self, code_mapping, codes):
+        """按 {原色号: 新色号} 将网格转换到新的色号表，返回新网格（当前/原始索引各一次查表）"""
+        code_index = {code: i for i, code in enumerate(codes)}
+        dtype = index_dtype(len(codes))
+        lut = np.full(np.iinfo(self.indices.dtype).max + 1, empty_index(dtype), dtype=dtype)
+        for i, code in enumerate(self.codes):
+            lut[i] = code_index[code_mapping.get(code, code)]
+        grid = ImageGrid.from_index_arrays(lut[self.indices], lut[self.original_indices], codes,
+                                           self.block_size, self.axis_size)
+        grid.show_color_codes = self.show_color_codes
+        return grid
+
+    def color_statistics(self):
+        """统计当前每个色号的数量 {色号: 数量}（按首次出现顺序）"""
+        counter = ColorCounter(self.codes)
+        counter.add(self.indices)
+        return counter.statistics()
+
+    @classmethod
+    def from_index_arrays(cls, indices, original_indices, codes, block_size=20, axis_size=30):
+        """从调色板索引数组重建网格（不重新匹配颜色）"""
+        height, width = indices.shape
+        grid = cls(width, height, block_size, axis_size, codes)
+        grid.indices = indices
+        grid.original_indices = original_indices
+
+        # 重建色块字典
+        empty = grid.empty_index
+        ys, xs = np.nonzero(indices != empty)
+        current = indices[ys, xs]
+        original = original_indices[ys, xs]
+        for x, y, index, original_index in zip(xs.tolist(), ys.tolist(),
+                                               current.tolist(), original.tolist()):
+            block = ColorBlock(x, y, grid.codes[index], grid.codes[original_index])
+            block.modified = index != original_index
+            grid.blocks[(x, y)] = block
+        return grid
@@ -0,0 +1,80 @@
+"""处理结果图片的保存（不依赖 Qt）
+
+- PNG：可调压缩级别（0 最快，9 文件最小）
+- PNG（调色板）：结果图片只包含调色板颜色和少量文字、坐标轴颜色，
+  颜色数不超过 256 时保存为 P 模式（每像素 1 字节），编码更快、文件更小；超过时按 RGB PNG 保存
+- WebP（无损）：压缩级别映射为 WebP 的 method（0 ~ 6）
+"""
+import numpy as np
+from PIL import Image
+
+OUTPUT_PNG = 'PNG'
+OUTPUT_PNG_PALETTE = 'PNG（调色板）'
+OUTPUT_WEBP_LOSSLESS = 'WebP（无损）'
+OUTPUT_FORMATS = {  # 格式名称 -> 文件扩展名
+    OUTPUT_PNG: '.png',
+    OUTPUT_PNG_PALETTE: '.png',
+    OUTPUT_WEBP_LOSSLESS: '.webp',
+}
+
+DEFAULT_COMPRESS_LEVEL = 6  # 与 PIL 默认的 PNG 压缩级别相同
+MAX_PALETTE_COLORS = 256
+PALETTE_BAND_PIXELS = 1 << 22  # 转换为调色板索引时每个行带的像素数上限
+
+
+def output_path_for(base_name, output_format=OUTPUT_PNG):
+    """处理结果的输出文件名"""
+    return f"{base_name}_processed{OUTPUT_FORMATS[output_format]}"
+
+
+def frame_output_path(base_name, index, output_format=OUTPUT_PNG):
+    """多帧图片中一帧的输出文件名（帧序号从1开始）"""
+    return f"{base_name}_processed_frame{index + 1:03d}{OUTPUT_FORMATS[output_format]}"
+
+
+def board_output_path(base_name, row, column, output_format=OUTPUT_PNG):
+    """分板输出中一块板的文件名（行、列从1开始）"""
+    return f"{base_name}_processed_board_r{row + 1:02d}_c{column + 1:02d}{OUTPUT_FORMATS[output_format]}"
+
+
+def to_palette_image(image):
+    """颜色数不超过256时转换为颜色完全一致的 P 模式图片，否则返回 None
+
+    PIL 的 quantize 按降低精度的颜色缓存查找最近颜色，相近的颜色可能映射到错误的调色板项，
+    因此用 2^24 项的查找表（16 MB）按行带得到每个像素的精确索引。
+    """
+    rgb_image = image if image.mode == 'RGB' else image.convert('RGB')
+    colors = rgb_image.getcolors(MAX_PALETTE_COLORS)
+    if colors is None:
+        return None
+    palette = np.array([color for _, color in colors], dtype=np.uint32)
+    keys = (palette[:, 0] << 16) | (palette[:, 1] << 8) | palette[:, 2]
+    lut = np.zeros(1 << 24, dtype=np.uint8)
+    lut[keys] = np.arange(len(keys))
+
+    pixels = np.asarray(rgb_image)
+    height, width = pixels.shape[:2]
+    indices = np.empty((height, width), dtype=np.uint8)
+    band = max(1, PALETTE_BAND_PIXELS // max(1, width))
+    for start in range(0, height, band):
+        rows = pixels[start:start + band].astype(np.uint32)
+        packed = (rows[..., 0] << 16) | (rows[..., 1] << 8) | rows[..., 2]
+        indices[start:start + band] = lut[packed]
+
+    palette_image = Image.fromarray(indices, 'P')
+    palette_image.putpalette(palette.astype(np.uint8).tobytes())
+    return palette_image
+
+
+def save_output_image(image, path, output_format=OUTPUT_PNG, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """按输出格式保存图片，返回实际使用的格式（调色板模式颜色过多时回退为 PNG）"""
+    if output_format == OUTPUT_WEBP_LOSSLESS:
+        image.save(path, 'WEBP', lossless=True, method=compress_level * 6 // 9)
+        return output_format
+    if output_format == OUTPUT_PNG_PALETTE:
+        palette_image = to_palette_image(image)
+        if palette_image is not None:
+            palette_image.save(path, 'PNG', compress_level=compress_level)
+            return output_format
+    image.save(path, 'PNG', compress_level=compress_level)
+    return OUTPUT_PNG
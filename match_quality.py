@@ -0,0 +1,63 @@
+"""匹配质量统计（不依赖 Qt）
+
+按去重后的颜色累计（每种颜色乘以其像素数），数据来自匹配时的同一次距离计算
+（matching.PaletteMatcher.match_many_with_quality）：
+- 源像素与匹配颜色之间的平均 / 最大 ΔE（CIEDE2000）
+- 每个色号的像素数、平均 / 最大 ΔE（按颜色替换之前匹配到的色号统计）
+- 最近和次近颜色接近并列的像素数（换一种匹配方法或轻微的颜色变化就可能匹配到其他色号）
+"""
+import numpy as np
+
+
+class MatchQuality:
+    """匹配质量累加器（可跨行带累计）"""
+
+    def __init__(self):
+        self.pixels = 0
+        self.delta_e_sum = 0.0
+        self.max_delta_e = 0.0
+        self.near_ties = 0
+        self.per_code = {}  # 色号 -> [像素数, ΔE×像素数之和, 最大ΔE]
+
+    def add(self, codes, delta_e, ties, counts):
+        """累计一组颜色：codes 为匹配到的色号，delta_e / ties / counts 为每种颜色的ΔE、是否接近并列和像素数"""
+        delta_e = np.asarray(delta_e, dtype=np.float64)
+        ties = np.asarray(ties, dtype=bool)
+        counts = np.asarray(counts, dtype=np.int64)
+        if not counts.size:
+            return
+        self.pixels += int(counts.sum())
+        self.delta_e_sum += float(delta_e @ counts)
+        self.max_delta_e = max(self.max_delta_e, float(delta_e.max()))
+        self.near_ties += int(counts[ties].sum())
+        for code, error, n in zip(codes, delta_e.tolist(), counts.tolist()):
+            stats = self.per_code.setdefault(code, [0, 0.0, 0.0])
+            stats[0] += n
+            stats[1] += error * n
+            stats[2] = max(stats[2], error)
+
+    def summary(self):
+        """返回可 JSON 序列化的统计结果（每个色号按平均ΔE从大到小排列）"""
+        per_code = {code: {'pixels': n, 'mean_delta_e': total / n, 'max_delta_e': max_error}
+                    for code, (n, total, max_error) in self.per_code.items() if n}
+        return {
+            'pixels': self.pixels,
+            'mean_delta_e': self.delta_e_sum / self.pixels if self.pixels else 0.0,
+            'max_delta_e': self.max_delta_e,
+            'near_ties': self.near_ties,
+            'near_tie_ratio': self.near_ties / self.pixels if self.pixels else 0.0,
+            'per_code': dict(sorted(per_code.items(), key=lambda item: -item[1]['mean_delta_e'])),
+        }
+
+
+def format_quality(summary, worst=3):
+    """格式化匹配质量摘要，用于状态栏显示"""
+    if not summary or not summary['pixels']:
+        return ''
+    text = (f"平均ΔE {summary['mean_delta_e']:.2f}, 最大ΔE {summary['max_delta_e']:.2f}, "
+            f"接近并列 {summary['near_ties']} 像素 ({summary['near_tie_ratio']:.1%})")
+    worst_codes = list(summary['per_code'].items())[:worst]
+    if worst_codes:
+        text += ', 误差最大色号: ' + ' '.join(f"{code}({stats['mean_delta_e']:.1f})"
+                                          for code, stats in worst_codes)
+    return text
@@ -0,0 +1,313 @@
+"""颜色匹配方法（不依赖 Qt）
+
+每个匹配函数接收编译后的调色板（palette.Palette）和一个RGB颜色，返回最接近的色号。
+距离计算使用调色板预先计算的 RGB/LAB/HSV 数组。
+
+批量匹配使用 *_distances 核函数：(n, 3) 的RGB数组 -> (n, 调色板颜色数) 的距离矩阵，
+按块计算以限制内存占用；PaletteMatcher 将其包装为可批量匹配的匹配函数。
+需要匹配质量时，同一次距离计算同时取出最近和次近距离（判断接近并列），并计算源颜色与
+匹配颜色之间的 CIEDE2000 色差。
+调色板色号两两之间的距离矩阵和最近替代色表按匹配方法缓存在调色板对象上。
+"""
+import numpy as np
+
+from palette import rgb_to_hsv_array, rgb_to_lab_array
+
+HSV_WEIGHTS = np.array([2.0, 1.0, 0.8])  # H权重大，S次之，V最小
+HUE_TOLERANCE = 1e-9  # CIEDE2000 色相差与180°比较时的容差（弧度）
+
+
+def closest_color_rgb(palette, target_rgb):
+    """使用简单的RGB欧氏距离"""
+    target_rgb = np.asarray(target_rgb, dtype=np.int64)
+    distances = np.sum((palette.rgb.astype(np.int64) - target_rgb) ** 2, axis=1)
+    return palette.codes[int(np.argmin(distances))]
+
+
+def closest_color_lab(palette, target_rgb):
+    """使用LAB色彩空间的颜色匹配"""
+    target_lab = rgb_to_lab_array(target_rgb)
+    # LAB空间中的欧氏距离（调色板LAB值已预先计算）
+    distances = np.sum((target_lab - palette.lab) ** 2, axis=1)
+    return palette.codes[int(np.argmin(distances))]
+
+
+def closest_color_hsv_weighted(palette, target_rgb):
+    """使用HSV色彩空间的加权颜色匹配"""
+    target_hsv = rgb_to_hsv_array(target_rgb)
+    palette_hsv = palette.hsv
+
+    # 色相差异需要特殊处理（因为是环形的）
+    h_abs = np.abs(target_hsv[0] - palette_hsv[:, 0])
+    h_diff = np.minimum(h_abs, 360 - h_abs) / 180.0
+    sv_diff = target_hsv[1:] - palette_hsv[:, 1:]
+
+    # 计算加权距离（色相的权重更大，以更好地保持颜色的基本特征）
+    distances = HSV_WEIGHTS[0] * h_diff**2 + np.sum(HSV_WEIGHTS[1:] * sv_diff**2, axis=1)
+    return palette.codes[int(np.argmin(distances))]
+
+
+def closest_color_cie94(palette, target_rgb):
+    """使用CIE94色差公式的颜色匹配"""
+    distances = cie94_distances(palette, np.asarray(target_rgb).reshape(1, 3))[0]
+    return palette.codes[int(np.argmin(distances))]
+
+
+def closest_color_ciede2000(palette, target_rgb):
+    """使用CIEDE2000色差公式的颜色匹配"""
+    distances = ciede2000_distances(palette, np.asarray(target_rgb).reshape(1, 3))[0]
+    return palette.codes[int(np.argmin(distances))]
+
+
+def delta_e_cie94(lab1, lab2):
+    """CIE94色差（图形艺术参数 kL=1, K1=0.045, K2=0.015），lab1 为参考色，支持广播"""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    c1 = np.hypot(lab1[..., 1], lab1[..., 2])
+    c2 = np.hypot(lab2[..., 1], lab2[..., 2])
+    delta_l = lab1[..., 0] - lab2[..., 0]
+    delta_c = c1 - c2
+    delta_a = lab1[..., 1] - lab2[..., 1]
+    delta_b = lab1[..., 2] - lab2[..., 2]
+    # ΔH² = Δa² + Δb² - ΔC²（舍入误差可能略小于0）
+    delta_h_sq = np.maximum(delta_a ** 2 + delta_b ** 2 - delta_c ** 2, 0.0)
+    s_c = 1.0 + 0.045 * c1
+    s_h = 1.0 + 0.015 * c1
+    return np.sqrt(delta_l ** 2 + (delta_c / s_c) ** 2 + delta_h_sq / s_h ** 2)
+
+
+def delta_e_ciede2000(lab1, lab2):
+    """CIEDE2000色差（kL=kC=kH=1），支持广播"""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    # a' 修正
+    c_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2.0
+    c_mean7 = c_mean ** 7
+    g = 0.5 * (1.0 - np.sqrt(c_mean7 / (c_mean7 + 25.0 ** 7)))
+    a1p = (1.0 + g) * a1
+    a2p = (1.0 + g) * a2
+    c1p = np.hypot(a1p, b1)
+    c2p = np.hypot(a2p, b2)
+    # 色相（弧度）；色相差恰为180°时按参考实现属于 |Δh| <= 180° 的分支，比较时留出舍入误差的容差
+    h1p = np.arctan2(b1, a1p) % (2.0 * np.pi)
+    h2p = np.arctan2(b2, a2p) % (2.0 * np.pi)
+    chroma_zero = (c1p * c2p) == 0
+
+    # 明度、彩度、色相差
+    delta_lp = l2 - l1
+    delta_cp = c2p - c1p
+    dh = h2p - h1p
+    half_turn = np.pi + HUE_TOLERANCE
+    dh = np.where(dh > half_turn, dh - 2.0 * np.pi, np.where(dh < -half_turn, dh + 2.0 * np.pi, dh))
+    dh = np.where(chroma_zero, 0.0, dh)
+    delta_hp = 2.0 * np.sqrt(c1p * c2p) * np.sin(dh / 2.0)
+
+    # 平均值
+    l_mean = (l1 + l2) / 2.0
+    cp_mean = (c1p + c2p) / 2.0
+    h_sum = h1p + h2p
+    h_mean = np.where(np.abs(h1p - h2p) <= half_turn, h_sum / 2.0,
+                      np.where(h_sum < 2.0 * np.pi, (h_sum + 2.0 * np.pi) / 2.0, (h_sum - 2.0 * np.pi) / 2.0))
+    h_mean = np.degrees(np.where(chroma_zero, h_sum, h_mean))
+
+    # 权重函数
+    t = (1.0 - 0.17 * np.cos(np.radians(h_mean - 30.0)) + 0.24 * np.cos(np.radians(2.0 * h_mean)) +
+         0.32 * np.cos(np.radians(3.0 * h_mean + 6.0)) - 0.20 * np.cos(np.radians(4.0 * h_mean - 63.0)))
+    delta_theta = 30.0 * np.exp(-((h_mean - 275.0) / 25.0) ** 2)
+    cp_mean7 = cp_mean ** 7
+    r_c = 2.0 * np.sqrt(cp_mean7 / (cp_mean7 + 25.0 ** 7))
+    l_offset = (l_mean - 50.0) ** 2
+    s_l = 1.0 + 0.015 * l_offset / np.sqrt(20.0 + l_offset)
+    s_c = 1.0 + 0.045 * cp_mean
+    s_h = 1.0 + 0.015 * cp_mean * t
+    r_t = -np.sin(np.radians(2.0 * delta_theta)) * r_c
+
+    term_l = delta_lp / s_l
+    term_c = delta_cp / s_c
+    term_h = delta_hp / s_h
+    return np.sqrt(np.maximum(term_l ** 2 + term_c ** 2 + term_h ** 2 + r_t * term_c * term_h, 0.0))
+
+
+def rgb_distances(palette, rgb):
+    """RGB欧氏距离的平方：(n, 3) -> (n, 调色板颜色数)"""
+    diff = palette.rgb.astype(np.int64)[None, :, :] - np.asarray(rgb, dtype=np.int64)[:, None, :]
+    return np.sum(diff ** 2, axis=2)
+
+
+def lab_distances(palette, rgb):
+    """LAB欧氏距离的平方（CIE76）：(n, 3) -> (n, 调色板颜色数)"""
+    target_lab = rgb_to_lab_array(rgb)
+    return np.sum((target_lab[:, None, :] - palette.lab[None, :, :]) ** 2, axis=2)
+
+
+def hsv_weighted_distances(palette, rgb):
+    """HSV加权距离：(n, 3) -> (n, 调色板颜色数)"""
+    target_hsv = rgb_to_hsv_array(rgb)[:, None, :]
+    palette_hsv = palette.hsv[None, :, :]
+    h_abs = np.abs(target_hsv[..., 0] - palette_hsv[..., 0])
+    h_diff = np.minimum(h_abs, 360 - h_abs) / 180.0
+    sv_diff = target_hsv[..., 1:] - palette_hsv[..., 1:]
+    return HSV_WEIGHTS[0] * h_diff**2 + np.sum(HSV_WEIGHTS[1:] * sv_diff**2, axis=2)
+
+
+def cie94_distances(palette, rgb):
+    """CIE94色差（像素颜色为参考色）：(n, 3) -> (n, 调色板颜色数)"""
+    return delta_e_cie94(rgb_to_lab_array(rgb)[:, None, :], palette.lab[None, :, :])
+
+
+def ciede2000_distances(palette, rgb):
+    """CIEDE2000色差：(n, 3) -> (n, 调色板颜色数)"""
+    return delta_e_ciede2000(rgb_to_lab_array(rgb)[:, None, :], palette.lab[None, :, :])
+
+
+# 匹配方法名称 -> 匹配函数
+MATCHING_METHODS = {
+    'RGB欧氏距离': closest_color_rgb,
+    'LAB色彩空间': closest_color_lab,
+    'HSV加权': closest_color_hsv_weighted,
+    'CIE94': closest_color_cie94,
+    'CIEDE2000': closest_color_ciede2000,
+}
+
+# 匹配方法名称 -> 批量距离核函数
+DISTANCE_KERNELS = {
+    'RGB欧氏距离': rgb_distances,
+    'LAB色彩空间': lab_distances,
+    'HSV加权': hsv_weighted_distances,
+    'CIE94': cie94_distances,
+    'CIEDE2000': ciede2000_distances,
+}
+
+MATCH_CHUNK_ELEMENTS = 1 << 20  # 每块距离矩阵的元素数上限
+
+
+def nearest_indices(palette, rgb, method):
+    """批量匹配：(n, 3) 的RGB数组 -> 最接近颜色的调色板索引 (n,)"""
+    rgb = np.asarray(rgb).reshape(-1, 3)
+    kernel = DISTANCE_KERNELS[method]
+    chunk = max(1, MATCH_CHUNK_ELEMENTS // max(1, len(palette)))
+    result = np.empty(len(rgb), dtype=np.intp)
+    for start in range(0, len(rgb), chunk):
+        result[start:start + chunk] = np.argmin(kernel(palette, rgb[start:start + chunk]), axis=1)
+    return result
+
+
+NEAR_TIE_RATIO = 0.05  # 次近与最近距离之差不超过次近距离的5%时视为接近并列
+SQUARED_DISTANCE_METHODS = {'RGB欧氏距离', 'LAB色彩空间', 'HSV加权'}  # 核函数返回距离平方的方法
+
+
+def nearest_with_margin(palette, rgb, method):
+    """批量匹配并在同一次距离计算中取出最近和次近距离，返回 (索引, 最近距离, 次近距离)
+
+    索引与 nearest_indices 相同；距离为各方法的线性尺度（距离平方取平方根），
+    调色板只有一种颜色时次近距离为 inf。
+    """
+    rgb = np.asarray(rgb).reshape(-1, 3)
+    kernel = DISTANCE_KERNELS[method]
+    chunk = max(1, MATCH_CHUNK_ELEMENTS // max(1, len(palette)))
+    result = np.empty(len(rgb), dtype=np.intp)
+    best = np.empty(len(rgb), dtype=np.float64)
+    second = np.full(len(rgb), np.inf, dtype=np.float64)
+    for start in range(0, len(rgb), chunk):
+        distances = kernel(palette, rgb[start:start + chunk])
+        nearest = np.argmin(distances, axis=1)
+        result[start:start + chunk] = nearest
+        best[start:start + chunk] = distances[np.arange(len(nearest)), nearest]
+        if len(palette) > 1:
+            second[start:start + chunk] = np.partition(distances, 1, axis=1)[:, 1]
+    if method in SQUARED_DISTANCE_METHODS:
+        best = np.sqrt(best)
+        second = np.sqrt(second)
+    return result, best, second
+
+
+def near_ties(best, second, ratio=NEAR_TIE_RATIO):
+    """最近和次近距离是否接近并列"""
+    return np.isfinite(second) & (second - best <= ratio * second)
+
+
+def match_delta_e(palette, rgb, indices):
+    """源颜色与匹配到的调色板颜色之间的 CIEDE2000 色差"""
+    return delta_e_ciede2000(rgb_to_lab_array(np.asarray(rgb).reshape(-1, 3)), palette.lab[indices])
+
+
+class PaletteMatcher:
+    """调色板 + 匹配方法：可作为单色匹配函数调用，也支持批量匹配"""
+
+    def __init__(self, palette, method):
+        self.palette = palette
+        self.method = method
+
+    def __call__(self, target_rgb):
+        return self.palette.codes[int(nearest_indices(self.palette, target_rgb, self.method)[0])]
+
+    def match_many(self, rgb):
+        """批量匹配 (n, 3) 的RGB数组，返回色号列表"""
+        codes = self.palette.codes
+        return [codes[i] for i in nearest_indices(self.palette, rgb, self.method).tolist()]
+
+    def match_many_with_quality(self, rgb):
+        """批量匹配并计算匹配质量，返回 (色号列表, ΔE数组, 接近并列布尔数组)"""
+        indices, best, second = nearest_with_margin(self.palette, rgb, self.method)
+        codes = self.palette.codes
+        return ([codes[i] for i in indices.tolist()], match_delta_e(self.palette, rgb, indices),
+                near_ties(best, second))
+
+
+SUBSTITUTE_COUNT = 8  # 每个色号预先计算的替代色数量
+
+
+def distance_matrix(palette, method):
+    """调色板色号两两之间的距离矩阵 [源色号, 目标色号]（首次计算后缓存在调色板上）"""
+    matrix = palette.distance_matrices.get(method)
+    if matrix is None:
+        kernel = DISTANCE_KERNELS[method]
+        matrix = np.empty((len(palette), len(palette)), dtype=np.float64)
+        chunk = max(1, MATCH_CHUNK_ELEMENTS // max(1, len(palette)))
+        for start in range(0, len(palette), chunk):
+            matrix[start:start + chunk] = kernel(palette, palette.rgb[start:start + chunk])
+        palette.distance_matrices[method] = matrix
+    return matrix
+
+
+def substitute_table(palette, method, k=SUBSTITUTE_COUNT):
+    """每个色号最接近的 k 个其他色号（调色板索引，按距离升序），首次计算后缓存"""
+    key = (method, k)
+    table = palette.substitute_tables.get(key)
+    if table is None:
+        matrix = distance_matrix(palette, method).copy()
+        np.fill_diagonal(matrix, np.inf)
+        table = np.argsort(matrix, axis=1, kind='stable')[:, :min(k, len(palette) - 1)]
+        palette.substitute_tables[key] = table
+    return table
+
+
+def nearest_substitutes(palette, code, method, k=5):
+    """与色号最接近的 k 个替代色号，返回 [(色号, 距离)]"""
+    index = palette.code_index.get(code)
+    if index is None:
+        return []
+    table = substitute_table(palette, method, max(k, SUBSTITUTE_COUNT))
+    distances = distance_matrix(palette, method)[index]
+    return [(palette.codes[i], float(distances[i])) for i in table[index, :k].tolist()]
+
+
+def palette_code_mapping(source, target, method, codes=None):
+    """将色号映射到目标调色板中最接近的颜色，返回 {色号: 目标色号}
+
+    源调色板中的色号按颜色批量匹配；源调色板中没有、目标调色板中有的色号保持不变。
+    """
+    codes = source.codes if codes is None else codes
+    known = [code for code in dict.fromkeys(codes) if code in source.code_index]
+    positions = np.array([source.code_index[code] for code in known], dtype=np.intp)
+    nearest = nearest_indices(target, source.rgb[positions], method) if known else []
+    mapping = {code: target.codes[i] for code, i in zip(known, list(nearest))}
+    missing = [code for code in codes if code not in mapping and code not in target.code_index]
+    if missing:
+        raise ValueError(f'颜色源中缺少色号: {", ".join(missing)}')
+    for code in codes:
+        mapping.setdefault(code, code)
+    return mapping
@@ -0,0 +1,229 @@
+"""调色板编译与缓存
+
+将颜色数据文件（sample.json 网格格式或 color/*.json 调色板格式）编译为
+包含色号表和 RGB/LAB/HSV 数组的二进制缓存（.npz）。源文件的修改时间和大小不变时
+直接使用缓存；修改时间变化但内容哈希相同时也复用缓存，避免重复解析 JSON。
+
+命令行用法：python palette.py [文件 ...]  （默认编译 sample.json 和 color/*.json）
+"""
+import hashlib
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+from profiling import count
+
+PALETTE_CACHE_DIR = '.palette_cache'  # 编译缓存目录
+CACHE_VERSION = 1
+
+_loaded_palettes = {}  # 进程内缓存 {(绝对路径, 缓存目录): (修改时间, 大小, {名称: Palette})}
+
+
+def rgb_to_lab_array(rgb):
+    """将 (..., 3) 的RGB数组转换为LAB色彩空间"""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+
+    # sRGB到XYZ的转换
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    r, g, b = linear[..., 0], linear[..., 1], linear[..., 2]
+
+    x = r * 0.4124 + g * 0.3576 + b * 0.1805
+    y = r * 0.2126 + g * 0.7152 + b * 0.0722
+    z = r * 0.0193 + g * 0.1192 + b * 0.9505
+
+    # XYZ到LAB的转换
+    def f(t):
+        return np.where(t > (6.0/29.0)**3, t**(1.0/3.0), (1.0/3.0) * ((29.0/6.0)**2) * t + 4.0/29.0)
+
+    xn, yn, zn = 0.95047, 1.0, 1.08883
+    fx, fy, fz = f(x / xn), f(y / yn), f(z / zn)
+
+    return np.stack([116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)], axis=-1)
+
+
+def rgb_to_hsv_array(rgb):
+    """将 (..., 3) 的RGB数组转换为HSV色彩空间（H: 0-360，S/V: 0-1）"""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    max_val = rgb.max(axis=-1)
+    min_val = rgb.min(axis=-1)
+    diff = max_val - min_val
+    safe_diff = np.where(diff == 0, 1.0, diff)
+
+    # 计算色相 H（与逐像素实现的判断顺序一致：R、G、B）
+    h = np.where(max_val == r, 60 * ((g - b) / safe_diff % 6),
+                 np.where(max_val == g, 60 * ((b - r) / safe_diff + 2),
+                          60 * ((r - g) / safe_diff + 4)))
+    h = np.where(diff == 0, 0.0, h)
+
+    # 计算饱和度 S 和明度 V
+    s = np.where(max_val == 0, 0.0, diff / np.where(max_val == 0, 1.0, max_val))
+    return np.stack([h, s, max_val], axis=-1)
+
+
+class Palette:
+    """编译后的调色板：色号表和对应的 RGB/LAB/HSV 数组"""
+
+    def __init__(self, name, codes, rgb, lab=None, hsv=None):
+        self.name = name
+        self.codes = list(codes)
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+        self.lab = rgb_to_lab_array(self.rgb) if lab is None else lab
+        self.hsv = rgb_to_hsv_array(self.rgb) if hsv is None else hsv
+        self.distance_matrices = {}  # 匹配方法 -> 色号两两距离矩阵（见 matching.distance_matrix）
+        self.substitute_tables = {}  # (匹配方法, k) -> 最近替代色号表
+
+    def __len__(self):
+        return len(self.codes)
+
+    def color_lookup(self):
+        """生成 {色号: RGB数组} 查找表"""
+        rgb = self.rgb.astype(np.int64)
+        return {code: rgb[i] for i, code in enumerate(self.codes)}
+
+
+def merge_palettes(palettes, name='merged'):
+    """合并多个调色板：色号和颜色都相同时只保留一个，色号相同但颜色不同时加上来源前缀"""
+    codes = []
+    colors = []
+    seen = {}  # 色号 -> RGB
+    for palette in palettes:
+        for code, rgb in zip(palette.codes, palette.rgb.tolist()):
+            if code in seen:
+                if seen[code] == rgb:
+                    continue
+                code = f'{palette.name}:{code}'
+            seen[code] = rgb
+            codes.append(code)
+            colors.append(rgb)
+    return Palette(name, codes, np.array(colors, dtype=np.uint8).reshape(-1, 3))
+
+
+def parse_palette_file(path):
+    """解析颜色数据文件，返回 (色号列表, RGB数组)"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    codes = []
+    colors = []
+    if isinstance(data, dict) and isinstance(data.get('data'), list):
+        # 调色板格式（十六进制颜色代码）
+        for item in data['data']:
+            hex_color = item['color'].lstrip('#')
+            codes.append(item['colorCode'])
+            colors.append([int(hex_color[i:i+2], 16) for i in (0, 2, 4)])
+    else:
+        # 网格格式（跳过占位颜色）
+        for code, value in data.items():
+            if not value.get('is_placeholder', False):
+                codes.append(code)
+                colors.append(value['rgb'])
+    return codes, np.array(colors, dtype=np.uint8).reshape(-1, 3)
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def cache_path_for(path, cache_dir=PALETTE_CACHE_DIR):
+    """获取颜色数据文件对应的缓存文件路径"""
+    relative = os.path.relpath(os.path.abspath(path))
+    name = os.path.splitext(relative)[0].replace(os.sep, '_').replace('.', '_')
+    return os.path.join(cache_dir, f'{name}.npz')
+
+
+def _write_cache(cache_file, palette, stat, file_hash):
+    """写入编译缓存（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    buffer = io.BytesIO()
+    np.savez(buffer, version=CACHE_VERSION, codes=np.array(palette.codes, dtype=str),
+             rgb=palette.rgb, lab=palette.lab, hsv=palette.hsv,
+             source_mtime_ns=stat.st_mtime_ns, source_size=stat.st_size,
+             source_hash=file_hash)
+    temp_file = cache_file + '.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(temp_file, cache_file)
+
+
+def _read_cache(cache_file):
+    """读取编译缓存，无效时返回 None"""
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            if int(data['version']) != CACHE_VERSION:
+                return None
+            return {key: data[key] for key in data.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def compile_palette(path, name=None, cache_dir=PALETTE_CACHE_DIR):
+    """解析颜色数据文件并写入编译缓存"""
+    stat = os.stat(path)
+    codes, rgb = parse_palette_file(path)
+    palette = Palette(name or os.path.splitext(os.path.basename(path))[0], codes, rgb)
+    _write_cache(cache_path_for(path, cache_dir), palette, stat, _file_hash(path))
+    return palette
+
+
+def load_palette(path, name=None, cache_dir=PALETTE_CACHE_DIR):
+    """加载调色板：依次使用进程内缓存、编译缓存，必要时重新编译"""
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    stat = os.stat(path)
+    key = (os.path.abspath(path), cache_dir)
+
+    loaded = _loaded_palettes.get(key)
+    if loaded and loaded[:2] == (stat.st_mtime_ns, stat.st_size):
+        named = loaded[2]
+        count('palette_cache_hits')
+    else:
+        palette = None
+        cache_file = cache_path_for(path, cache_dir)
+        cached = _read_cache(cache_file)
+        if cached is not None:
+            fresh = (int(cached['source_mtime_ns']) == stat.st_mtime_ns and
+                     int(cached['source_size']) == stat.st_size)
+            file_hash = None
+            if not fresh:
+                # 修改时间变化时比较内容哈希，内容相同则复用并刷新缓存中的修改时间
+                file_hash = _file_hash(path)
+                fresh = str(cached['source_hash']) == file_hash
+            if fresh:
+                palette = Palette(name, cached['codes'].tolist(), cached['rgb'],
+                                  cached['lab'], cached['hsv'])
+                if file_hash is not None:
+                    _write_cache(cache_file, palette, stat, file_hash)
+        if palette is None:
+            palette = compile_palette(path, name, cache_dir)
+            count('palette_cache_misses')
+        else:
+            count('palette_cache_hits')
+        named = {name: palette}
+        _loaded_palettes[key] = (stat.st_mtime_ns, stat.st_size, named)
+
+    palette = named.get(name)
+    if palette is None:
+        # 同一文件以不同名称加载时共享数组，每个名称保留一个实例（距离矩阵等预计算结果在切换后保留）
+        base = next(iter(named.values()))
+        palette = named[name] = Palette(name, base.codes, base.rgb, base.lab, base.hsv)
+    return palette
+
+
+def default_palette_files():
+    """默认的颜色数据文件：sample.json 和 color 目录下的所有 JSON 文件"""
+    files = ['sample.json'] if os.path.exists('sample.json') else []
+    if os.path.exists('color'):
+        files += [os.path.join('color', file) for file in sorted(os.listdir('color'))
+                  if file.endswith('.json')]
+    return files
+
+
+if __name__ == '__main__':
+    for file_path in sys.argv[1:] or default_palette_files():
+        compiled = compile_palette(file_path)
+        print(f'{file_path}: {len(compiled)} 种颜色 -> {cache_path_for(file_path)}')
@@ -0,0 +1,147 @@
+"""图案数据导出（不渲染图片）
+
+直接从 ImageGrid 的调色板索引数组生成：
+- JSON / CSV 色号图（按行排列的色号网格，空白格子为空字符串）
+- 用料清单（每个色号的数量）
+- 紧凑的二进制色号图（.bmap）
+"""
+import csv
+import json
+import os
+import struct
+
+import numpy as np
+
+BINARY_MAGIC = b'BMAP'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sBBHII')  # 魔数、版本、索引字节数、色号数、宽、高
+MAX_BINARY_CODES = 0xFFFF  # 二进制色号图的色号数上限（文件头中为 uint16）
+MAX_CODE_BYTES = 0xFF  # 二进制色号图中单个色号的 UTF-8 字节数上限（长度为 uint8）
+EXPORT_FORMATS = {
+    '.json': 'JSON 色号图',
+    '.csv': 'CSV 色号图',
+    '.bmap': '二进制色号图',
+}
+
+
+def color_counts(grid):
+    """统计每个色号索引的数量（长度与色号表一致）"""
+    indices = np.asarray(grid.indices)
+    valid = indices[indices != grid.empty_index]
+    return np.bincount(valid.ravel(), minlength=len(grid.codes))
+
+
+def code_grid(grid):
+    """返回按行排列的色号网格（空白格子为空字符串）"""
+    table = np.array(list(grid.codes) + [''], dtype=object)
+    return table[np.minimum(grid.indices, len(grid.codes))]
+
+
+def bill_of_materials(grid, color_lookup=None):
+    """生成用料清单：按数量降序排列的 [{colorCode, count, color}]"""
+    counts = color_counts(grid)
+    used = np.flatnonzero(counts)
+    # 数量降序，数量相同时按色号表顺序
+    used = used[np.argsort(-counts[used], kind='stable')]
+    bom = []
+    for index in used.tolist():
+        color_code = grid.codes[index]
+        item = {'colorCode': color_code, 'count': int(counts[index])}
+        if color_lookup is not None and color_code in color_lookup:
+            r, g, b = (int(c) for c in color_lookup[color_code])
+            item['color'] = f'#{r:02X}{g:02X}{b:02X}'
+        bom.append(item)
+    return bom
+
+
+def export_json(grid, path, color_lookup=None, source_name=None):
+    """导出 JSON 色号图（包含用料清单）"""
+    data = {
+        'source': source_name,
+        'width': grid.width,
+        'height': grid.height,
+        'grid': code_grid(grid).tolist(),
+        'bom': bill_of_materials(grid, color_lookup),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def export_csv(grid, path):
+    """导出 CSV 色号图（每行对应网格的一行）"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(code_grid(grid).tolist())
+
+
+def export_bom_csv(grid, path, color_lookup=None):
+    """导出 CSV 用料清单"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['colorCode', 'color', 'count'])
+        for item in bill_of_materials(grid, color_lookup):
+            writer.writerow([item['colorCode'], item.get('color', ''), item['count']])
+
+
+def export_binary(grid, path):
+    """导出二进制色号图
+
+    布局（小端）：文件头 BINARY_HEADER，色号表（每项 1 字节长度 + UTF-8 色号），
+    每个色号的数量（uint32 × 色号数），按行排列的索引数组（空白格子为索引类型最大值）。
+    色号数或色号长度超出格式范围时抛出 ValueError（不写出文件）。
+    """
+    if len(grid.codes) > MAX_BINARY_CODES:
+        raise ValueError(f'色号数 {len(grid.codes)} 超过二进制色号图的上限 {MAX_BINARY_CODES}')
+    encoded_codes = [color_code.encode('utf-8') for color_code in grid.codes]
+    for color_code, encoded in zip(grid.codes, encoded_codes):
+        if len(encoded) > MAX_CODE_BYTES:
+            raise ValueError(f'色号过长（{len(encoded)} 字节，上限 {MAX_CODE_BYTES}）: {color_code[:20]}...')
+    indices = np.ascontiguousarray(grid.indices)
+    counts = color_counts(grid)
+    with open(path, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, indices.dtype.itemsize,
+                                   len(grid.codes), grid.width, grid.height))
+        for encoded in encoded_codes:
+            f.write(struct.pack('<B', len(encoded)))
+            f.write(encoded)
+        f.write(counts.astype('<u4').tobytes())
+        f.write(indices.astype(indices.dtype.newbyteorder('<'), copy=False).tobytes())
+
+
+def load_binary(path):
+    """读取二进制色号图，返回 (色号表, 数量数组, 索引数组)"""
+    with open(path, 'rb') as f:
+        magic, version, itemsize, num_codes, width, height = BINARY_HEADER.unpack(
+            f.read(BINARY_HEADER.size))
+        if magic != BINARY_MAGIC:
+            raise ValueError('不是有效的二进制色号图')
+        if version > BINARY_VERSION:
+            raise ValueError(f'不支持的二进制色号图版本: {version}')
+        codes = []
+        for _ in range(num_codes):
+            length, = struct.unpack('<B', f.read(1))
+            codes.append(f.read(length).decode('utf-8'))
+        counts = np.frombuffer(f.read(num_codes * 4), dtype='<u4')
+        dtype = np.dtype(f'<u{itemsize}')
+        indices = np.frombuffer(f.read(width * height * itemsize), dtype=dtype).reshape(height, width)
+    return codes, counts, indices
+
+
+def export_pattern(grid, path, color_lookup=None, source_name=None):
+    """根据扩展名导出图案数据，CSV 格式同时导出 <文件名>_bom.csv 用料清单
+
+    返回写出的文件路径列表。
+    """
+    base, ext = os.path.splitext(path)
+    ext = ext.lower()
+    if ext == '.json':
+        export_json(grid, path, color_lookup, source_name)
+        return [path]
+    if ext == '.csv':
+        bom_path = f'{base}_bom.csv'
+        export_csv(grid, path)
+        export_bom_csv(grid, bom_path, color_lookup)
+        return [path, bom_path]
+    if ext == '.bmap':
+        export_binary(grid, path)
+        return [path]
+    raise ValueError(f'不支持的导出格式: {ext}')
@@ -0,0 +1,280 @@
+"""图片处理流水线（不依赖 Qt）
+
+按行带读取源图片，完成透明行列裁剪、缩小到目标网格尺寸、颜色匹配和统计；
+流式模式下按行带渲染并逐行写出 PNG，内存占用与行带大小相关而与输出尺寸无关。
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+from background import DEFAULT_BACKGROUND
+from image_grid import ColorCounter, ImageGrid, empty_index, index_dtype
+from profiling import count, span
+from rendering import (GRID_BACKGROUND, PNGStreamWriter, build_block_tiles, calculate_stats_height,
+                       draw_color_statistics, draw_column_labels, draw_row_labels, load_fonts,
+                       render_grid_rows)
+from resampling import RESAMPLE_AREA, BandDownscaler, fit_grid_size
+
+STREAM_BAND_BYTES = 64 << 20  # 流式渲染时每个输出行带的目标字节数
+SOURCE_BAND_ROWS = 256  # 读取源图片时每个行带的行数
+
+
+TRANSPARENT_MODES = ('RGBA', 'LA', 'PA', 'RGBa', 'La')  # 带透明通道的图片模式
+
+
+def background_mask(pixels, background=None):
+    """计算背景像素掩码（background 为 BackgroundDetector，默认：RGBA模式下A通道为0，RGB模式下各通道均接近白色）"""
+    return (background or DEFAULT_BACKGROUND).mask(pixels)
+
+
+def normalize_source(img):
+    """将源图片统一为 RGB 或 RGBA 模式（带透明通道或透明色的 P、L、LA 等模式转换为 RGBA，其余转换为 RGB）"""
+    if img.mode in ('RGB', 'RGBA'):
+        return img
+    if img.mode in TRANSPARENT_MODES or 'transparency' in img.info:
+        return img.convert('RGBA')
+    return img.convert('RGB')
+
+
+def load_source_pixels(img):
+    """将源图片转换为像素数组（RGB 或 RGBA）"""
+    return np.asarray(normalize_source(img))
+
+
+def trim_transparent(pixels, mask=None):
+    """删除全透明的行和列，返回 (裁剪后的像素, 保留行掩码, 保留列掩码)（可传入预先计算的背景掩码）"""
+    if mask is None:
+        mask = background_mask(pixels)
+    opaque = ~mask
+    keep_rows = opaque.any(axis=1)
+    keep_cols = opaque.any(axis=0)
+    return pixels[keep_rows][:, keep_cols], keep_rows, keep_cols
+
+
+def iter_source_bands(img, band_rows=SOURCE_BAND_ROWS):
+    """按行带读取源图片，生成 (起始行, 像素数组)"""
+    width, height = img.size
+    img = normalize_source(img)
+    for y0 in range(0, height, band_rows):
+        y1 = min(height, y0 + band_rows)
+        yield y0, np.asarray(img.crop((0, y0, width, y1)))
+
+
+def source_background_mask(img, background, band_rows=SOURCE_BAND_ROWS):
+    """逐行带计算整幅源图片的背景掩码（边缘连通检测需要整幅图片，掩码每像素 1 字节）"""
+    width, height = img.size
+    alpha = color = None
+    for y0, pixels in iter_source_bands(img, band_rows):
+        band_alpha = background.alpha_mask(pixels)
+        band_color = background.color_mask(pixels)
+        if band_alpha is not None:
+            if alpha is None:
+                alpha = np.empty((height, width), dtype=bool)
+            alpha[y0:y0 + len(pixels)] = band_alpha
+        if band_color is not None:
+            if color is None:
+                color = np.empty((height, width), dtype=bool)
+            color[y0:y0 + len(pixels)] = band_color
+    if color is not None and background.edge_connected:
+        color = background.connect(alpha, color)
+    if alpha is None:
+        return color
+    return alpha if color is None else alpha | color
+
+
+def find_trim_masks(img, band_rows=SOURCE_BAND_ROWS, background=None, mask=None):
+    """逐行带扫描，返回需要保留的行、列布尔掩码（删除全透明的行和列）
+
+    background 为背景检测规则，mask 为预先计算的整幅背景掩码（见 source_background_mask）。
+    """
+    width, height = img.size
+    keep_rows = np.zeros(height, dtype=bool)
+    keep_cols = np.zeros(width, dtype=bool)
+    for y0, pixels in iter_source_bands(img, band_rows):
+        if mask is not None:
+            opaque = ~mask[y0:y0 + len(pixels)]
+        else:
+            opaque = ~background_mask(pixels, background)
+        keep_rows[y0:y0 + len(pixels)] = opaque.any(axis=1)
+        keep_cols |= opaque.any(axis=0)
+    return keep_rows, keep_cols
+
+
+class UniqueColorMatcher:
+    """按颜色去重的匹配器：每种颜色只调用一次匹配函数，结果跨行带缓存"""
+
+    def __init__(self, match_color, codes, color_replacement=None, quality=None):
+        self.match_color = match_color  # 匹配函数：RGB -> 色号（提供 match_many 时批量匹配）
+        self.codes = list(codes)
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.color_replacement = color_replacement or {}
+        self.dtype = index_dtype(len(self.codes))
+        self.empty = empty_index(self.dtype)
+        self.cache = {}  # 打包后的RGB值 -> 色号索引
+        self.quality = quality  # MatchQuality 累加器（匹配函数提供 match_many_with_quality 时统计）
+        self.quality_cache = {}  # 打包后的RGB值 -> (匹配到的色号, ΔE, 是否接近并列)
+
+    def match(self, pixels, mask=None):
+        """匹配像素数组，返回调色板索引数组（透明像素为空白标记，可传入预先计算的透明掩码）"""
+        if mask is None:
+            mask = background_mask(pixels)
+        rgb = pixels[..., :3].astype(np.uint32)
+        packed = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+        result = np.full(packed.shape, self.empty, dtype=self.dtype)
+        opaque = ~mask
+        if not opaque.any():
+            return result
+
+        unique_colors, inverse = np.unique(packed[opaque], return_inverse=True)
+        colors = unique_colors.tolist()
+        measure = self.quality is not None and hasattr(self.match_color, 'match_many_with_quality')
+        if measure:
+            missing = [color for color in colors if color not in self.quality_cache]
+        else:
+            missing = [color for color in colors if color not in self.cache]
+        if missing:
+            missing_packed = np.array(missing, dtype=np.int64)
+            missing_rgb = np.stack([missing_packed >> 16, (missing_packed >> 8) & 0xFF, missing_packed & 0xFF], axis=1)
+            if measure:
+                # 同一次距离计算得到匹配结果、ΔE 和是否接近并列
+                matched, delta_e, ties = self.match_color.match_many_with_quality(missing_rgb)
+                for color, color_code, error, tie in zip(missing, matched, delta_e.tolist(), ties.tolist()):
+                    self.quality_cache[color] = (color_code, error, tie)
+            elif hasattr(self.match_color, 'match_many'):
+                # 支持批量匹配时一次计算所有未缓存颜色
+                matched = self.match_color.match_many(missing_rgb)
+            else:
+                matched = [self.match_color(rgb) for rgb in missing_rgb]
+            for color, color_code in zip(missing, matched):
+                # 应用颜色替换
+                color_code = self.color_replacement.get(color_code, color_code)
+                self.cache[color] = self.code_index[color_code]
+        count('color_cache_misses', len(missing))
+        count('color_cache_hits', len(colors) - len(missing))
+        lut = np.array([self.cache[color] for color in colors], dtype=self.dtype)
+        result[opaque] = lut[inverse]
+        if measure:
+            matched, delta_e, ties = zip(*[self.quality_cache[color] for color in colors])
+            self.quality.add(matched, delta_e, ties, np.bincount(inverse, minlength=len(colors)))
+        return result
+
+
+def match_pixels(pixels, match_color, codes, color_replacement=None):
+    """匹配整幅像素数组（每种颜色只匹配一次），返回调色板索引数组"""
+    return UniqueColorMatcher(match_color, codes, color_replacement).match(pixels)
+
+
+def build_grid(indices, codes, block_size=20, axis_size=30):
+    """根据匹配结果创建图片网格（原始索引与当前索引相同）"""
+    return ImageGrid.from_index_arrays(indices, indices.copy(), codes, block_size, axis_size)
+
+
+def process_image_streaming(image_path, output_path, match_color, color_lookup, color_replacement=None,
+                            block_size=20, axis_size=30, show_color_codes=True, band_rows=None,
+                            compress_level=6, matcher=None, background=None, target_size=None,
+                            resample=RESAMPLE_AREA):
+    """流式处理大图：按行带裁剪、缩小、匹配、渲染并逐行写出 PNG
+
+    输出图片与 composite_full_image 的版式相同（坐标轴、色块、色号统计）。
+    matcher 为可选的匹配器（如抖动匹配器），默认用 match_color 按颜色去重匹配（提供 matcher 时
+    match_color 可为 None）；background 为背景检测规则；target_size 为目标网格尺寸 (宽, 高)
+    （可只指定一边），按 resample 方式逐行带缩小，结果与整幅缩小相同。
+    内存占用为源图片、调色板索引网格（每格 1~2 字节）和一个输出行带。
+    返回包含索引网格、统计和尺寸信息的字典。
+    """
+    img = Image.open(image_path)
+    width, height = img.size
+    codes = list(color_lookup.keys())
+
+    # 第一遍：计算需要保留的行和列
+    with span('trim'):
+        mask = None
+        if background is not None and background.edge_connected:
+            mask = source_background_mask(img, background)
+        keep_rows, keep_cols = find_trim_masks(img, background=background, mask=mask)
+    new_height = int(keep_rows.sum())
+    new_width = int(keep_cols.sum())
+    if new_height <= 0 or new_width <= 0:
+        raise ValueError('图片完全透明，无法处理！')
+
+    # 第二遍：按行带缩小、匹配颜色并统计
+    grid_width, grid_height = fit_grid_size(new_width, new_height, *(target_size or (None, None)))
+    downscaler = None
+    if (grid_width, grid_height) != (new_width, new_height):
+        downscaler = BandDownscaler(new_width, new_height, grid_width, grid_height, resample)
+    if matcher is None:
+        matcher = UniqueColorMatcher(match_color, codes, color_replacement)
+    counter = ColorCounter(codes)
+    indices = np.empty((grid_height, grid_width), dtype=matcher.dtype)
+    new_y = 0
+    with span('match'):
+        for y0, pixels in iter_source_bands(img):
+            rows = keep_rows[y0:y0 + len(pixels)]
+            band_mask = mask[y0:y0 + len(pixels)] if mask is not None else background_mask(pixels, background)
+            pixels = pixels[rows][:, keep_cols]
+            band_mask = band_mask[rows][:, keep_cols]
+            if downscaler is not None:
+                with span('resample'):
+                    pixels, band_mask = downscaler.add(pixels, band_mask)
+            if not len(pixels):
+                continue
+            band_indices = matcher.match(pixels, band_mask)
+            indices[new_y:new_y + len(band_indices)] = band_indices
+            counter.add(band_indices)
+            new_y += len(band_indices)
+        color_statistics = counter.statistics()
+
+    # 计算输出尺寸
+    output_width = grid_width * block_size + axis_size
+    base_height = grid_height * block_size + axis_size
+    stats_height = calculate_stats_height(color_statistics, output_width)
+    output_height = base_height + stats_height
+
+    if band_rows is None:
+        band_rows = max(1, STREAM_BAND_BYTES // (output_width * 3 * block_size))
+
+    font, axis_font = load_fonts()
+    tiles = build_block_tiles(codes, color_lookup, block_size, show_color_codes, font)
+
+    # 第三遍：按行带渲染并写出
+    with span('render'), PNGStreamWriter(output_path, output_width, output_height, compress_level) as writer:
+        # 顶部空白区域
+        writer.write_rows(np.full((axis_size, output_width, 3), GRID_BACKGROUND, dtype=np.uint8))
+
+        # 色块区域
+        for row_start in range(0, grid_height, band_rows):
+            row_stop = min(grid_height, row_start + band_rows)
+            band = render_grid_rows(indices[row_start:row_stop], tiles, axis_size)
+            band_img = Image.fromarray(band)
+            draw = ImageDraw.Draw(band_img)
+            # 多绘制相邻行的刻度，保证跨越行带边界的文字被正确裁剪
+            draw_row_labels(draw, grid_height, block_size, axis_size, axis_font,
+                            row_start - 1, row_stop + 1,
+                            y_offset=row_start * block_size + axis_size)
+            writer.write_rows(np.asarray(band_img))
+
+        # 底部区域（横坐标和色号统计）
+        footer_rows = max(1, STREAM_BAND_BYTES // (output_width * 3))
+        for footer_start in range(0, stats_height, footer_rows):
+            footer_stop = min(stats_height, footer_start + footer_rows)
+            footer_img = Image.new('RGB', (output_width, footer_stop - footer_start), GRID_BACKGROUND)
+            draw = ImageDraw.Draw(footer_img)
+            y_offset = base_height + footer_start
+            draw_column_labels(draw, grid_width, grid_height, block_size, axis_size, axis_font,
+                               y_offset=y_offset)
+            draw_color_statistics(draw, color_statistics, color_lookup, output_width, output_height,
+                                  axis_font, y_offset=y_offset)
+            writer.write_rows(np.asarray(footer_img))
+
+    return {
+        'indices': indices,
+        'codes': codes,
+        'color_statistics': color_statistics,
+        'original_size': (width, height),
+        'trimmed_size': (new_width, new_height),
+        'grid_size': (grid_width, grid_height),
+        'output_size': (output_width, output_height),
+        'removed_rows': height - new_height,
+        'removed_cols': width - new_width,
+        'quality': matcher.quality.summary() if getattr(matcher, 'quality', None) else None,
+    }
@@ -0,0 +1,201 @@
+"""阶段计时与计数器（性能分析）
+
+用法：
+    with span('match'):            # 命名阶段，嵌套时名称为 "外层/内层"
+        ...
+    count('cells_rendered', n)     # 累加计数器
+
+    @profiled('process_image')     # 以函数为单位的阶段
+    def process_image(...): ...
+
+每个最外层阶段结束时生成一次“运行记录”（各子阶段耗时和计数器），
+可通过 summary() 显示、dump_json() 导出；开启 cProfile 后最外层阶段同时被 cProfile 采样。
+只有主线程上的阶段可以成为最外层阶段；工作线程上的阶段和计数器只在主线程的运行进行中
+计入该次运行（运行开始时清空），不会遗留到之后的运行记录中。
+"""
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# 计数器的显示名称
+COUNTER_LABELS = {
+    'cells_rendered': '渲染色块',
+    'pixmaps_generated': '生成贴图',
+    'color_cache_hits': '颜色缓存命中',
+    'color_cache_misses': '颜色缓存未命中',
+    'palette_cache_hits': '调色板缓存命中',
+    'palette_cache_misses': '调色板缓存未命中',
+    'result_cache_hits': '结果缓存命中',
+    'result_cache_misses': '结果缓存未命中',
+}
+
+
+class Profiler:
+    """记录命名阶段的耗时和计数器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._listeners = []
+        self._cprofile = None
+        self.reset()
+
+    def reset(self):
+        """清空所有累计数据"""
+        with self._lock:
+            self.spans = {}  # 阶段名 -> {'count', 'total', 'max'}
+            self.counters = {}  # 计数器名 -> 数值
+            self.last_run = None  # 最近一次最外层阶段的记录
+            self._run_spans = {}
+            self._run_counters = {}
+            self._run_active = False  # 是否处于最外层阶段中
+        if self._cprofile is not None:
+            self._cprofile = cProfile.Profile()
+
+    @property
+    def cprofile_enabled(self):
+        return self._cprofile is not None
+
+    def set_cprofile(self, enabled):
+        """开启或关闭 cProfile 采样（仅采样最外层阶段）"""
+        self._cprofile = cProfile.Profile() if enabled else None
+
+    def add_listener(self, callback):
+        """注册最外层阶段结束时的回调，参数为运行记录"""
+        self._listeners.append(callback)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name):
+        """计时一个命名阶段"""
+        stack = self._stack()
+        full_name = '/'.join(stack + [name])
+        top_level = not stack and threading.current_thread() is threading.main_thread()
+        profile = self._cprofile if top_level else None
+        stack.append(name)
+        if top_level:
+            with self._lock:
+                self._run_spans = {}
+                self._run_counters = {}
+                self._run_active = True
+        if profile is not None:
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+            stack.pop()
+            self._record(full_name, elapsed, top_level)
+
+    def _record(self, full_name, elapsed, top_level):
+        with self._lock:
+            stats = self.spans.setdefault(full_name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            if self._run_active:
+                self._run_spans[full_name] = self._run_spans.get(full_name, 0.0) + elapsed
+            if not top_level:
+                return
+            run = {'name': full_name, 'seconds': elapsed,
+                   'spans': self._run_spans, 'counters': self._run_counters}
+            self.last_run = run
+            self._run_spans = {}
+            self._run_counters = {}
+            self._run_active = False
+        for callback in self._listeners:
+            callback(run)
+
+    def count(self, name, amount=1):
+        """累加计数器"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if self._run_active:
+                self._run_counters[name] = self._run_counters.get(name, 0) + amount
+
+    def profiled(self, name=None):
+        """函数装饰器：将整个函数作为一个命名阶段"""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self, run=None):
+        """格式化一次运行记录（默认最近一次），用于状态栏显示"""
+        run = run or self.last_run
+        if not run:
+            return ''
+        prefix = run['name'] + '/'
+        parts = [f'{name[len(prefix):]} {seconds * 1000:.1f}'
+                 for name, seconds in run['spans'].items()
+                 if name.startswith(prefix) and '/' not in name[len(prefix):]]
+        text = f'{run["name"]} {run["seconds"] * 1000:.1f} ms'
+        if parts:
+            text += f' [{" · ".join(parts)}]'
+        if run['counters']:
+            text += ' ' + ' · '.join(f'{COUNTER_LABELS.get(name, name)} {value}'
+                                     for name, value in run['counters'].items())
+        return text
+
+    def cprofile_top(self, limit=30):
+        """返回 cProfile 累计耗时最多的函数列表"""
+        if self._cprofile is None:
+            return []
+        try:
+            stats = pstats.Stats(self._cprofile, stream=io.StringIO())
+        except TypeError:
+            return []  # 尚未采样
+        stats.sort_stats('cumulative')
+        top = []
+        for func in stats.fcn_list[:limit]:
+            primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[func]
+            file_name, line, function = func
+            top.append({'function': f'{file_name}:{line}({function})', 'calls': calls,
+                        'tottime': total_time, 'cumtime': cumulative_time})
+        return top
+
+    def to_dict(self):
+        """导出全部累计数据"""
+        with self._lock:
+            data = {
+                'spans': {name: dict(stats) for name, stats in self.spans.items()},
+                'counters': dict(self.counters),
+                'last_run': self.last_run,
+            }
+        if self._cprofile is not None:
+            data['cprofile'] = self.cprofile_top()
+        return data
+
+    def dump_json(self, path):
+        """将累计数据写入JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def dump_cprofile(self, path):
+        """将 cProfile 采样结果写入 .prof 文件（可用 pstats / snakeviz 查看）"""
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(path)
+
+
+PROFILER = Profiler()  # 全局实例
+span = PROFILER.span
+count = PROFILER.count
+profiled = PROFILER.profiled
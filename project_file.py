@@ -0,0 +1,163 @@
+"""工程文件读写
+
+工程文件保存编辑会话的全部状态，重新打开时无需重新匹配颜色。
+文件布局：8 字节魔数 + 4 字节头长度 + JSON 头 + 按 64 字节对齐的原始数组数据。
+JSON 头记录颜色源、色号表、替换映射等元数据，以及每个数组的偏移、形状和类型；
+较大的数组以内存映射方式加载；保存前将网格中的映射数组复制到内存，释放对工程文件的映射，
+保存到同一路径时才能替换文件（Windows 上被映射的文件无法替换）。
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from image_grid import ImageGrid
+
+PROJECT_MAGIC = b'CMPROJ\x00\x01'  # 魔数（末字节为格式版本）
+PROJECT_VERSION = 1
+PROJECT_EXTENSION = '.cmproj'
+ARRAY_ALIGNMENT = 64  # 数组数据对齐字节数
+MMAP_THRESHOLD = 1 << 20  # 超过该字节数的数组使用内存映射加载
+
+
+def _align(offset):
+    """向上对齐到 ARRAY_ALIGNMENT"""
+    return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+
+def _encode_brush_changes(grid, brush_changes):
+    """将画笔修改记录编码为 (n, 4) 的 int32 数组：x, y, 旧索引, 新索引（不修改网格的色号表）"""
+    def index_of(code):
+        index = grid.code_index.get(code)
+        if index is None:
+            raise ValueError(f'画笔记录中的色号不在色号表中: {code}')
+        return index
+
+    log = np.empty((len(brush_changes), 4), dtype=np.int32)
+    for i, change in enumerate(brush_changes):
+        old_color = change['old_color']
+        log[i] = (change['x'], change['y'],
+                  index_of(old_color) if old_color is not None else -1,
+                  index_of(change['new_color']))
+    return log
+
+
+def _detach_mapped_arrays(grid):
+    """将网格中内存映射的索引数组复制到内存，释放对工程文件的映射"""
+    for name in ('indices', 'original_indices'):
+        array = getattr(grid, name)
+        if isinstance(array, np.memmap):
+            setattr(grid, name, np.array(array))
+
+
+def _decode_brush_changes(codes, log):
+    """将 int32 数组还原为画笔修改记录"""
+    return [{'x': x, 'y': y,
+             'old_color': codes[old] if old >= 0 else None,
+             'new_color': codes[new]}
+            for x, y, old, new in log.tolist()]
+
+
+def save_project(path, grid, source_name, color_replacement=None, replacement_history=None,
+                 brush_changes=None, image_path=None, show_color_codes=True):
+    """保存工程文件"""
+    edit_log = _encode_brush_changes(grid, brush_changes or [])
+    _detach_mapped_arrays(grid)
+    arrays = {
+        'indices': np.ascontiguousarray(grid.indices),
+        'original_indices': np.ascontiguousarray(grid.original_indices),
+        'edit_log': edit_log,
+    }
+
+    header = {
+        'version': PROJECT_VERSION,
+        'source': source_name,
+        'width': grid.width,
+        'height': grid.height,
+        'block_size': grid.block_size,
+        'axis_size': grid.axis_size,
+        'show_color_codes': show_color_codes,
+        'codes': grid.codes,
+        'color_replacement': color_replacement or {},
+        'replacement_history': replacement_history or [],
+        'image_path': image_path,
+        'arrays': {},
+    }
+
+    # 数组偏移依赖头长度，而头中又记录偏移，因此迭代到长度稳定为止
+    header_size = 0
+    while True:
+        offset = _align(len(PROJECT_MAGIC) + 4 + header_size)
+        for name, array in arrays.items():
+            header['arrays'][name] = {'offset': offset, 'shape': list(array.shape),
+                                      'dtype': array.dtype.str}
+            offset = _align(offset + array.nbytes)
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        if len(header_bytes) == header_size:
+            break
+        header_size = len(header_bytes)
+
+    # 先写临时文件再替换，避免保存中断损坏已有工程
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(PROJECT_MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(header['arrays'][name]['offset'])
+            f.write(array.tobytes())
+    os.replace(temp_path, path)
+
+
+def load_project(path, mmap_threshold=MMAP_THRESHOLD):
+    """加载工程文件，返回包含网格和编辑状态的字典"""
+    with open(path, 'rb') as f:
+        magic = f.read(len(PROJECT_MAGIC))
+        if magic[:-1] != PROJECT_MAGIC[:-1]:
+            raise ValueError('不是有效的工程文件')
+        if magic[-1] > PROJECT_VERSION:
+            raise ValueError(f'不支持的工程文件版本: {magic[-1]}')
+        header_size, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_size).decode('utf-8'))
+
+    arrays = {}
+    for name, info in header['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        count = int(np.prod(shape))
+        if count * dtype.itemsize >= mmap_threshold:
+            # 大数组使用写时复制的内存映射，编辑不会写回文件
+            arrays[name] = np.memmap(path, dtype=dtype, mode='c',
+                                     offset=info['offset'], shape=shape)
+        else:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=count,
+                                       offset=info['offset']).reshape(shape)
+
+    codes = header['codes']
+    grid = ImageGrid.from_index_arrays(arrays['indices'], arrays['original_indices'], codes,
+                                       header['block_size'], header['axis_size'])
+    grid.show_color_codes = header['show_color_codes']
+
+    return {
+        'grid': grid,
+        'source': header['source'],
+        'color_replacement': header['color_replacement'],
+        'replacement_history': header['replacement_history'],
+        'brush_changes': _decode_brush_changes(codes, arrays['edit_log']),
+        'image_path': header['image_path'],
+        'show_color_codes': header['show_color_codes'],
+    }
+
+
+def referenced_codes(project):
+    """工程中会被显示或恢复的所有色号（网格当前 / 原始索引、颜色替换及其历史、画笔记录）"""
+    grid = project['grid']
+    used = np.union1d(np.unique(grid.indices), np.unique(grid.original_indices))
+    codes = {grid.codes[i] for i in used.tolist() if i < len(grid.codes)}
+    for mapping in [project['color_replacement']] + project['replacement_history']:
+        codes.update(mapping)
+        codes.update(mapping.values())
+    for change in project['brush_changes']:
+        codes.update(code for code in (change['old_color'], change['new_color']) if code is not None)
+    return codes
@@ -0,0 +1,42 @@
+"""NumPy / PIL 图像到 QImage / QPixmap 的转换
+
+array_to_qimage 直接用数组内存构造 QImage（不复制像素），数组引用只保存在返回的 Python 包装对象上：
+隐式共享的副本（赋值给 Qt 对象、跨线程传递等）不会保持缓冲区存活，调用方必须立即转换
+（QPixmap.fromImage）或调用 .copy() 得到自有像素的 QImage。
+PIL 图片只经过一次 np.asarray 复制，不再经过 convert("RGBA") 和 tobytes。
+"""
+import numpy as np
+from PyQt5 import sip
+from PyQt5.QtGui import QImage, QPixmap
+
+QIMAGE_FORMATS = {3: QImage.Format_RGB888, 4: QImage.Format_RGBA8888}  # 通道数 -> 像素格式
+
+
+def array_to_qimage(array):
+    """将 (高, 宽, 3) RGB 或 (高, 宽, 4) RGBA 的 uint8 数组包装为 QImage（共享内存，需立即转换或 .copy()）"""
+    if array.dtype != np.uint8 or array.ndim != 3 or array.shape[2] not in QIMAGE_FORMATS:
+        raise ValueError(f'不支持的图像数组: {array.dtype} {array.shape}')
+    # 行内像素必须连续，行间距可以不同（子区域视图无需复制）
+    if array.strides[1:] != (array.shape[2], 1):
+        array = np.ascontiguousarray(array)
+    height, width, channels = array.shape
+    image = QImage(sip.voidptr(array.ctypes.data), width, height, array.strides[0], QIMAGE_FORMATS[channels])
+    image.buffer = array  # 只在这个 Python 包装对象存活期间保持缓冲区
+    return image
+
+
+def array_to_pixmap(array):
+    """将 RGB/RGBA 数组转换为 QPixmap"""
+    return QPixmap.fromImage(array_to_qimage(array))
+
+
+def pil_to_qimage(image):
+    """将 PIL 图片转换为 QImage（RGB/RGBA 图片只复制一次像素；与 array_to_qimage 相同，需立即转换或 .copy()）"""
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    return array_to_qimage(np.asarray(image))
+
+
+def pil_to_pixmap(image):
+    """将 PIL 图片转换为 QPixmap"""
+    return QPixmap.fromImage(pil_to_qimage(image))
@@ -0,0 +1,74 @@
+"""限制图案颜色数（不依赖 Qt）
+
+按颜色统计和调色板距离矩阵（matching.distance_matrix，按匹配方法缓存）合并色号：
+1. 指定库存色号时，先将不在库存中的色号合并到距离最近的库存色号
+2. 指定最大颜色数时，反复将用量最少的色号合并到距离最近的保留色号，直到不超过上限
+
+结果为 {被合并色号: 保留色号} 映射，由 ImageGrid.remap_colors 一次性重映射网格。
+"""
+import numpy as np
+
+from matching import distance_matrix
+
+
+def palette_positions(palette, codes):
+    """色号在调色板中的位置，缺少的色号抛出 ValueError"""
+    missing = [code for code in codes if code not in palette.code_index]
+    if missing:
+        raise ValueError(f'颜色源中缺少色号: {", ".join(missing)}')
+    return np.array([palette.code_index[code] for code in codes], dtype=np.intp)
+
+
+def plan_color_reduction(color_statistics, palette, method, max_colors=None, inventory=None):
+    """计算色号合并方案，返回 {被合并色号: 保留色号}"""
+    used_codes = list(color_statistics)
+    if not used_codes:
+        return {}
+    distances = distance_matrix(palette, method)
+    merged = {code: code for code in used_codes}  # 色号 -> 当前归属的保留色号
+    counts = dict(color_statistics)
+
+    # 不在库存中的色号合并到最近的库存色号
+    if inventory is not None:
+        inventory = list(dict.fromkeys(inventory))
+        if not inventory:
+            raise ValueError('库存色号列表为空')
+        allowed = palette_positions(palette, inventory)
+        inventory_set = set(inventory)
+        outside = [code for code in used_codes if code not in inventory_set]
+        if outside:
+            outside_distances = distances[np.ix_(palette_positions(palette, outside), allowed)]
+            for code, nearest in zip(outside, np.argmin(outside_distances, axis=1).tolist()):
+                target = inventory[nearest]
+                merged[code] = target
+                counts[target] = counts.get(target, 0) + counts.pop(code)
+
+    # 反复合并用量最少的色号
+    survivors = list(counts)
+    if max_colors is not None and len(survivors) > max_colors:
+        if max_colors < 1:
+            raise ValueError('最大颜色数必须大于0')
+        positions = palette_positions(palette, survivors)
+        survivor_distances = distances[np.ix_(positions, positions)]
+        np.fill_diagonal(survivor_distances, np.inf)
+        survivor_counts = np.array([counts[code] for code in survivors], dtype=np.float64)
+        parent = np.arange(len(survivors))
+        alive = np.ones(len(survivors), dtype=bool)
+        for _ in range(len(survivors) - max_colors):
+            smallest = int(np.argmin(np.where(alive, survivor_counts, np.inf)))
+            nearest = int(np.argmin(np.where(alive, survivor_distances[smallest], np.inf)))
+            survivor_counts[nearest] += survivor_counts[smallest]
+            alive[smallest] = False
+            parent[smallest] = nearest
+
+        # 沿合并链找到最终保留的色号
+        final = parent.copy()
+        while True:
+            resolved = parent[final]
+            if np.array_equal(resolved, final):
+                break
+            final = resolved
+        final_codes = {code: survivors[i] for code, i in zip(survivors, final.tolist())}
+        merged = {code: final_codes[target] for code, target in merged.items()}
+
+    return {code: target for code, target in merged.items() if code != target}
@@ -0,0 +1,553 @@
+"""图片渲染工具（不依赖 Qt）
+
+包含坐标轴、色号统计的绘制函数，基于色块贴图的按行带渲染（可多线程并行）、
+缩略图渲染（每个色块一个或 N×N 个像素）、流式 PNG 写入，以及渲染到磁盘内存映射画布（超大图片）。
+"""
+import os
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from profiling import count
+
+GRID_BACKGROUND = (255, 255, 255)  # 画布背景色
+RENDER_THREADS = min(8, os.cpu_count() or 1)  # 并行渲染的默认线程数
+DEFAULT_BLOCK_SIZE = 20  # 色块大小（像素）
+DEFAULT_AXIS_SIZE = 30  # 坐标轴区域大小（像素）
+BLOCK_SIZE_RANGE = (4, 100)  # 允许的色块大小
+AXIS_SIZE_RANGE = (20, 100)  # 允许的坐标轴区域大小（过小时坐标标签会被裁掉）
+MAPPED_RENDER_PIXELS = 64 << 20  # 输出图片超过此像素数时改为渲染到磁盘上的内存映射画布
+MAPPED_BAND_BYTES = 32 << 20  # 内存映射画布每个渲染 / 编码行带的目标字节数
+LABEL_SPAN_PIXELS = 16  # 刻度文字在垂直方向上可能覆盖的像素数
+
+
+def load_fonts():
+    """加载色号字体和坐标轴字体，失败时使用默认字体"""
+    try:
+        font = ImageFont.truetype("arial.ttf", 8)
+        axis_font = ImageFont.truetype("arial.ttf", 10)
+    except:
+        font = ImageFont.load_default()
+        axis_font = ImageFont.load_default()
+    return font, axis_font
+
+
+def text_color_for(color):
+    """根据背景亮度选择文字颜色（深色背景用白色文字，浅色背景用黑色文字）"""
+    brightness = sum(color) / 3
+    return (255, 255, 255) if brightness < 128 else (0, 0, 0)
+
+
+def calculate_stats_height(color_statistics, output_width):
+    """计算色号统计区域所需的高度"""
+    if not color_statistics:
+        return 60  # 最小高度，包含间距和额外顶部间距
+
+    # 每个统计项的布局：
+    # - 色块：20x20像素
+    # - 色号文字：在色块上居中
+    # - 数量文字：在色块右侧
+    # - 每个统计项总宽度：约80像素（色块20 + 间距5 + 数量文字约55）
+    # - 每个统计项高度：30像素（色块20 + 上下间距10）
+
+    # 计算每行能容纳多少个统计项
+    items_per_row = max(1, (output_width - 20) // 80)  # 减去左右边距20像素
+
+    # 计算需要多少行
+    num_items = len(color_statistics)
+    num_rows = (num_items + items_per_row - 1) // items_per_row  # 向上取整
+
+    # 计算总高度：行数 * 每行高度 + 上下边距 + 额外顶部间距
+    total_height = num_rows * 30 + 20 + 20  # 20像素的上下边距 + 20像素的额外顶部间距
+
+    # 设置最小高度和最大高度
+    min_height = 60  # 增加最小高度，包含额外间距
+    max_height = 320  # 增加最大高度限制，避免统计区域过大
+
+    return max(min_height, min(total_height, max_height))
+
+
+def draw_column_labels(draw, width, height, cell_size, axis_size, font, y_offset=0):
+    """绘制X轴刻度（列号）- 显示全部数字，横坐标在图片下面"""
+    for x in range(width):
+        tick_x = x * cell_size + axis_size + cell_size // 2
+        tick_y = height * cell_size + axis_size + 10  # X轴标签位置在图片下面
+
+        # 绘制刻度标签
+        label = str(x + 1)  # 从1开始编号
+        text_bbox = draw.textbbox((0, 0), label, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_x = tick_x - text_width // 2
+        text_y = tick_y - y_offset
+        draw.text((text_x, text_y), label, fill='black', font=font)
+
+
+def draw_row_labels(draw, height, cell_size, axis_size, font, row_start=0, row_stop=None, y_offset=0):
+    """绘制Y轴刻度（行号）- 显示全部数字，原点在左下角"""
+    if row_stop is None:
+        row_stop = height
+    for y in range(max(0, row_start), min(height, row_stop)):
+        tick_x = axis_size - 10  # Y轴标签位置
+        tick_y = y * cell_size + axis_size + cell_size // 2  # 保持原始排列，但原点在左下角
+
+        # 绘制刻度标签（从下往上编号）
+        label = str(height - y)  # 从下往上编号
+        text_bbox = draw.textbbox((0, 0), label, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_x = tick_x - text_width - 5
+        text_y = tick_y - 5 - y_offset
+        draw.text((text_x, text_y), label, fill='black', font=font)
+
+
+def draw_coordinate_axes(draw, width, height, cell_size, axis_size, font):
+    """绘制坐标轴"""
+    draw_column_labels(draw, width, height, cell_size, axis_size, font)
+    draw_row_labels(draw, height, cell_size, axis_size, font)
+
+
+def draw_color_statistics(draw, color_statistics, color_lookup, output_width, output_height, font,
+                          y_offset=0):
+    """绘制色号统计"""
+    if not color_statistics:
+        return
+
+    # 计算统计区域所需的高度
+    stats_height = calculate_stats_height(color_statistics, output_width)
+
+    # 统计区域位置（图片底部，增加间距避免覆盖横坐标）
+    # 增加额外的顶部间距，避免与坐标轴重叠
+    stats_start_y = output_height - stats_height + 20  # 额外增加20像素间距
+
+    # 计算每个统计项的显示
+    sorted_colors = sorted(color_statistics.items(), key=lambda x: x[1], reverse=True)
+
+    x_offset = 10
+    y_pos = stats_start_y + 10
+
+    for color_code, number in sorted_colors:
+        # 绘制色块
+        color_rect_x = x_offset
+        color_rect_y = y_pos - y_offset
+        color_rect_size = 20  # 与图片中的色块大小一致
+
+        matched_color = tuple(color_lookup.get(color_code, (255, 255, 255)))
+        draw.rectangle([(color_rect_x, color_rect_y),
+                      (color_rect_x + color_rect_size, color_rect_y + color_rect_size)],
+                     fill=matched_color, outline='black')  # 黑色边框
+
+        # 在色块上绘制色号
+        text_color = text_color_for(matched_color)
+
+        # 获取文字大小
+        text_bbox = draw.textbbox((0, 0), color_code, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+
+        # 计算文字位置（居中）
+        text_x = color_rect_x + (color_rect_size - text_width) // 2
+        text_y = color_rect_y + (color_rect_size - text_height) // 2
+
+        # 绘制色号
+        draw.text((text_x, text_y), color_code, fill=text_color, font=font)
+
+        # 绘制数量
+        count_text = f" x {number}"
+        count_x = color_rect_x + color_rect_size + 5
+        count_y = color_rect_y + 5
+        draw.text((count_x, count_y), count_text, fill='black', font=font)
+
+        # 更新位置
+        x_offset += 80  # 每个统计项占80像素宽度
+
+        # 如果超出宽度，换行
+        if x_offset + 80 > output_width:
+            x_offset = 10
+            y_pos += 30
+
+            # 如果超出高度，停止绘制
+            if y_pos + 30 > stats_start_y + stats_height:
+                break
+
+
+def render_full_image(grid, color_lookup, show_color_codes=True, color_statistics=None):
+    """从网格数据合成完整图片（坐标轴、色块、色号统计），返回 PIL 图片"""
+    block_size = grid.block_size
+    axis_size = grid.axis_size
+
+    # 计算基础尺寸（不包含统计区域）
+    base_width = grid.width * block_size + axis_size
+    base_height = grid.height * block_size + axis_size
+
+    # 生成色号统计
+    if color_statistics is None:
+        color_statistics = grid.color_statistics()
+
+    # 计算统计区域所需高度
+    stats_height = calculate_stats_height(color_statistics, base_width)
+
+    # 计算总尺寸
+    total_width = base_width
+    total_height = base_height + stats_height
+
+    # 创建完整图片
+    full_image = Image.new('RGB', (total_width, total_height), 'white')
+    draw = ImageDraw.Draw(full_image)
+    font, axis_font = load_fonts()
+
+    # 绘制坐标轴
+    draw_coordinate_axes(draw, grid.width, grid.height, block_size, axis_size, axis_font)
+
+    # 绘制所有色块
+    ys, xs = np.nonzero(grid.indices != grid.empty_index)
+    count('cells_rendered', len(xs))
+    for x, y, index in zip(xs.tolist(), ys.tolist(), grid.indices[ys, xs].tolist()):
+        # 计算色块位置
+        start_x = x * block_size + axis_size
+        start_y = y * block_size + axis_size
+        end_x = start_x + block_size
+        end_y = start_y + block_size
+
+        # 获取颜色
+        color_code = grid.codes[index]
+        if color_code in color_lookup:
+            color = tuple(color_lookup[color_code])
+        else:
+            color = (255, 255, 255)
+
+        # 填充色块
+        draw.rectangle([start_x, start_y, end_x - 1, end_y - 1], fill=color)
+
+        # 绘制色号（色块放不下时不绘制）
+        position = code_text_position(draw, color_code, block_size, font) if show_color_codes and color_code else None
+        if position is not None:
+            draw.text((start_x + position[0], start_y + position[1]), color_code, fill=text_color_for(color),
+                      font=font)
+
+    # 绘制色号统计
+    draw_color_statistics(draw, color_statistics, color_lookup, total_width, total_height, axis_font)
+    return full_image
+
+
+def code_text_position(draw, color_code, block_size, font):
+    """色号文字在色块内居中的位置；文字超出色块（色块太小）时返回 None，不绘制色号
+
+    超出色块的文字在贴图中被裁掉、在整图中会画到相邻色块上，两者不一致且都无法辨认。
+    """
+    left, top, right, bottom = draw.textbbox((0, 0), color_code, font=font)
+    text_x = (block_size - (right - left)) // 2
+    text_y = (block_size - (bottom - top)) // 2
+    if text_x + left < 0 or text_y + top < 0 or text_x + right > block_size or text_y + bottom > block_size:
+        return None
+    return text_x, text_y
+
+
+def build_block_tiles(codes, color_lookup, block_size, show_color_codes, font):
+    """为色号表中的每个色号预先绘制色块贴图
+
+    返回形状为 (len(codes) + 1, block_size, block_size, 3) 的数组，
+    最后一个贴图为空白格子（白色）。色号文字放不下的色块不绘制色号（见 code_text_position）。
+    """
+    tiles = np.empty((len(codes) + 1, block_size, block_size, 3), dtype=np.uint8)
+    tiles[-1] = GRID_BACKGROUND
+    for i, color_code in enumerate(codes):
+        if color_code in color_lookup:
+            color = tuple(int(c) for c in color_lookup[color_code])
+        else:
+            color = (255, 255, 255)  # 默认白色
+        tile = Image.new('RGB', (block_size, block_size), color)
+        if show_color_codes and color_code:
+            draw = ImageDraw.Draw(tile)
+            position = code_text_position(draw, color_code, block_size, font)
+            if position is not None:
+                draw.text(position, color_code, fill=text_color_for(color), font=font)
+        tiles[i] = np.asarray(tile)
+    return tiles
+
+
+def render_grid_rows(indices, tiles, axis_size, out=None):
+    """将若干行调色板索引渲染为像素行（左侧保留坐标轴区域，不绘制刻度）
+
+    indices 中超出色号表范围的值（空白标记）使用最后一个空白贴图。
+    """
+    rows, width = indices.shape
+    block_size = tiles.shape[1]
+    if out is None:
+        out = np.empty((rows * block_size, width * block_size + axis_size, 3), dtype=np.uint8)
+    out[:, :axis_size] = GRID_BACKGROUND
+
+    # 一次性按索引取出贴图，直接写入输出区域的 (行, 块内行, 列, 块内列, 通道) 视图
+    tile_indices = np.minimum(indices, len(tiles) - 1)
+    count('cells_rendered', int(np.count_nonzero(tile_indices < len(tiles) - 1)))
+    region = out[:, axis_size:]
+    row_stride, col_stride, channel_stride = region.strides
+    blocks_view = np.lib.stride_tricks.as_strided(
+        region, (rows, block_size, width, block_size, 3),
+        (block_size * row_stride, row_stride, block_size * col_stride, col_stride, channel_stride))
+    blocks_view[...] = tiles[tile_indices].transpose(0, 2, 1, 3, 4)
+    return out
+
+
+def render_full_image_parallel(grid, color_lookup, show_color_codes=True, color_statistics=None,
+                               threads=None, band_rows=None, tiles=None):
+    """按行带多线程渲染完整图片（输出与 render_full_image 相同），返回 PIL 图片
+
+    色块区域按行带分配给线程池，每个线程用贴图查表直接写入预先分配的画布
+    （NumPy 复制时释放 GIL），最后在整幅图片上绘制坐标轴刻度和色号统计。
+    tiles 为可选的预先绘制的色块贴图（build_block_tiles 的结果，需与 grid.codes 对应）。
+    """
+    block_size = grid.block_size
+    axis_size = grid.axis_size
+    if color_statistics is None:
+        color_statistics = grid.color_statistics()
+
+    total_width = grid.width * block_size + axis_size
+    base_height = grid.height * block_size + axis_size
+    total_height = base_height + calculate_stats_height(color_statistics, total_width)
+
+    font, axis_font = load_fonts()
+    if tiles is None:
+        tiles = build_block_tiles(grid.codes, color_lookup, block_size, show_color_codes, font)
+
+    canvas = np.empty((total_height, total_width, 3), dtype=np.uint8)
+    canvas[:axis_size] = GRID_BACKGROUND
+    canvas[base_height:] = GRID_BACKGROUND
+
+    threads = max(1, threads or RENDER_THREADS)
+    if band_rows is None:
+        band_rows = max(1, -(-grid.height // (threads * 4)))  # 每个线程约4个行带
+
+    def render_band(row_start):
+        row_stop = min(grid.height, row_start + band_rows)
+        render_grid_rows(grid.indices[row_start:row_stop], tiles, axis_size,
+                         out=canvas[axis_size + row_start * block_size:axis_size + row_stop * block_size])
+
+    band_starts = range(0, grid.height, band_rows)
+    if threads == 1:
+        for row_start in band_starts:
+            render_band(row_start)
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(render_band, band_starts))
+
+    # 坐标轴刻度和色号统计
+    full_image = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(full_image)
+    draw_coordinate_axes(draw, grid.width, grid.height, block_size, axis_size, axis_font)
+    draw_color_statistics(draw, color_statistics, color_lookup, total_width, total_height, axis_font)
+    return full_image
+
+
+def output_size(grid, color_statistics=None):
+    """完整图片的输出尺寸 (宽, 高)（含坐标轴和色号统计区域）"""
+    if color_statistics is None:
+        color_statistics = grid.color_statistics()
+    total_width = grid.width * grid.block_size + grid.axis_size
+    base_height = grid.height * grid.block_size + grid.axis_size
+    return total_width, base_height + calculate_stats_height(color_statistics, total_width)
+
+
+def render_full_image_mapped(grid, color_lookup, output_path, show_color_codes=True, color_statistics=None,
+                             compress_level=6, threads=None, band_rows=None, tiles=None, temp_dir=None):
+    """渲染到磁盘上的内存映射画布，再从画布按行带流式编码为 PNG（输出与 render_full_image 相同）
+
+    画布为临时文件（默认放在输出文件所在目录，避免 /tmp 为内存文件系统），按色块行带多线程渲染，
+    每个行带同时绘制所在区域的Y轴刻度（首尾行带包含顶部空白和底部的横坐标、色号统计）；
+    编码时每次只读取一个行带。每个行带单独映射、用完即关闭，内存占用与行带大小和线程数有关，
+    不随输出图片大小增长。返回输出尺寸 (宽, 高)。
+    """
+    block_size = grid.block_size
+    axis_size = grid.axis_size
+    if color_statistics is None:
+        color_statistics = grid.color_statistics()
+    total_width, total_height = output_size(grid, color_statistics)
+    base_height = grid.height * block_size + axis_size
+    row_bytes = total_width * 3
+
+    font, axis_font = load_fonts()
+    if tiles is None:
+        tiles = build_block_tiles(grid.codes, color_lookup, block_size, show_color_codes, font)
+
+    threads = max(1, threads or RENDER_THREADS)
+    if band_rows is None:
+        band_rows = max(1, MAPPED_BAND_BYTES // (row_bytes * block_size))
+
+    if temp_dir is None:
+        temp_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, canvas_path = tempfile.mkstemp(suffix='.canvas', dir=temp_dir)
+    try:
+        os.ftruncate(fd, total_height * row_bytes)
+        os.close(fd)
+        fd = None
+
+        def map_rows(start, stop, mode='r+'):
+            """映射画布中的若干像素行"""
+            return np.memmap(canvas_path, dtype=np.uint8, mode=mode, offset=start * row_bytes,
+                             shape=(stop - start, total_width, 3))
+
+        def render_band(row_start):
+            row_stop = min(grid.height, row_start + band_rows)
+            pixel_start = 0 if row_start == 0 else axis_size + row_start * block_size
+            pixel_stop = total_height if row_stop == grid.height else axis_size + row_stop * block_size
+            band = map_rows(pixel_start, pixel_stop)
+            block_start = axis_size + row_start * block_size - pixel_start
+            render_grid_rows(grid.indices[row_start:row_stop], tiles, axis_size,
+                             out=band[block_start:block_start + (row_stop - row_start) * block_size])
+            if row_start == 0:
+                band[:axis_size] = GRID_BACKGROUND
+            if row_stop == grid.height:
+                band[base_height - pixel_start:] = GRID_BACKGROUND
+
+            # Y轴刻度只绘制在左侧坐标轴宽度的条带上（多绘制相邻行的刻度，保证跨越行带边界的文字
+            # 被正确裁剪；色块较小时刻度文字可能跨越多行），只写回这一部分
+            strip_img = Image.fromarray(np.ascontiguousarray(band[:, :axis_size]))
+            margin = 1 + LABEL_SPAN_PIXELS // block_size
+            draw_row_labels(ImageDraw.Draw(strip_img), grid.height, block_size, axis_size, axis_font,
+                            row_start - margin, row_stop + margin, y_offset=pixel_start)
+            band[:, :axis_size] = np.asarray(strip_img)
+            if row_stop == grid.height:
+                # 横坐标和色号统计都在网格下方，只复制底部区域绘制
+                footer_start = base_height - pixel_start
+                footer_img = Image.fromarray(np.ascontiguousarray(band[footer_start:]))
+                draw = ImageDraw.Draw(footer_img)
+                draw_column_labels(draw, grid.width, grid.height, block_size, axis_size, axis_font,
+                                   y_offset=base_height)
+                draw_color_statistics(draw, color_statistics, color_lookup, total_width, total_height,
+                                      axis_font, y_offset=base_height)
+                band[footer_start:] = np.asarray(footer_img)
+            band.flush()
+
+        band_starts = range(0, grid.height, band_rows)
+        if threads == 1:
+            for row_start in band_starts:
+                render_band(row_start)
+        else:
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(render_band, band_starts))
+
+        # 从画布按行带编码
+        encode_rows = max(1, MAPPED_BAND_BYTES // row_bytes)
+        with PNGStreamWriter(output_path, total_width, total_height, compress_level) as writer:
+            for row_start in range(0, total_height, encode_rows):
+                writer.write_rows(map_rows(row_start, min(total_height, row_start + encode_rows), 'r'))
+    finally:
+        if fd is not None:
+            os.close(fd)
+        os.remove(canvas_path)
+    return total_width, total_height
+
+
+def render_thumbnail(grid, color_lookup, scale=1):
+    """缩略图渲染：每个色块 scale×scale 像素，没有分隔线、坐标轴和文字，返回 (高, 宽, 3) 数组
+
+    颜色表覆盖索引数据类型的全部取值（空白标记对应背景色），一次查表得到所有色块的颜色，
+    scale > 1 时通过广播写入放大后的数组。
+    """
+    lut = np.empty((grid.empty_index + 1, 3), dtype=np.uint8)
+    lut[:] = GRID_BACKGROUND
+    if grid.codes:
+        # 不在颜色表中的色号与色块贴图相同，按白色显示
+        lut[:len(grid.codes)] = [color_lookup.get(code, (255, 255, 255)) for code in grid.codes]
+    colors = lut[grid.indices]
+    count('cells_rendered', colors.shape[0] * colors.shape[1])
+    if scale == 1:
+        return colors
+    height, width = grid.indices.shape
+    out = np.empty((height, scale, width, scale, 3), dtype=np.uint8)
+    out[:] = colors[:, None, :, None]
+    return out.reshape(height * scale, width * scale, 3)
+
+
+class PNGStreamWriter:
+    """逐行写入的 PNG 编码器（8 位 RGB），内存占用只与写入的行带大小有关
+
+    数据先写入同目录下的临时文件，close 成功后才替换输出文件；出错时删除临时文件。
+    """
+
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    CHUNK_SIZE = 1 << 20  # 单个 IDAT 块的目标大小
+
+    def __init__(self, path, width, height, compress_level=6):
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        # 先写临时文件，完成后再替换，写入中断时不会覆盖已有的图片
+        self.path = path
+        self._temp_path = path + '.tmp'
+        self._file = open(self._temp_path, 'wb')
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+        self._file.write(self.SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+    def _flush_pending(self):
+        if self._pending:
+            self._write_chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def write_rows(self, rows):
+        """写入若干像素行，rows 形状为 (n, width, 3) 的 uint8 数组"""
+        count = rows.shape[0]
+        if rows.shape[1:] != (self.width, 3):
+            raise ValueError(f'行数据尺寸不匹配: {rows.shape}')
+        if self.rows_written + count > self.height:
+            raise ValueError('写入的行数超过图片高度')
+
+        # 每行前加滤波类型字节 0（无滤波）
+        raw = np.empty((count, self.width * 3 + 1), dtype=np.uint8)
+        raw[:, 0] = 0
+        raw[:, 1:] = rows.reshape(count, -1)
+        data = self._compressor.compress(raw.tobytes())
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size >= self.CHUNK_SIZE:
+                self._flush_pending()
+        self.rows_written += count
+
+    def close(self):
+        """结束写入，补齐剩余数据和文件尾"""
+        if self._file is None:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f'仅写入了 {self.rows_written}/{self.height} 行')
+            self._pending.append(self._compressor.flush())
+            self._flush_pending()
+            self._write_chunk(b'IEND', b'')
+            self._file.close()
+            os.replace(self._temp_path, self.path)
+            self._file = None
+        finally:
+            self.abort()  # 替换失败时同样删除临时文件
+
+    def abort(self):
+        """放弃写入，删除临时文件（已有的输出文件保持不变）"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,180 @@
+"""源图片缩小到目标网格尺寸（不依赖 Qt）
+
+在匹配颜色之前将裁剪后的像素数组缩小为目标网格（一个像素对应一个色块）：
+- 区域平均：每个格子取不透明像素的平均颜色，适合照片
+- 众数：每个格子取出现最多的颜色，适合像素画（不产生新的混合色）
+
+格子边界为 floor(i * 源尺寸 / 目标尺寸)，按源行带分块归约，临时内存与行带大小相关。
+输出为 RGBA 数组，透明像素占多数（众数模式下透明为众数）的格子输出为透明。
+流式处理时由 BandDownscaler 按源行带逐步缩小，每个网格行的结果与整幅缩小相同。
+"""
+import numpy as np
+
+from background import DEFAULT_BACKGROUND
+
+RESAMPLE_AREA = '区域平均'
+RESAMPLE_MODE = '众数（像素画）'
+RESAMPLE_METHODS = [RESAMPLE_AREA, RESAMPLE_MODE]
+
+RESAMPLE_BAND_PIXELS = 1 << 22  # 每次归约的源像素数上限
+TRANSPARENT_KEY = 1 << 24  # 众数模式下透明像素的颜色值
+
+
+def fit_grid_size(width, height, target_width=None, target_height=None):
+    """计算目标网格尺寸：只指定一边时按比例计算另一边，结果不超过源尺寸"""
+    if not target_width and not target_height:
+        return width, height
+    if not target_height:
+        target_height = max(1, round(height * target_width / width))
+    elif not target_width:
+        target_width = max(1, round(width * target_height / height))
+    return min(width, int(target_width)), min(height, int(target_height))
+
+
+def bin_starts(size, bins):
+    """每个格子在源数组中的起始位置"""
+    return (np.arange(bins) * size) // bins
+
+
+def _output_row_bands(height, width, out_height):
+    """按源像素数上限划分输出行带，返回 (输出起始行, 输出结束行) 列表"""
+    starts = bin_starts(height, out_height)
+    rows_per_cell = max(1, -(-height // out_height))
+    band = max(1, RESAMPLE_BAND_PIXELS // (width * rows_per_cell))
+    return [(start, min(out_height, start + band)) for start in range(0, out_height, band)], starts
+
+
+def _source_rows(starts, height, start, stop):
+    """输出行 [start, stop) 对应的源行范围"""
+    return starts[start], starts[stop] if stop < len(starts) else height
+
+
+def downscale_area(pixels, out_width, out_height, mask=None):
+    """区域平均缩小，返回 (out_height, out_width, 4) 的 RGBA 数组"""
+    height, width = pixels.shape[:2]
+    if mask is None:
+        mask = DEFAULT_BACKGROUND.mask(pixels)
+    col_starts = bin_starts(width, out_width)
+    bands, row_starts = _output_row_bands(height, width, out_height)
+
+    result = np.zeros((out_height, out_width, 4), dtype=np.uint8)
+    for start, stop in bands:
+        y0, y1 = _source_rows(row_starts, height, start, stop)
+        local_starts = row_starts[start:stop] - y0
+        opaque = ~mask[y0:y1]
+        rgb = pixels[y0:y1, :, :3] * opaque[..., None]
+
+        # 先按行、再按列求和（uint32 累加，不转换为浮点数组）
+        sums = np.add.reduceat(np.add.reduceat(rgb, local_starts, axis=0, dtype=np.uint32),
+                               col_starts, axis=1)
+        counts = np.add.reduceat(np.add.reduceat(opaque, local_starts, axis=0, dtype=np.uint32),
+                                 col_starts, axis=1)
+
+        # 每个格子的总像素数
+        cell_heights = np.diff(np.append(local_starts, y1 - y0))
+        cell_widths = np.diff(np.append(col_starts, width))
+        cell_sizes = cell_heights[:, None] * cell_widths[None, :]
+
+        band = result[start:stop]
+        safe_counts = np.maximum(counts, 1)[..., None]
+        band[..., :3] = (sums + safe_counts // 2) // safe_counts
+        band[..., 3] = np.where(counts * 2 >= cell_sizes, 255, 0)
+    return result
+
+
+def downscale_mode(pixels, out_width, out_height, mask=None):
+    """众数缩小（每个格子取出现最多的颜色，透明也参与计数），返回 RGBA 数组"""
+    height, width = pixels.shape[:2]
+    if mask is None:
+        mask = DEFAULT_BACKGROUND.mask(pixels)
+    col_bins = np.repeat(np.arange(out_width), np.diff(np.append(bin_starts(width, out_width), width)))
+    bands, row_starts = _output_row_bands(height, width, out_height)
+
+    result = np.zeros((out_height, out_width, 4), dtype=np.uint8)
+    for start, stop in bands:
+        y0, y1 = _source_rows(row_starts, height, start, stop)
+        local_starts = row_starts[start:stop] - y0
+        row_bins = np.repeat(np.arange(stop - start), np.diff(np.append(local_starts, y1 - y0)))
+
+        rgb = pixels[y0:y1, :, :3].astype(np.int64)
+        colors = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+        colors[mask[y0:y1]] = TRANSPARENT_KEY
+
+        # 组合键：格子编号 + 颜色，统计每个格子内每种颜色的数量
+        cells = row_bins[:, None] * out_width + col_bins[None, :]
+        keys, counts = np.unique((cells << 25) | colors, return_counts=True)
+        key_cells = keys >> 25
+        key_colors = keys & ((1 << 25) - 1)
+
+        # 每个格子取数量最多的颜色（数量相同时取颜色值较小的）
+        order = np.lexsort((-counts, key_cells))
+        sorted_cells = key_cells[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_cells[1:] != sorted_cells[:-1]
+        winners = key_colors[order][first]
+
+        band = result[start:stop].reshape(-1, 4)
+        opaque = winners != TRANSPARENT_KEY
+        band[:, 0] = (winners >> 16) & 0xFF
+        band[:, 1] = (winners >> 8) & 0xFF
+        band[:, 2] = winners & 0xFF
+        band[:, 3] = np.where(opaque, 255, 0)
+    return result
+
+
+def downscale(pixels, out_width, out_height, method=RESAMPLE_AREA, mask=None):
+    """将像素数组缩小到目标网格尺寸，尺寸不变时原样返回（mask 为预先计算的背景掩码）"""
+    height, width = pixels.shape[:2]
+    if (out_width, out_height) == (width, height):
+        return pixels
+    if method == RESAMPLE_MODE:
+        return downscale_mode(pixels, out_width, out_height, mask)
+    return downscale_area(pixels, out_width, out_height, mask)
+
+
+def downscale_masked(pixels, mask, out_width, out_height, method=RESAMPLE_AREA):
+    """按背景掩码缩小，返回 (缩小后的像素, 缩小后的背景掩码)，尺寸不变时原样返回"""
+    height, width = pixels.shape[:2]
+    if (out_width, out_height) == (width, height):
+        return pixels, mask
+    resized = downscale(pixels, out_width, out_height, method, mask)
+    return resized, resized[..., 3] == 0
+
+
+class BandDownscaler:
+    """流式缩小：按顺序加入（已裁剪的）源行带，返回其中已完整的网格行
+
+    网格行的源行范围与整幅缩小相同（floor(i * 源高度 / 目标高度)），每个网格行单独归约，
+    结果与对整幅图片调用 downscale_masked 相同；只缓存尚未完整的网格行对应的源行。
+    """
+
+    def __init__(self, width, height, out_width, out_height, method=RESAMPLE_AREA):
+        self.out_width = out_width
+        self.resize = downscale_mode if method == RESAMPLE_MODE else downscale_area
+        self.starts = bin_starts(height, out_height)
+        self.stops = np.append(self.starts[1:], height)
+        self.row = 0  # 下一个输出的网格行
+        self.offset = 0  # 缓存的第一行的源行号
+        self.pixels = None
+        self.mask = None
+
+    def add(self, pixels, mask):
+        """加入一个源行带，返回 (网格行像素, 背景掩码)，可能为 0 行"""
+        if self.pixels is not None:
+            pixels = np.concatenate([self.pixels, pixels])
+            mask = np.concatenate([self.mask, mask])
+        available = self.offset + len(pixels)
+        rows = []
+        while self.row < len(self.stops) and self.stops[self.row] <= available:
+            start = self.starts[self.row] - self.offset
+            stop = self.stops[self.row] - self.offset
+            rows.append(self.resize(pixels[start:stop], self.out_width, 1, mask[start:stop]))
+            self.row += 1
+        consumed = (self.starts[self.row] if self.row < len(self.starts) else available) - self.offset
+        self.pixels = pixels[consumed:]
+        self.mask = mask[consumed:]
+        self.offset += consumed
+        if not rows:
+            return np.zeros((0, self.out_width, 4), dtype=np.uint8), np.zeros((0, self.out_width), dtype=bool)
+        resized = np.concatenate(rows)
+        return resized, resized[..., 3] == 0
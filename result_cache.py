@@ -0,0 +1,153 @@
+"""按内容寻址的处理结果缓存（不依赖 Qt）
+
+以 (源图片文件哈希, 调色板内容哈希, 匹配方法, 抖动、目标网格尺寸、缩小方式、颜色替换、背景检测等匹配选项)
+为键，将调色板索引网格和色号统计保存到 .result_cache/<键>.npz。再次处理相同图片时直接读取
+索引网格，跳过裁剪、缩小和匹配，只重新渲染；色块大小、是否显示色号等只影响渲染的设置不参与键，
+修改后同样命中缓存。
+
+缓存总大小超过上限时按最近使用时间（命中时刷新文件修改时间）删除最旧的条目。
+写入先写临时文件再替换，多个进程（如 HTTP 服务的工作进程）可共用同一目录。
+图形界面和 HTTP 服务共用缓存目录和缓存键，条目的附加信息统一由 result_info() 生成，
+缺少必需字段的条目按未命中处理。
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from background import DEFAULT_BACKGROUND
+from profiling import count
+
+RESULT_CACHE_DIR = '.result_cache'  # 缓存目录
+RESULT_CACHE_BYTES = 256 << 20  # 缓存总大小上限
+RESULT_INFO_KEYS = ('original_size', 'trimmed_size')  # 缓存条目附加信息的必需字段
+CACHE_VERSION = 3  # 处理流程改变（如源图片模式的转换规则）时递增，旧条目不再命中
+
+
+def data_digest(data):
+    """计算字节数据的内容哈希"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_digest(path):
+    """计算文件的内容哈希"""
+    with open(path, 'rb') as f:
+        return data_digest(f.read())
+
+
+def palette_digest(palette):
+    """计算调色板内容（色号和颜色）的哈希"""
+    digest = hashlib.sha1('\n'.join(palette.codes).encode('utf-8'))
+    digest.update(palette.rgb.tobytes())
+    return digest.hexdigest()
+
+
+def match_options(dither, target_size, resample, color_replacement=None, background=None):
+    """影响匹配结果的选项（抖动、目标网格尺寸、缩小方式、颜色替换、背景检测），用于计算缓存键"""
+    return {
+        'dither': dither,
+        'target_size': list(target_size),
+        'resample': resample,
+        'color_replacement': sorted((color_replacement or {}).items()),
+        'background': (background or DEFAULT_BACKGROUND).options(),
+    }
+
+
+def result_info(original_size, trimmed_size, quality=None):
+    """缓存条目的附加信息：原始尺寸、裁剪透明行列后的尺寸和匹配质量摘要"""
+    return {'original_size': list(original_size), 'trimmed_size': list(trimmed_size), 'quality': quality}
+
+
+def result_key(image_digest, palette, method, options=None):
+    """计算缓存键：options 为其他影响匹配结果的选项（可 JSON 序列化）"""
+    key = [CACHE_VERSION, image_digest, palette_digest(palette), method, options or {}]
+    return data_digest(json.dumps(key, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+
+class ResultCache:
+    """磁盘上的调色板索引网格缓存（按总大小做 LRU 淘汰）"""
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """读取缓存条目，返回 {'indices', 'codes', 'color_statistics', 'info'}，不存在时返回 None"""
+        path = self.path_for(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {
+                    'indices': data['indices'],
+                    'codes': data['codes'].tolist(),
+                    'color_statistics': json.loads(str(data['color_statistics'])),
+                    'info': json.loads(str(data['info'])),
+                }
+            if not all(name in entry['info'] for name in RESULT_INFO_KEYS):
+                raise KeyError('info')  # 旧版本或其他写入方生成的不完整条目
+            os.utime(path)  # 刷新最近使用时间
+        except (OSError, KeyError, ValueError):
+            count('result_cache_misses')
+            return None
+        count('result_cache_hits')
+        return entry
+
+    def put(self, key, indices, codes, color_statistics, info=None):
+        """写入缓存条目（info 由 result_info() 生成），然后按大小上限淘汰"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(
+                f, indices=indices, codes=np.array(codes),
+                color_statistics=np.array(json.dumps(color_statistics, ensure_ascii=False)),
+                info=np.array(json.dumps(info or {}, ensure_ascii=False)))
+        os.replace(temp_path, path)
+        self.evict()
+
+    def entries(self):
+        """返回 [(修改时间, 大小, 路径)]，按最近使用时间从旧到新排序"""
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # 已被其他进程删除
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        """缓存总字节数"""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """删除最久未使用的条目，直到总大小不超过上限"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """删除所有缓存条目"""
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,512 @@
+"""本地图案生成 HTTP 服务（标准库实现，不依赖 Qt）
+
+接口：
+    GET  /sources        可用的颜色源、匹配方法、抖动模式、缩小方式和保存格式
+    GET  /health         工作进程数、正在处理和排队的请求数
+    POST /process?...    请求体为图片文件内容（PNG/JPG/BMP 等），返回渲染后的图片；
+                         output=json 时返回 JSON（网格尺寸、色号统计和 base64 编码的图片）
+
+查询参数（均可省略）：source、method、dither、width、height（目标网格尺寸）、resample、
+block_size、axis_size、show_codes、thumbnail（每个色块的像素数，
+返回无坐标轴和色号的缩略图，0 为完整图片）、alpha_threshold、bg_tolerance、bg_color（背景色 RRGGBB 前加 # 需编码为 %23，
+或 R,G,B）、edge_connected（背景检测，见 background.py）、save_format、compress_level、output。
+
+处理流程与界面的 process_image 相同（裁剪、缩小、匹配、渲染），在预热的工作进程池中执行：
+每个进程启动时加载所有调色板并预先绘制色块贴图（字形），不抖动时的颜色缓存也跨请求保留。
+相同图片和匹配选项的索引网格保存在结果缓存（result_cache）中，再次请求时只重新渲染。
+输出图片（网格 × 色块大小 + 坐标轴和统计区域）超过像素数上限时返回 413。
+同时处理的请求数等于工作进程数，排队请求超过上限时返回 503；等待超时返回 504，
+超时的请求在工作进程处理结束前仍占用排队名额。
+响应头 X-Queue-Time、X-Process-Time、X-Total-Time 为毫秒数，X-Stage-Times 为各阶段耗时（阶段=毫秒），
+X-Cache 为结果缓存是否命中（hit / miss）。不抖动时 X-Mean-Delta-E、X-Max-Delta-E 为源颜色与匹配颜色的
+平均 / 最大 ΔE（CIEDE2000），X-Near-Ties 为最近和次近颜色接近并列的像素数，JSON 输出的 quality 包含每个色号的统计。
+
+用法：python server.py [--host 127.0.0.1] [--port 8765] [--workers N] [--max-queue 16] [--cache-size MB]
+                      [--max-output-mp 64]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from background import DEFAULT_ALPHA_THRESHOLD, DEFAULT_TOLERANCE, BackgroundDetector, parse_color
+from dithering import DITHER_MODES, DITHER_NONE, create_matcher
+from image_grid import ImageGrid
+from image_output import DEFAULT_COMPRESS_LEVEL, OUTPUT_FORMATS, OUTPUT_PNG, save_output_image
+from match_quality import MatchQuality
+from matching import MATCHING_METHODS
+from palette import load_palette
+from pipeline import load_source_pixels, trim_transparent
+from profiling import PROFILER, span
+from rendering import (AXIS_SIZE_RANGE, BLOCK_SIZE_RANGE, DEFAULT_AXIS_SIZE, DEFAULT_BLOCK_SIZE, build_block_tiles,
+                       calculate_stats_height, load_fonts, render_full_image_parallel, render_thumbnail)
+from resampling import RESAMPLE_AREA, RESAMPLE_METHODS, downscale_masked, fit_grid_size
+from result_cache import (RESULT_CACHE_BYTES, RESULT_CACHE_DIR, ResultCache, data_digest, match_options,
+                          result_info, result_key)
+
+CUSTOM_SOURCE = '自选颜色'  # 与界面相同：sample.json 对应的颜色源
+DEFAULT_METHOD = 'LAB色彩空间'
+MAX_THUMBNAIL_SCALE = 32  # 缩略图每个色块的最大像素数
+MAX_UPLOAD_BYTES = 32 << 20  # 上传图片大小上限
+MAX_OUTPUT_PIXELS = 64 << 20  # 输出图片像素数上限（约 200 MB 的 RGB 画布），超过时返回 413
+MATCHER_CACHE_LIMIT = 1 << 20  # 常驻匹配器颜色缓存的条目上限，超过时重建
+CONTENT_TYPES = {'.png': 'image/png', '.webp': 'image/webp'}
+
+
+def color_source_files():
+    """颜色源名称 -> 颜色数据文件（与界面的颜色源相同）"""
+    sources = {CUSTOM_SOURCE: 'sample.json'} if os.path.exists('sample.json') else {}
+    if os.path.exists('color'):
+        for file in sorted(os.listdir('color')):
+            if file.endswith('.json'):
+                sources[file.split('.')[0]] = os.path.join('color', file)
+    return sources
+
+
+def parse_options(query, sources):
+    """解析并校验查询参数，参数无效时抛出 ValueError"""
+    def get(name, default=None):
+        values = query.get(name)
+        return values[-1] if values else default
+
+    def choice(name, choices, default):
+        value = get(name, default)
+        if value not in choices:
+            raise ValueError(f'{name} 参数无效: {value}（可选: {", ".join(choices)}）')
+        return value
+
+    def flag(name, default):
+        return get(name, '1' if default else '0').lower() not in ('0', 'false', 'no', 'off')
+
+    def integer(name, default, low, high):
+        value = get(name)
+        if value is None or value == '':
+            return default
+        if not value.isdigit() or not low <= int(value) <= high:
+            raise ValueError(f'{name} 参数必须为 {low} ~ {high} 的整数')
+        return int(value)
+
+    default_source = next(iter(sources), None)
+    return {
+        'source': choice('source', list(sources), default_source),
+        'method': choice('method', list(MATCHING_METHODS), DEFAULT_METHOD),
+        'dither': choice('dither', DITHER_MODES, DITHER_NONE),
+        'width': integer('width', None, 1, 1 << 16),
+        'height': integer('height', None, 1, 1 << 16),
+        'resample': choice('resample', RESAMPLE_METHODS, RESAMPLE_AREA),
+        'block_size': integer('block_size', DEFAULT_BLOCK_SIZE, *BLOCK_SIZE_RANGE),
+        'axis_size': integer('axis_size', DEFAULT_AXIS_SIZE, *AXIS_SIZE_RANGE),
+        'thumbnail': integer('thumbnail', 0, 0, MAX_THUMBNAIL_SCALE),
+        'show_codes': flag('show_codes', True),
+        'background': BackgroundDetector(integer('alpha_threshold', DEFAULT_ALPHA_THRESHOLD, 0, 254),
+                                         integer('bg_tolerance', DEFAULT_TOLERANCE, 0, 255),
+                                         parse_color(get('bg_color', '')),
+                                         flag('edge_connected', False)),
+        'save_format': choice('save_format', list(OUTPUT_FORMATS), OUTPUT_PNG),
+        'compress_level': integer('compress_level', DEFAULT_COMPRESS_LEVEL, 0, 9),
+        'output': choice('output', ['image', 'json'], 'image'),
+    }
+
+
+class OutputTooLarge(ValueError):
+    """输出图片超过像素数上限"""
+
+
+def output_pixels(grid_width, grid_height, options, stats_height=0):
+    """按请求选项计算输出图片的像素数（stats_height 为色号统计区域高度）"""
+    if options['thumbnail']:
+        return grid_width * grid_height * options['thumbnail'] ** 2
+    return ((grid_width * options['block_size'] + options['axis_size']) *
+            (grid_height * options['block_size'] + options['axis_size'] + stats_height))
+
+
+class PatternWorker:
+    """工作进程内常驻的调色板、匹配器和色块贴图缓存"""
+
+    def __init__(self, sources, cache=None, max_output_pixels=MAX_OUTPUT_PIXELS):
+        self.cache = cache  # 结果缓存（None 时不使用）
+        self.max_output_pixels = max_output_pixels
+        self.palettes = {name: load_palette(path, name) for name, path in sources.items()}
+        self.lookups = {name: palette.color_lookup() for name, palette in self.palettes.items()}
+        self.matchers = {}  # (颜色源, 匹配方法) -> 不抖动的匹配器（颜色缓存跨请求保留）
+        self.tiles = {}  # (颜色源, 色块大小, 显示色号) -> 色块贴图
+        self.font, _ = load_fonts()
+
+    def warm(self, block_size=DEFAULT_BLOCK_SIZE):
+        """预先创建匹配器并绘制默认色块大小的贴图"""
+        for source in self.palettes:
+            for method in MATCHING_METHODS:
+                self.matcher(source, method, DITHER_NONE)
+            for show_codes in (True, False):
+                self.block_tiles(source, block_size, show_codes)
+
+    def matcher(self, source, method, dither, quality=None):
+        """获取匹配器（抖动匹配器保存行状态，每次请求新建；quality 只在不抖动时统计）"""
+        palette = self.palettes[source]
+        if dither != DITHER_NONE:
+            return create_matcher(palette, method, palette.codes, dither=dither)
+        key = (source, method)
+        matcher = self.matchers.get(key)
+        if matcher is None or len(matcher.cache) > MATCHER_CACHE_LIMIT:
+            matcher = self.matchers[key] = create_matcher(palette, method, palette.codes)
+        matcher.quality = quality  # 颜色缓存跨请求保留，质量统计每个请求单独累计
+        return matcher
+
+    def block_tiles(self, source, block_size, show_codes):
+        """获取色块贴图（按颜色源、色块大小和是否显示色号缓存）"""
+        key = (source, block_size, show_codes)
+        tiles = self.tiles.get(key)
+        if tiles is None:
+            tiles = self.tiles[key] = build_block_tiles(self.palettes[source].codes, self.lookups[source],
+                                                        block_size, show_codes, self.font)
+        return tiles
+
+    def check_output_size(self, grid_width, grid_height, options, stats_height=0):
+        """输出图片超过像素数上限时抛出 OutputTooLarge"""
+        pixels = output_pixels(grid_width, grid_height, options, stats_height)
+        if pixels > self.max_output_pixels:
+            raise OutputTooLarge(f'输出图片过大: {pixels} 像素（网格 {grid_width}x{grid_height}），'
+                                 f'上限 {self.max_output_pixels} 像素，请减小 width/height 或 block_size')
+
+    def process(self, image_bytes, options):
+        """处理一张图片，返回结果字典（图片数据、网格尺寸、色号统计和各阶段耗时）"""
+        started = time.time()
+        source = options['source']
+        palette = self.palettes[source]
+        with span('request'):
+            entry = None
+            if self.cache is not None:
+                with span('cache'):
+                    key = result_key(data_digest(image_bytes), palette, options['method'],
+                                     match_options(options['dither'], (options['width'], options['height']),
+                                                   options['resample'], background=options['background']))
+                    entry = self.cache.get(key)
+
+            if entry is not None:
+                # 命中缓存：跳过解码、裁剪、缩小和匹配
+                indices = entry['indices']
+                color_statistics = entry['color_statistics']
+                original_size = tuple(entry['info']['original_size'])
+                trimmed_size = tuple(entry['info']['trimmed_size'])
+                quality_summary = entry['info'].get('quality')
+            else:
+                with span('load'):
+                    pixels = load_source_pixels(Image.open(io.BytesIO(image_bytes)))
+                original_size = (pixels.shape[1], pixels.shape[0])
+                with span('trim'):
+                    mask = options['background'].mask(pixels)
+                    trimmed, keep_rows, keep_cols = trim_transparent(pixels, mask)
+                    mask = mask[keep_rows][:, keep_cols]
+                if not trimmed.size:
+                    raise ValueError('图片完全透明，无法处理！')
+                trimmed_size = (trimmed.shape[1], trimmed.shape[0])
+                grid_width, grid_height = fit_grid_size(trimmed.shape[1], trimmed.shape[0],
+                                                        options['width'], options['height'])
+                self.check_output_size(grid_width, grid_height, options)  # 匹配前先按不含统计区域的尺寸检查
+                with span('resample'):
+                    trimmed, mask = downscale_masked(trimmed, mask, grid_width, grid_height, options['resample'])
+                quality = MatchQuality()
+                with span('match'):
+                    matcher = self.matcher(source, options['method'], options['dither'], quality)
+                    indices = matcher.match(trimmed, mask)
+                quality_summary = quality.summary() if quality.pixels else None
+                color_statistics = None
+
+            # 服务只渲染结果，不需要交互编辑用的色块字典
+            grid_height, grid_width = indices.shape
+            grid = ImageGrid(grid_width, grid_height, options['block_size'], options['axis_size'],
+                             palette.codes)
+            grid.indices = grid.original_indices = indices
+            if color_statistics is None:
+                color_statistics = grid.color_statistics()
+                if self.cache is not None:
+                    with span('cache'):
+                        self.cache.put(key, indices, palette.codes, color_statistics,
+                                       result_info(original_size, trimmed_size, quality_summary))
+            stats_height = 0
+            if not options['thumbnail']:
+                stats_height = calculate_stats_height(color_statistics,
+                                                      grid_width * options['block_size'] + options['axis_size'])
+            self.check_output_size(grid_width, grid_height, options, stats_height)
+            with span('render'):
+                if options['thumbnail']:
+                    # 预览 / 列表用的缩略图：每个色块 N×N 像素，无坐标轴、色号和统计
+                    image = Image.fromarray(render_thumbnail(grid, self.lookups[source], options['thumbnail']))
+                else:
+                    tiles = self.block_tiles(source, options['block_size'], options['show_codes'])
+                    image = render_full_image_parallel(grid, self.lookups[source], options['show_codes'],
+                                                       color_statistics, threads=1, tiles=tiles)
+            with span('encode'):
+                output = io.BytesIO()
+                used_format = save_output_image(image, output, options['save_format'],
+                                                options['compress_level'])
+
+        run = PROFILER.last_run
+        prefix = run['name'] + '/'
+        stages = {name[len(prefix):]: seconds for name, seconds in run['spans'].items()
+                  if name.startswith(prefix) and '/' not in name[len(prefix):]}
+        return {
+            'image': output.getvalue(),
+            'extension': OUTPUT_FORMATS[used_format],
+            'original_size': original_size,
+            'cache_hit': entry is not None,
+            'grid_size': (grid_width, grid_height),
+            'output_size': image.size,
+            'color_statistics': color_statistics,
+            'quality': quality_summary,
+            'started': started,
+            'seconds': run['seconds'],
+            'stages': stages,
+        }
+
+
+_worker = None  # 工作进程内的 PatternWorker
+
+
+def _init_worker(sources, cache_dir, cache_bytes, max_output_pixels):
+    global _worker
+    _worker = PatternWorker(sources, ResultCache(cache_dir, cache_bytes) if cache_bytes > 0 else None,
+                            max_output_pixels)
+    _worker.warm()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _process(image_bytes, options):
+    return _worker.process(image_bytes, options)
+
+
+class PatternService:
+    """工作进程池和请求排队控制"""
+
+    def __init__(self, workers=None, max_queue=16, timeout=120.0, sources=None,
+                 cache_dir=RESULT_CACHE_DIR, cache_bytes=RESULT_CACHE_BYTES, max_output_pixels=MAX_OUTPUT_PIXELS):
+        self.sources = sources if sources is not None else color_source_files()
+        if not self.sources:
+            raise ValueError('没有可用的颜色数据文件')
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                        initargs=(self.sources, cache_dir, cache_bytes, max_output_pixels))
+        self.slots = threading.BoundedSemaphore(self.workers + max_queue)  # 处理中 + 排队的请求数上限
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+
+    def warm(self):
+        """启动所有工作进程并等待预热完成"""
+        wait([self.pool.submit(_ping) for _ in range(self.workers)])
+
+    def status(self):
+        with self._lock:
+            in_flight = self.in_flight
+            completed = self.completed
+        return {'workers': self.workers, 'active': min(in_flight, self.workers),
+                'queued': max(0, in_flight - self.workers), 'max_queue': self.max_queue,
+                'completed': completed}
+
+    def try_acquire(self):
+        """占用一个请求名额，处理中和排队的请求已满时返回 False"""
+        return self.slots.acquire(blocking=False)
+
+    def process(self, image_bytes, options):
+        """提交到工作进程池并等待结果（调用前需已占用名额），返回 (结果, 提交时间)
+
+        名额在工作进程处理结束时才释放：等待超时（504）后仍在处理的请求继续占用名额，
+        避免超时请求堆积在进程池中；尚未开始处理的请求超时后取消。
+        """
+        submitted = time.time()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self.pool.submit(_process, image_bytes, options)
+        except BaseException:
+            self._finish()
+            raise
+        future.add_done_callback(self._finish)
+        try:
+            return future.result(self.timeout), submitted
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _finish(self, future=None):
+        """请求处理结束（完成、出错或取消），释放名额"""
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self.slots.release()
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class PatternRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 请求处理（service 由 PatternServer 提供）"""
+    server_version = 'PatternService/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_body(status, body, 'application/json; charset=utf-8', headers)
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {'error': message}, headers)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/sources':
+            self.send_json(200, {
+                'sources': list(self.service.sources),
+                'methods': list(MATCHING_METHODS),
+                'dither_modes': DITHER_MODES,
+                'resample_methods': RESAMPLE_METHODS,
+                'save_formats': list(OUTPUT_FORMATS),
+            })
+        elif path == '/health':
+            self.send_json(200, self.service.status())
+        else:
+            self.send_error_json(404, f'未知的路径: {path}')
+
+    def do_POST(self):
+        received = time.time()
+        url = urlsplit(self.path)
+        if url.path != '/process':
+            self.send_error_json(404, f'未知的路径: {url.path}')
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.send_error_json(400, 'Content-Length 无效')
+            return
+        if length <= 0:
+            self.send_error_json(400, '请求体为空，请上传图片文件内容')
+            return
+        if length > MAX_UPLOAD_BYTES:
+            self.send_error_json(413, f'图片超过 {MAX_UPLOAD_BYTES >> 20} MB')
+            return
+        image_bytes = self.rfile.read(length)
+
+        try:
+            options = parse_options(parse_qs(url.query), self.service.sources)
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+
+        if not self.service.try_acquire():
+            self.send_error_json(503, '服务繁忙，请稍后重试', {'Retry-After': '1'})
+            return
+        try:
+            result, submitted = self.service.process(image_bytes, options)
+        except FutureTimeoutError:
+            self.send_error_json(504, '处理超时')
+            return
+        except OutputTooLarge as e:
+            self.send_error_json(413, str(e))
+            return
+        except (ValueError, OSError) as e:  # 无法识别的图片、完全透明等
+            self.send_error_json(400, f'处理出错: {e}')
+            return
+        except Exception as e:
+            self.send_error_json(500, f'处理出错: {e}')
+            return
+
+        headers = {
+            'X-Queue-Time': f'{max(0.0, result["started"] - submitted) * 1000:.1f}',
+            'X-Process-Time': f'{result["seconds"] * 1000:.1f}',
+            'X-Total-Time': f'{(time.time() - received) * 1000:.1f}',
+            'X-Stage-Times': ','.join(f'{name}={seconds * 1000:.1f}'
+                                      for name, seconds in result['stages'].items()),
+            'X-Grid-Size': '{}x{}'.format(*result['grid_size']),
+            'X-Cache': 'hit' if result['cache_hit'] else 'miss',
+        }
+        quality = result['quality']
+        if quality:
+            headers['X-Mean-Delta-E'] = f'{quality["mean_delta_e"]:.3f}'
+            headers['X-Max-Delta-E'] = f'{quality["max_delta_e"]:.3f}'
+            headers['X-Near-Ties'] = str(quality['near_ties'])
+        content_type = CONTENT_TYPES[result['extension']]
+        if options['output'] == 'json':
+            self.send_json(200, {
+                'original_size': result['original_size'],
+                'cache_hit': result['cache_hit'],
+                'grid_size': result['grid_size'],
+                'output_size': result['output_size'],
+                'color_statistics': result['color_statistics'],
+                'quality': quality,
+                'stages': {name: seconds * 1000 for name, seconds in result['stages'].items()},
+                'content_type': content_type,
+                'image': base64.b64encode(result['image']).decode('ascii'),
+            }, headers)
+        else:
+            self.send_body(200, result['image'], content_type, headers)
+
+
+class PatternServer(ThreadingHTTPServer):
+    """每个连接一个线程接收请求，处理交给 PatternService 的工作进程池"""
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, PatternRequestHandler)
+        self.service = service
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地图案生成 HTTP 服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--workers', type=int, help='工作进程数（同时处理的请求数，默认按CPU核数）')
+    parser.add_argument('--max-queue', type=int, default=16, help='排队请求数上限，超过时返回 503')
+    parser.add_argument('--timeout', type=float, default=120.0, help='单个请求的处理超时（秒）')
+    parser.add_argument('--cache-dir', default=RESULT_CACHE_DIR, help='结果缓存目录')
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_BYTES >> 20,
+                        help='结果缓存大小上限（MB，0 表示不使用缓存）')
+    parser.add_argument('--max-output-mp', type=int, default=MAX_OUTPUT_PIXELS >> 20,
+                        help='输出图片像素数上限（百万像素，超过时返回 413）')
+    args = parser.parse_args(argv)
+
+    service = PatternService(args.workers, args.max_queue, args.timeout,
+                             cache_dir=args.cache_dir, cache_bytes=args.cache_size << 20,
+                             max_output_pixels=args.max_output_mp << 20)
+    start = time.perf_counter()
+    service.warm()
+    print(f'{service.workers} 个工作进程已预热 ({time.perf_counter() - start:.1f} s)，'
+          f'颜色源: {", ".join(service.sources)}', flush=True)
+    server = PatternServer((args.host, args.port), service)
+    print(f'监听 http://{args.host}:{args.port}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+"""测试公共配置：模块位于仓库根目录，加入模块搜索路径；公共的调色板、测试图片和界面窗口"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from palette import load_palette  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def palette(tmp_path_factory):
+    """Mard144 调色板（编译缓存写入临时目录）"""
+    return load_palette(os.path.join(ROOT, 'color', 'Mard144.json'),
+                        cache_dir=str(tmp_path_factory.mktemp('palette_cache')))
+
+
+@pytest.fixture
+def pixel_art():
+    """带透明边框和白色区域的 RGBA 测试图片数组"""
+    rng = np.random.default_rng(1)
+    pixels = np.zeros((40, 52, 4), dtype=np.uint8)
+    colors = rng.integers(0, 256, (12, 3), dtype=np.uint8)
+    cells = rng.integers(0, len(colors), (32, 44))
+    pixels[4:36, 5:49, :3] = colors[cells]
+    pixels[4:36, 5:49, 3] = 255
+    pixels[10:14, 10:20, :3] = 255
+    return pixels
+
+
+@pytest.fixture(scope='session')
+def qt_app():
+    """无显示环境下的 QApplication（未安装 PyQt5 时跳过）"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    widgets = pytest.importorskip('PyQt5.QtWidgets')
+    return widgets.QApplication.instance() or widgets.QApplication([])
+
+
+@pytest.fixture
+def window(qt_app, monkeypatch, tmp_path, pixel_art):
+    """已处理测试图片、颜色源为 Mard144 的主窗口（颜色源从仓库目录读取，结果缓存写入临时目录）"""
+    from PIL import Image
+
+    import color_matcher
+    from profiling import PROFILER
+    from result_cache import ResultCache
+
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(PROFILER, '_listeners', [])  # 窗口关闭后不再接收阶段计时
+    matcher_window = color_matcher.ColorMatcher()
+    matcher_window.result_cache = ResultCache(str(tmp_path / 'result_cache'))
+    matcher_window.on_source_changed('Mard144')
+    image_path = str(tmp_path / 'image.png')
+    Image.fromarray(pixel_art).save(image_path)
+    matcher_window.image_path = image_path
+    matcher_window.process_image()
+    yield matcher_window
+    matcher_window.close()
@@ -0,0 +1,87 @@
+"""多帧图片处理测试"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from animation import load_frames, process_animation
+from dithering import DITHER_FLOYD_STEINBERG, DITHER_NONE, create_matcher
+from resampling import downscale_masked
+
+METHOD = 'LAB色彩空间'
+# 每帧不透明区域 (上, 下, 左, 右)，合并后为行 3~13、列 2~17
+FRAME_BOXES = [(3, 9, 4, 10), (5, 14, 2, 8), (4, 7, 9, 18)]
+
+
+@pytest.fixture
+def animation_path(tmp_path):
+    """三帧 APNG：每帧的不透明区域位置不同，颜色随机"""
+    rng = np.random.default_rng(4)
+    colors = rng.integers(0, 256, (10, 3), dtype=np.uint8)
+    frames = []
+    for top, bottom, left, right in FRAME_BOXES:
+        pixels = np.zeros((16, 20, 4), dtype=np.uint8)
+        pixels[top:bottom, left:right, :3] = colors[rng.integers(0, len(colors), (bottom - top, right - left))]
+        pixels[top:bottom, left:right, 3] = 255
+        frames.append(pixels)
+    path = str(tmp_path / 'animation.png')
+    images = [Image.fromarray(frame) for frame in frames]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=[100, 150, 200], loop=0)
+    return path, np.stack(frames)
+
+
+def process_single(palette, frame, dither, grid_size):
+    """单独匹配一帧（已按所有帧统一裁剪）"""
+    resized, mask = downscale_masked(frame, frame[..., 3] == 0, *grid_size)
+    return create_matcher(palette, METHOD, palette.codes, dither=dither).match(resized, mask)
+
+
+@pytest.mark.parametrize('dither', [DITHER_NONE, DITHER_FLOYD_STEINBERG])
+@pytest.mark.parametrize('target_size, grid_size', [((None, None), (16, 11)), ((8, None), (8, 6))])
+def test_process_animation(palette, animation_path, dither, target_size, grid_size):
+    """所有帧按合并后的不透明区域统一裁剪，每帧网格尺寸相同，结果与逐帧单独匹配相同"""
+    path, frames = animation_path
+    with Image.open(path) as img:
+        loaded, durations = load_frames(img)
+        assert np.array_equal(loaded, frames)
+        result = process_animation(img, palette, METHOD, palette.codes, dither=dither, target_size=target_size,
+                                   threads=2)
+
+    assert result['frame_count'] == 3
+    assert result['durations'] == durations == [100, 150, 200]
+    assert result['original_size'] == (20, 16)
+    assert result['trimmed_size'] == (16, 11)
+    assert result['grid_size'] == grid_size
+
+    trimmed = frames[:, 3:14, 2:18]
+    single_frame = [process_single(palette, frame, dither, grid_size) for frame in trimmed]
+    for grid, expected in zip(result['grids'], single_frame):
+        assert (grid.width, grid.height) == grid_size
+        assert np.array_equal(grid.indices, expected)
+
+    totals = {}
+    for grid, statistics in zip(result['grids'], result['frame_statistics']):
+        assert statistics == grid.color_statistics()
+        for code, number in statistics.items():
+            totals[code] = totals.get(code, 0) + number
+    assert result['color_statistics'] == totals
+
+
+def test_frames_stay_aligned(palette, animation_path):
+    """每帧中透明的位置在裁剪后的网格中为空白（帧之间对齐）"""
+    path, frames = animation_path
+    with Image.open(path) as img:
+        result = process_animation(img, palette, METHOD, palette.codes)
+    for grid, (top, bottom, left, right) in zip(result['grids'], FRAME_BOXES):
+        filled = grid.indices != grid.empty_index
+        expected = np.zeros((11, 16), dtype=bool)
+        expected[top - 3:bottom - 3, left - 2:right - 2] = True
+        assert np.array_equal(filled, expected)
+
+
+def test_all_frames_transparent(palette, tmp_path):
+    path = str(tmp_path / 'empty.png')
+    images = [Image.new('RGBA', (4, 3)), Image.new('RGBA', (4, 3), (1, 0, 0, 0))]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=100)
+    with Image.open(path) as img:
+        with pytest.raises(ValueError):
+            process_animation(img, palette, METHOD, palette.codes)
@@ -0,0 +1,105 @@
+"""背景检测测试"""
+from collections import deque
+
+import numpy as np
+import pytest
+
+from background import BackgroundDetector, edge_connected, parse_color
+
+
+def flood_fill(passable):
+    """参考实现：从边缘的可通行像素开始广度优先搜索（4 邻接）"""
+    height, width = passable.shape
+    reached = np.zeros_like(passable)
+    queue = deque((y, x) for y in range(height) for x in range(width)
+                  if passable[y, x] and (y in (0, height - 1) or x in (0, width - 1)))
+    for y, x in queue:
+        reached[y, x] = True
+    while queue:
+        y, x = queue.popleft()
+        for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)):
+            if 0 <= ny < height and 0 <= nx < width and passable[ny, nx] and not reached[ny, nx]:
+                reached[ny, nx] = True
+                queue.append((ny, nx))
+    return reached
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (1, 9), (9, 1), (12, 17), (40, 31)])
+@pytest.mark.parametrize('density', [0.0, 0.3, 0.55, 0.7, 1.0])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_edge_connected_matches_flood_fill(shape, density, seed):
+    """向量化并查集的结果与广度优先搜索相同"""
+    passable = np.random.default_rng(seed).random(shape) < density
+    assert np.array_equal(edge_connected(passable), flood_fill(passable))
+
+
+@pytest.mark.parametrize('entrance', [True, False])
+def test_edge_connected_serpentine(entrance):
+    """蛇形通道（需要多轮合并）：有入口时整条通道与边缘连通，没有入口时全部删除"""
+    passable = np.zeros((21, 21), dtype=bool)
+    for row in range(1, 20, 2):
+        passable[row, 1:20] = True
+        if row < 19:
+            passable[row + 1, 19 if row % 4 == 1 else 1] = True
+    passable[0, 1] = entrance
+    expected = passable if entrance else np.zeros_like(passable)
+    assert np.array_equal(flood_fill(passable), expected)
+    assert np.array_equal(edge_connected(passable), expected)
+
+
+def test_alpha_and_color_rules():
+    """透明度阈值；未指定背景色时只有 RGB 图片按白色检测；指定背景色时按容差检测"""
+    rgba = np.zeros((1, 4, 4), dtype=np.uint8)
+    rgba[0, :, :3] = [[255, 255, 255], [250, 251, 255], [10, 20, 30], [16, 24, 35]]
+    rgba[0, :, 3] = [0, 10, 255, 255]
+    assert BackgroundDetector().mask(rgba).tolist() == [[True, False, False, False]]
+    assert BackgroundDetector(alpha_threshold=10).mask(rgba).tolist() == [[True, True, False, False]]
+    assert BackgroundDetector(key_color=(10, 20, 30), tolerance=5).mask(rgba).tolist() == \
+        [[True, False, True, False]]
+    assert BackgroundDetector(key_color=(10, 20, 30), tolerance=6).mask(rgba).tolist() == \
+        [[True, False, True, True]]
+
+    rgb = rgba[..., :3]
+    assert BackgroundDetector().mask(rgb).tolist() == [[True, True, False, False]]
+    assert BackgroundDetector(tolerance=4).mask(rgb).tolist() == [[True, False, False, False]]
+
+
+def test_edge_connected_detector():
+    """边缘连通时图案内部与背景同色的区域保留，透明像素可以连通"""
+    pixels = np.full((7, 7, 4), 255, dtype=np.uint8)
+    pixels[1:6, 1:6, :3] = 0  # 黑色边框
+    pixels[2:5, 2:5, :3] = 255  # 内部的白色区域
+    pixels[0, :, 3] = 0  # 顶部透明
+    pixels[1, 3, :3] = 255  # 边框上的缺口：内部白色区域经透明像素与边缘连通
+    detector = BackgroundDetector(key_color=(255, 255, 255), edge_connected=True)
+    mask = detector.mask(pixels)
+    assert mask[3, 3] and mask[1, 3]
+
+    pixels[1, 3, :3] = 0
+    mask = detector.mask(pixels)
+    assert not mask[2:5, 2:5].any()
+    assert mask[0].all() and mask[6].all() and mask[:, 0].all()
+    plain = BackgroundDetector(key_color=(255, 255, 255)).mask(pixels)
+    assert plain[2:5, 2:5].all()
+
+    # 多帧时逐帧计算
+    frames = np.stack([pixels, np.full_like(pixels, 255)])
+    frame_masks = detector.mask(frames)
+    assert np.array_equal(frame_masks[0], mask)
+    assert frame_masks[1].all()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', None),
+    ('  ', None),
+    ('#FF8000', (255, 128, 0)),
+    ('12, 34,56', (12, 34, 56)),
+])
+def test_parse_color(text, expected):
+    assert parse_color(text) == expected
+
+
+@pytest.mark.parametrize('text', ['#FFF', '1,2', '1,2,256', 'red', '#GG0000'])
+def test_parse_color_errors(text):
+    with pytest.raises(ValueError):
+        parse_color(text)
@@ -0,0 +1,28 @@
+"""分板输出测试"""
+import numpy as np
+
+from boards import ALIGN_CENTER, split_boards
+from pipeline import build_grid
+
+
+def test_split_boards(palette):
+    """分板内容、统计正确，每块板的当前索引和原始索引互不共享"""
+    codes = palette.codes
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, 3, (30, 31)).astype(np.uint8)
+    grid = build_grid(indices, codes)
+    boards = split_boards(grid, 29, 29, ALIGN_CENTER)
+    assert [(board['row'], board['column']) for board in boards] == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+    total = {}
+    for board in boards:
+        board_grid = board['grid']
+        assert not np.shares_memory(board_grid.indices, board_grid.original_indices)
+        assert board['color_statistics'] == board_grid.color_statistics()
+        for code, number in board['color_statistics'].items():
+            total[code] = total.get(code, 0) + number
+    assert total == grid.color_statistics()
+
+    board_grid = boards[0]['grid']
+    board_grid.indices[-1, -1] = 5
+    assert board_grid.original_indices[-1, -1] != 5
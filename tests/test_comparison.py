@@ -0,0 +1,68 @@
+"""匹配方法 / 颜色源对比测试"""
+import numpy as np
+import pytest
+
+from comparison import compare_methods, comparison_thumbnail
+from matching import PaletteMatcher, delta_e_ciede2000
+from palette import Palette, rgb_to_lab_array
+from pipeline import trim_transparent
+
+METHODS = ['RGB欧氏距离', 'CIEDE2000']
+
+
+def reference_result(pixels, mask, palette, method):
+    """逐像素匹配计算的颜色数和按像素平均 / 最大 ΔE，以及每个格子匹配到的颜色（透明为白色）"""
+    matcher = PaletteMatcher(palette, method)
+    colors = np.full(pixels.shape[:2] + (3,), 255, dtype=np.uint8)
+    codes, errors = set(), []
+    matched = {}  # 颜色 -> (调色板索引, ΔE)
+    for y, x in zip(*np.nonzero(~mask)):
+        color = tuple(int(c) for c in pixels[y, x, :3])
+        if color not in matched:
+            index = palette.code_index[matcher(color)]
+            matched[color] = index, float(delta_e_ciede2000(rgb_to_lab_array(color), palette.lab[index]))
+        index, error = matched[color]
+        codes.add(index)
+        errors.append(error)
+        colors[y, x] = palette.rgb[index]
+    return len(codes), float(np.mean(errors)), float(np.max(errors)), colors
+
+
+def test_compare_methods_matches_per_pixel(palette, pixel_art):
+    """每个组合的颜色数、平均 / 最大 ΔE 和缩略图与逐像素匹配的结果相同"""
+    trimmed, _, _ = trim_transparent(pixel_art)
+    trimmed[0, :5, 3] = 0  # 裁剪区域内的透明格子
+    mask = trimmed[..., 3] == 0
+    other = Palette('三色', ['黑', '白', '红'], [[0, 0, 0], [255, 255, 255], [255, 0, 0]])
+    results = compare_methods(trimmed, [palette, other], METHODS, thumbnail_size=100, mask=mask)
+    assert [(result['palette'], result['method']) for result in results] == \
+        [(p.name, method) for p in (palette, other) for method in METHODS]
+
+    for result, (p, method) in zip(results, [(p, m) for p in (palette, other) for m in METHODS]):
+        color_count, mean_delta_e, max_delta_e, colors = reference_result(trimmed, mask, p, method)
+        assert result['color_count'] == color_count
+        assert result['mean_delta_e'] == pytest.approx(mean_delta_e)
+        assert result['max_delta_e'] == pytest.approx(max_delta_e)
+        scale = 100 // max(trimmed.shape[:2])
+        assert np.array_equal(result['thumbnail'], np.repeat(np.repeat(colors, scale, axis=0), scale, axis=1))
+
+
+def test_compare_methods_all_transparent(palette):
+    """全部透明时颜色数和 ΔE 为 0，缩略图为白色"""
+    pixels = np.zeros((4, 6, 4), dtype=np.uint8)
+    result, = compare_methods(pixels, [palette], ['LAB色彩空间'], thumbnail_size=12)
+    assert (result['color_count'], result['mean_delta_e'], result['max_delta_e']) == (0, 0.0, 0.0)
+    assert result['thumbnail'].shape == (8, 12, 3)
+    assert (result['thumbnail'] == 255).all()
+
+
+def test_thumbnail_samples_large_grids():
+    """网格大于缩略图尺寸时等间隔抽样，最长边不超过缩略图尺寸"""
+    color_grid = np.arange(250 * 70).reshape(70, 250) % 3
+    color_grid[0, 0] = -1
+    colors = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]], dtype=np.uint8)
+    thumbnail = comparison_thumbnail(color_grid, colors, size=100)
+    assert thumbnail.shape == (24, 84, 3)
+    expected = colors[color_grid[::3, ::3]]
+    expected[0, 0] = 255
+    assert np.array_equal(thumbnail, expected)
@@ -0,0 +1,64 @@
+"""误差扩散抖动测试"""
+import numpy as np
+import pytest
+
+from dithering import ErrorDiffusionMatcher, quantization_lut
+
+METHOD = 'LAB色彩空间'
+
+
+def reference_floyd_steinberg(palette, pixels, opaque, serpentine=False, bits=5):
+    """逐像素扫描的参考实现，返回调色板索引（透明像素为 -1）"""
+    lut = quantization_lut(palette, METHOD, bits)
+    palette_rgb = palette.rgb.astype(np.float64)
+    height, width = opaque.shape
+    shift = 8 - bits
+    errors = np.zeros((height + 1, width + 2, 3))
+    result = np.full((height, width), -1)
+    for y in range(height):
+        step = -1 if serpentine and y % 2 else 1
+        for x in (range(width - 1, -1, -1) if step < 0 else range(width)):
+            if not opaque[y, x]:
+                continue
+            value = np.clip(pixels[y, x, :3] + errors[y, x + 1], 0.0, 255.0)
+            level = value.astype(int) >> shift
+            index = lut[level[0] << 2 * bits | level[1] << bits | level[2]]
+            result[y, x] = index
+            error = value - palette_rgb[index]
+            errors[y, x + 1 + step] += error * 0.4375
+            errors[y + 1, x + 1 - step] += error * 0.1875
+            errors[y + 1, x + 1] += error * 0.3125
+            errors[y + 1, x + 1 + step] += error * 0.0625
+    return result
+
+
+def gradient(height, width, seed=0):
+    """带随机透明像素的渐变测试图片"""
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    pixels[..., 0] = x * 255 // max(1, width - 1)
+    pixels[..., 1] = y * 255 // max(1, height - 1)
+    pixels[..., 2] = (x * 7 + y * 3) % 256
+    pixels[..., 3] = 255
+    pixels[np.random.default_rng(seed).random((height, width)) < 0.05, 3] = 0
+    return pixels
+
+
+@pytest.mark.parametrize('serpentine', [False, True])
+@pytest.mark.parametrize('bands', [[30], [3, 11, 16], [1, 1, 28]])
+def test_matches_reference(palette, serpentine, bands):
+    """按任意行带分批匹配的结果与逐像素参考实现相同（波前批量处理和逐行处理）"""
+    pixels = gradient(sum(bands), 23)
+    opaque = pixels[..., 3] > 0
+    codes = palette.codes
+    matcher = ErrorDiffusionMatcher(palette, METHOD, codes, serpentine=serpentine)
+    start = 0
+    parts = []
+    for rows in bands:
+        parts.append(matcher.match(pixels[start:start + rows]))
+        start += rows
+    indices = np.concatenate(parts)
+
+    expected = reference_floyd_steinberg(palette, pixels.astype(np.float64), opaque, serpentine)
+    assert np.array_equal(indices == matcher.empty, expected < 0)
+    assert np.array_equal(indices[opaque], matcher.code_lut[expected[opaque]])
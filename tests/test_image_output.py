@@ -0,0 +1,56 @@
+"""处理结果图片保存测试"""
+import numpy as np
+import pytest
+from PIL import Image, features
+
+import image_output
+from image_output import OUTPUT_PNG, OUTPUT_PNG_PALETTE, OUTPUT_WEBP_LOSSLESS, save_output_image
+
+
+def image_with_colors(count, seed=0):
+    """恰好包含 count 种颜色的 RGB 图片"""
+    rng = np.random.default_rng(seed)
+    colors = rng.choice(1 << 24, count, replace=False)
+    colors = np.stack([colors >> 16, (colors >> 8) & 0xFF, colors & 0xFF], axis=-1).astype(np.uint8)
+    pixels = np.concatenate([colors, colors[rng.integers(0, count, 64 * 40 - count)]])
+    return Image.fromarray(pixels.reshape(40, 64, 3))
+
+
+def saved_pixels(path):
+    with Image.open(path) as saved:
+        return saved.mode, np.asarray(saved.convert('RGB'))
+
+
+@pytest.mark.parametrize('count', [1, 200, 256])
+@pytest.mark.parametrize('band_pixels', [image_output.PALETTE_BAND_PIXELS, 100])
+def test_palette_png(tmp_path, monkeypatch, count, band_pixels):
+    """颜色数不超过 256 时保存为 P 模式，颜色完全不变（包括相近的颜色，按行带转换时也相同）"""
+    monkeypatch.setattr(image_output, 'PALETTE_BAND_PIXELS', band_pixels)
+    image = image_with_colors(count)
+    path = str(tmp_path / 'out.png')
+    assert save_output_image(image, path, OUTPUT_PNG_PALETTE) == OUTPUT_PNG_PALETTE
+    mode, pixels = saved_pixels(path)
+    assert mode == 'P'
+    assert np.array_equal(pixels, np.asarray(image))
+
+
+def test_palette_png_falls_back_above_256_colors(tmp_path):
+    """颜色数超过 256 时回退为 RGB PNG，返回实际使用的格式"""
+    image = image_with_colors(257)
+    path = str(tmp_path / 'out.png')
+    assert save_output_image(image, path, OUTPUT_PNG_PALETTE, compress_level=1) == OUTPUT_PNG
+    mode, pixels = saved_pixels(path)
+    assert mode == 'RGB'
+    assert np.array_equal(pixels, np.asarray(image))
+
+
+@pytest.mark.skipif(not features.check('webp'), reason='PIL 不支持 WebP')
+@pytest.mark.parametrize('compress_level', [0, 6, 9])
+def test_webp_lossless_round_trip(tmp_path, compress_level):
+    """无损 WebP 读回后像素完全相同"""
+    image = image_with_colors(1000, seed=compress_level)
+    path = str(tmp_path / 'out.webp')
+    assert save_output_image(image, path, OUTPUT_WEBP_LOSSLESS, compress_level) == OUTPUT_WEBP_LOSSLESS
+    with Image.open(path) as saved:
+        assert saved.format == 'WEBP'
+        assert np.array_equal(np.asarray(saved.convert('RGB')), np.asarray(image))
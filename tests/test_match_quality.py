@@ -0,0 +1,79 @@
+"""匹配质量统计测试"""
+import numpy as np
+import pytest
+
+from match_quality import MatchQuality, format_quality
+from matching import (DISTANCE_KERNELS, NEAR_TIE_RATIO, SQUARED_DISTANCE_METHODS, PaletteMatcher,
+                      delta_e_ciede2000)
+from palette import rgb_to_lab_array
+from pipeline import UniqueColorMatcher, trim_transparent
+
+
+def reference_quality(pixels, mask, palette, method):
+    """逐像素计算：匹配到的色号、与匹配颜色的 CIEDE2000 色差、最近和次近距离是否接近并列"""
+    rgb = pixels[~mask][:, :3].astype(np.int64)
+    distances = DISTANCE_KERNELS[method](palette, rgb).astype(np.float64)
+    if method in SQUARED_DISTANCE_METHODS:
+        distances = np.sqrt(distances)
+    nearest = np.argmin(distances, axis=1)
+    ordered = np.sort(distances, axis=1)
+    ties = ordered[:, 1] - ordered[:, 0] <= NEAR_TIE_RATIO * ordered[:, 1]
+    delta_e = np.array([float(delta_e_ciede2000(rgb_to_lab_array(color), palette.lab[index]))
+                        for color, index in zip(rgb, nearest)])
+    return [palette.codes[i] for i in nearest], delta_e, ties
+
+
+@pytest.mark.parametrize('method', ['LAB色彩空间', 'CIEDE2000'])
+def test_quality_matches_per_pixel(palette, pixel_art, method):
+    """按去重颜色、分行带累计的匹配质量与逐像素计算相同（按像素数加权，颜色替换前的色号）"""
+    trimmed, _, _ = trim_transparent(pixel_art)
+    trimmed[0, :7, 3] = 0
+    mask = trimmed[..., 3] == 0
+    quality = MatchQuality()
+    replacement = {palette.codes[0]: palette.codes[1]}
+    matcher = UniqueColorMatcher(PaletteMatcher(palette, method), palette.codes, replacement, quality)
+    for start in range(0, len(trimmed), 10):  # 跨行带累计（后续行带的颜色来自缓存）
+        matcher.match(trimmed[start:start + 10], mask[start:start + 10])
+
+    codes, delta_e, ties = reference_quality(trimmed, mask, palette, method)
+    summary = quality.summary()
+    assert summary['pixels'] == len(codes)
+    assert summary['mean_delta_e'] == pytest.approx(delta_e.mean())
+    assert summary['max_delta_e'] == pytest.approx(delta_e.max())
+    assert summary['near_ties'] == int(ties.sum())
+    assert summary['near_tie_ratio'] == pytest.approx(ties.mean())
+
+    codes = np.array(codes, dtype=object)
+    assert set(summary['per_code']) == set(codes)
+    for code, stats in summary['per_code'].items():
+        selected = codes == code
+        assert stats['pixels'] == int(selected.sum())
+        assert stats['mean_delta_e'] == pytest.approx(delta_e[selected].mean())
+        assert stats['max_delta_e'] == pytest.approx(delta_e[selected].max())
+    means = [stats['mean_delta_e'] for stats in summary['per_code'].values()]
+    assert means == sorted(means, reverse=True)
+
+
+def test_add_weights_by_counts():
+    """每种颜色按像素数加权；空的分组不改变结果"""
+    quality = MatchQuality()
+    quality.add(['A', 'B'], [1.0, 4.0], [False, True], [3, 1])
+    quality.add([], [], [], [])
+    quality.add(['A'], [2.0], [True], [4])
+    summary = quality.summary()
+    assert summary['pixels'] == 8
+    assert summary['mean_delta_e'] == pytest.approx((3 * 1.0 + 4.0 + 4 * 2.0) / 8)
+    assert summary['max_delta_e'] == 4.0
+    assert summary['near_ties'] == 5
+    assert summary['per_code'] == {
+        'B': {'pixels': 1, 'mean_delta_e': 4.0, 'max_delta_e': 4.0},
+        'A': {'pixels': 7, 'mean_delta_e': pytest.approx(11.0 / 7), 'max_delta_e': 2.0},
+    }
+    assert list(summary['per_code']) == ['B', 'A']
+    assert 'B(4.0)' in format_quality(summary)
+
+
+def test_empty_quality():
+    summary = MatchQuality().summary()
+    assert (summary['pixels'], summary['mean_delta_e'], summary['near_tie_ratio']) == (0, 0.0, 0.0)
+    assert format_quality(summary) == ''
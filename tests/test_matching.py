@@ -0,0 +1,170 @@
+"""色差公式和批量匹配测试"""
+import numpy as np
+import pytest
+
+import os
+
+from conftest import ROOT
+from matching import (DISTANCE_KERNELS, PaletteMatcher, delta_e_cie94, delta_e_ciede2000, distance_matrix,
+                      nearest_indices, palette_code_mapping, substitute_table)
+from palette import Palette, load_palette, rgb_to_lab_array
+
+# Sharma, Wu, Dalal (2005) CIEDE2000 测试数据：(L1, a1, b1, L2, a2, b2, ΔE00)
+SHARMA_PAIRS = [
+    (50.0000, 2.6772, -79.7751, 50.0000, 0.0000, -82.7485, 2.0425),
+    (50.0000, 3.1571, -77.2803, 50.0000, 0.0000, -82.7485, 2.8615),
+    (50.0000, 2.8361, -74.0200, 50.0000, 0.0000, -82.7485, 3.4412),
+    (50.0000, -1.3802, -84.2814, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -1.1848, -84.8006, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -0.9009, -85.5211, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, 0.0000, 0.0000, 50.0000, -1.0000, 2.0000, 2.3669),
+    (50.0000, -1.0000, 2.0000, 50.0000, 0.0000, 0.0000, 2.3669),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0009, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0010, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0011, 7.2195),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0012, 7.2195),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0009, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0010, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0011, -2.4900, 4.7461),
+    (50.0000, 2.5000, 0.0000, 50.0000, 0.0000, -2.5000, 4.3065),
+    (50.0000, 2.5000, 0.0000, 73.0000, 25.0000, -18.0000, 27.1492),
+    (50.0000, 2.5000, 0.0000, 61.0000, -5.0000, 29.0000, 22.8977),
+    (50.0000, 2.5000, 0.0000, 56.0000, -27.0000, -3.0000, 31.9030),
+    (50.0000, 2.5000, 0.0000, 58.0000, 24.0000, 15.0000, 19.4535),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.1736, 0.5854, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2972, 0.0000, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 1.8634, 0.5757, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2592, 0.3350, 1.0000),
+    (60.2574, -34.0099, 36.2677, 60.4626, -34.1751, 39.4387, 1.2644),
+    (63.0109, -31.0961, -5.8663, 62.8187, -29.7946, -4.0864, 1.2630),
+    (61.2901, 3.7196, -5.3901, 61.4292, 2.2480, -4.9620, 1.8731),
+    (35.0831, -44.1164, 3.7933, 35.0232, -40.0716, 1.5901, 1.8645),
+    (22.7233, 20.0904, -46.6940, 23.0331, 14.9730, -42.5619, 2.0373),
+    (36.4612, 47.8580, 18.3852, 36.2715, 50.5065, 21.2231, 1.4146),
+    (90.8027, -2.0831, 1.4410, 91.1528, -1.6435, 0.0447, 1.4441),
+    (90.9257, -0.5406, -0.9208, 88.6381, -0.8985, -0.7239, 1.5381),
+    (6.7747, -0.2908, -2.4247, 5.8714, -0.0985, -2.2286, 0.6377),
+    (2.0776, 0.0795, -1.1350, 0.9033, -0.0636, -0.5514, 0.9082),
+]
+
+# CIE94（图形艺术参数）参考值：(参考色 Lab, 样本色 Lab, ΔE94)
+CIE94_CASES = [
+    ((100.0, 21.57210357, 272.2281935), (100.0, 426.67945353, 72.39590835), 83.779225500887094),
+    ((50.0, 0.0, 0.0), (50.0, 3.0, 4.0), 5.0),  # 参考色彩度为0时 SC = SH = 1
+    ((50.0, 3.0, 4.0), (50.0, 0.0, 0.0), 5.0 / 1.225),  # 只有彩度差：ΔC / (1 + 0.045 × 5)
+    ((50.0, 10.0, 20.0), (40.0, 10.0, 20.0), 10.0),  # 只有明度差
+]
+
+
+def test_ciede2000_sharma_pairs():
+    """CIEDE2000 与 Sharma 测试数据一致（四位小数），交换两色结果不变"""
+    data = np.array(SHARMA_PAIRS)
+    lab1, lab2, expected = data[:, :3], data[:, 3:6], data[:, 6]
+    assert np.max(np.abs(np.round(delta_e_ciede2000(lab1, lab2), 4) - expected)) == 0.0
+    assert np.allclose(delta_e_ciede2000(lab2, lab1), delta_e_ciede2000(lab1, lab2))
+
+
+@pytest.mark.parametrize('reference, sample, expected', CIE94_CASES)
+def test_cie94_reference_values(reference, sample, expected):
+    """CIE94 与参考值一致"""
+    assert delta_e_cie94(reference, sample) == pytest.approx(expected, abs=1e-9)
+
+
+def test_cie94_vectorised_matches_scalar():
+    """广播计算与逐对计算结果相同"""
+    rng = np.random.default_rng(0)
+    lab1 = rng.uniform([0, -100, -100], [100, 100, 100], (20, 3))
+    lab2 = rng.uniform([0, -100, -100], [100, 100, 100], (30, 3))
+    matrix = delta_e_cie94(lab1[:, None, :], lab2[None, :, :])
+    assert matrix.shape == (20, 30)
+    assert matrix[3, 7] == pytest.approx(delta_e_cie94(lab1[3], lab2[7]))
+
+
+@pytest.mark.parametrize('method', ['CIE94', 'CIEDE2000'])
+def test_nearest_indices_minimise_delta_e(palette, method):
+    """批量匹配结果为色差最小的调色板颜色，与单色匹配函数一致"""
+    rng = np.random.default_rng(2)
+    rgb = rng.integers(0, 256, (200, 3))
+    formula = delta_e_cie94 if method == 'CIE94' else delta_e_ciede2000
+    expected = np.argmin(formula(rgb_to_lab_array(rgb)[:, None, :], palette.lab[None, :, :]), axis=1)
+    assert np.array_equal(nearest_indices(palette, rgb, method), expected)
+
+    matcher = PaletteMatcher(palette, method)
+    codes = palette.codes
+    for color, index in zip(rgb[:10].tolist(), expected[:10].tolist()):
+        assert matcher(tuple(color)) == codes[index]
+
+
+class Dialog:
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize('method', list(DISTANCE_KERNELS))
+def test_distance_matrix(palette, method):
+    """距离矩阵与逐色号批量计算相同，按匹配方法缓存在调色板上"""
+    matrix = distance_matrix(palette, method)
+    assert matrix.shape == (len(palette), len(palette))
+    assert np.allclose(matrix, DISTANCE_KERNELS[method](palette, palette.rgb))
+    assert np.allclose(np.diag(matrix), 0.0)
+    assert palette.distance_matrices[method] is matrix
+    assert distance_matrix(palette, method) is matrix
+
+
+@pytest.mark.parametrize('method', ['RGB欧氏距离', 'CIEDE2000'])
+def test_substitute_table(palette, method):
+    """替代色表为每个色号距离最近的其他色号（按距离升序，不包括自身），按 (方法, k) 缓存"""
+    table = substitute_table(palette, method, 4)
+    matrix = distance_matrix(palette, method)
+    assert table.shape == (len(palette), 4)
+    for index, row in enumerate(table):
+        assert index not in row
+        others = np.delete(matrix[index], index)
+        assert np.allclose(matrix[index, row], np.sort(others)[:4])
+    assert palette.substitute_tables[(method, 4)] is table
+    assert substitute_table(Palette('两色', ['A', 'B'], [[0, 0, 0], [9, 9, 9]]), method, 4).tolist() == [[1], [0]]
+
+
+def test_palette_code_mapping(palette):
+    """色号映射到目标调色板中颜色最接近的色号；目标中已有、源中没有的色号不变，都没有时报错"""
+    target = Palette('目标', ['黑', '白', '红'], [[0, 0, 0], [255, 255, 255], [255, 0, 0]])
+    mapping = palette_code_mapping(palette, target, 'LAB色彩空间', palette.codes[:20] + ['红'])
+    expected = nearest_indices(target, palette.rgb[:20], 'LAB色彩空间')
+    assert mapping == dict({code: target.codes[i] for code, i in zip(palette.codes[:20], expected)}, 红='红')
+    assert palette_code_mapping(palette, palette, 'CIEDE2000') == {code: code for code in palette.codes}
+    with pytest.raises(ValueError):
+        palette_code_mapping(palette, target, 'LAB色彩空间', ['不存在'])
+
+
+def grid_codes(grid, indices):
+    """网格索引数组转换为色号数组（空白为 None）"""
+    codes = np.array(grid.codes + [None], dtype=object)
+    return codes[np.where(indices == grid.empty_index, len(grid.codes), indices)]
+
+
+def test_convert_pattern(window):
+    """界面中转换颜色源：网格、颜色替换和替换历史中的色号都映射到目标颜色源中最接近的颜色"""
+    grid = window.image_grid
+    used = list(grid.color_statistics())
+    window.color_replacement = {used[0]: used[1]}
+    window.replacement_history = [{}, {used[2]: used[3]}]
+    source_palette = window.palette
+    method = window.method_combo.currentText()
+    target_palette = load_palette(os.path.join(ROOT, 'color', 'Mard221.json'), 'Mard221')
+    mapping = palette_code_mapping(source_palette, target_palette, method, source_palette.codes)
+
+    window.convert_pattern('Mard221', Dialog())
+    assert window.current_source == 'Mard221'
+    assert window.palette is target_palette
+    converted = window.image_grid
+    for before, after in ((grid.indices, converted.indices), (grid.original_indices, converted.original_indices)):
+        expected = np.vectorize(lambda code: None if code is None else mapping[code], otypes=[object])(
+            grid_codes(grid, before))
+        assert np.array_equal(grid_codes(converted, after), expected)
+
+    def converted_replacement(replacement):
+        pairs = ((mapping[source], mapping[target]) for source, target in replacement.items())
+        return {source: target for source, target in pairs if source != target}
+
+    assert window.color_replacement == converted_replacement({used[0]: used[1]})
+    assert window.replacement_history == [{}, converted_replacement({used[2]: used[3]})]
@@ -0,0 +1,89 @@
+"""调色板编译缓存测试"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+import palette as palette_module
+from conftest import ROOT
+from matching import distance_matrix
+from palette import cache_path_for, load_palette
+
+
+def test_palette_per_name_cache(tmp_path):
+    """同一文件以不同名称加载时共享数组，每个名称的调色板（及其距离矩阵）在切换后保留"""
+    path = str(tmp_path / 'Mard144.json')
+    shutil.copy(os.path.join(ROOT, 'color', 'Mard144.json'), path)
+    cache_dir = str(tmp_path / 'cache')
+
+    first = load_palette(path, 'A', cache_dir)
+    matrix = distance_matrix(first, 'CIEDE2000')
+    second = load_palette(path, 'B', cache_dir)
+    assert second.name == 'B' and second is not first
+    assert np.shares_memory(second.rgb, first.rgb) and second.lab is first.lab
+    assert load_palette(path, 'A', cache_dir) is first
+    assert load_palette(path, 'B', cache_dir) is second
+    assert distance_matrix(load_palette(path, 'A', cache_dir), 'CIEDE2000') is matrix
+    assert np.array_equal(load_palette(path, cache_dir=cache_dir).rgb, first.rgb)
+
+
+def counting(monkeypatch, name):
+    """统计 palette 模块中某个函数的调用次数"""
+    calls = []
+    original = getattr(palette_module, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(palette_module, name, wrapper)
+    return calls
+
+
+def test_compiled_cache_invalidation(tmp_path, monkeypatch):
+    """编译缓存：文件不变时不重新解析；只有修改时间变化时按内容哈希复用并刷新；内容变化时重新编译"""
+    path = str(tmp_path / 'colors.json')
+    with open(path, 'w') as f:
+        json.dump({'data': [{'colorCode': 'A1', 'color': '#102030'}, {'colorCode': 'A2', 'color': '#405060'}]}, f)
+    cache_dir = str(tmp_path / 'cache')
+    cache_file = cache_path_for(path, cache_dir)
+    parses = counting(monkeypatch, 'parse_palette_file')
+    hashes = counting(monkeypatch, '_file_hash')
+
+    def load_from_disk():
+        """清空进程内缓存后加载（只使用编译缓存）"""
+        monkeypatch.setattr(palette_module, '_loaded_palettes', {})
+        return load_palette(path, cache_dir=cache_dir)
+
+    assert load_from_disk().rgb.tolist() == [[16, 32, 48], [64, 80, 96]]
+    assert len(parses) == 1 and os.path.exists(cache_file)
+    assert load_from_disk().codes == ['A1', 'A2']
+    assert len(parses) == 1 and len(hashes) == 1  # 编译时计算一次哈希
+
+    # 内容不变、修改时间变化：比较哈希后复用缓存，并刷新缓存中的修改时间
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_from_disk().codes == ['A1', 'A2']
+    assert len(parses) == 1 and len(hashes) == 2
+    with np.load(cache_file) as data:
+        assert int(data['source_mtime_ns']) == os.stat(path).st_mtime_ns
+    load_from_disk()
+    assert len(hashes) == 2
+
+    # 内容变化（大小相同）：进程内缓存和编译缓存都失效
+    with open(path) as f:
+        text = f.read()
+    with open(path, 'w') as f:
+        f.write(text.replace('#405060', '#ffffff'))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    assert load_palette(path, cache_dir=cache_dir).rgb.tolist() == [[16, 32, 48], [255, 255, 255]]
+    assert len(parses) == 2
+    assert load_from_disk().rgb.tolist() == [[16, 32, 48], [255, 255, 255]]
+    assert len(parses) == 2
+
+    # 缓存文件损坏时重新编译
+    with open(cache_file, 'wb') as f:
+        f.write(b'broken')
+    assert load_from_disk().codes == ['A1', 'A2']
+    assert len(parses) == 3
@@ -0,0 +1,106 @@
+"""图案数据导出测试"""
+import csv
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from pattern_export import (BINARY_HEADER, BINARY_MAGIC, BINARY_VERSION, MAX_BINARY_CODES, export_pattern,
+                            load_binary)
+from pipeline import build_grid
+
+CODES = ['A1', 'B2', 'C3', '红1']
+COLOR_LOOKUP = {'A1': (255, 0, 0), 'B2': (0, 16, 255), 'C3': (1, 2, 3)}
+
+
+def make_grid(codes=CODES):
+    """3x4 测试网格：A1 ×3、B2 ×3、C3 ×2、红1 ×2，两个空白格子"""
+    indices = np.array([[0, 1, 1, 255],
+                        [2, 0, 1, 3],
+                        [255, 2, 3, 0]], dtype=np.uint8)
+    return build_grid(indices, list(codes))
+
+
+def test_json_export(tmp_path):
+    """JSON 色号图：空白为空字符串，用料清单按数量降序、数量相同时按色号表顺序"""
+    path = str(tmp_path / 'pattern.json')
+    assert export_pattern(make_grid(), path, COLOR_LOOKUP, 'Mard144') == [path]
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    assert (data['source'], data['width'], data['height']) == ('Mard144', 4, 3)
+    assert data['grid'] == [['A1', 'B2', 'B2', ''], ['C3', 'A1', 'B2', '红1'], ['', 'C3', '红1', 'A1']]
+    assert data['bom'] == [
+        {'colorCode': 'A1', 'count': 3, 'color': '#FF0000'},
+        {'colorCode': 'B2', 'count': 3, 'color': '#0010FF'},
+        {'colorCode': 'C3', 'count': 2, 'color': '#010203'},
+        {'colorCode': '红1', 'count': 2},  # 不在颜色表中，没有颜色
+    ]
+
+
+def test_csv_export(tmp_path):
+    """CSV 色号图和用料清单"""
+    path = str(tmp_path / 'pattern.csv')
+    written = export_pattern(make_grid(), path, COLOR_LOOKUP)
+    assert written == [path, str(tmp_path / 'pattern_bom.csv')]
+    with open(written[0], encoding='utf-8', newline='') as f:
+        assert list(csv.reader(f)) == [['A1', 'B2', 'B2', ''], ['C3', 'A1', 'B2', '红1'], ['', 'C3', '红1', 'A1']]
+    with open(written[1], encoding='utf-8', newline='') as f:
+        assert list(csv.reader(f)) == [['colorCode', 'color', 'count'], ['A1', '#FF0000', '3'],
+                                       ['B2', '#0010FF', '3'], ['C3', '#010203', '2'], ['红1', '', '2']]
+
+
+def test_binary_layout(tmp_path):
+    """二进制色号图的文件布局：文件头、色号表、数量、按行排列的索引"""
+    path = str(tmp_path / 'pattern.bmap')
+    export_pattern(make_grid(), path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert BINARY_HEADER.unpack_from(data) == (BINARY_MAGIC, BINARY_VERSION, 1, 4, 4, 3)
+    offset = BINARY_HEADER.size
+    for code in CODES:
+        encoded = code.encode('utf-8')
+        assert data[offset] == len(encoded)
+        assert data[offset + 1:offset + 1 + len(encoded)] == encoded
+        offset += 1 + len(encoded)
+    assert struct.unpack_from('<4I', data, offset) == (3, 3, 2, 2)
+    offset += 16
+    assert data[offset:] == bytes([0, 1, 1, 255, 2, 0, 1, 3, 255, 2, 3, 0])
+
+
+def test_binary_round_trip_uint16(tmp_path):
+    """色号超过 255 个时索引为 uint16，空白格子为 uint16 最大值"""
+    codes = [f'C{i}' for i in range(300)]
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, len(codes), (5, 7)).astype(np.uint16)
+    indices[0, 0] = indices[4, 6] = np.iinfo(np.uint16).max
+    grid = build_grid(indices, codes)
+    path = str(tmp_path / 'large.bmap')
+    export_pattern(grid, path)
+
+    loaded_codes, counts, loaded = load_binary(path)
+    assert loaded_codes == codes
+    assert loaded.dtype == np.dtype('<u2')
+    assert np.array_equal(loaded, indices)
+    assert counts.tolist() == np.bincount(indices[indices != 0xFFFF], minlength=len(codes)).tolist()
+
+
+def test_binary_rejects_out_of_range(tmp_path):
+    """色号数或色号长度超出格式范围时抛出 ValueError，不写出文件"""
+    path = tmp_path / 'bad.bmap'
+    with pytest.raises(ValueError):
+        export_pattern(make_grid(['A1', 'B2', 'C3', 'X' * 256]), str(path))
+    assert not path.exists()
+
+    grid = make_grid()
+    grid.codes = [f'C{i}' for i in range(MAX_BINARY_CODES + 1)]
+    with pytest.raises(ValueError):
+        export_pattern(grid, str(path))
+    assert not path.exists()
+
+
+def test_load_binary_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.bmap'
+    path.write_bytes(b'PNG\x00' + bytes(BINARY_HEADER.size))
+    with pytest.raises(ValueError):
+        load_binary(str(path))
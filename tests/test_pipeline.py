@@ -0,0 +1,121 @@
+"""流式处理与内存中处理的一致性测试"""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from matching import PaletteMatcher
+from pipeline import UniqueColorMatcher, build_grid, match_pixels, process_image_streaming, trim_transparent
+from resampling import RESAMPLE_METHODS, downscale_masked
+from rendering import PNGStreamWriter, render_full_image, render_full_image_mapped, render_full_image_parallel
+
+METHOD = 'LAB色彩空间'
+
+
+@pytest.mark.parametrize('band_rows', [1, 3, None])
+@pytest.mark.parametrize('show_color_codes', [True, False])
+def test_streaming_matches_full_render(tmp_path, palette, pixel_art, band_rows, show_color_codes):
+    """流式输出的PNG与 render_full_image 的结果逐像素相同"""
+    source_path = str(tmp_path / 'src.png')
+    output_path = str(tmp_path / 'out.png')
+    Image.fromarray(pixel_art).save(source_path)
+    color_lookup = palette.color_lookup()
+    match_color = PaletteMatcher(palette, METHOD)
+
+    result = process_image_streaming(source_path, output_path, match_color, color_lookup,
+                                     show_color_codes=show_color_codes, band_rows=band_rows)
+
+    trimmed, _, _ = trim_transparent(pixel_art)
+    indices = match_pixels(trimmed, match_color, list(color_lookup))
+    assert np.array_equal(result['indices'], indices)
+    grid = build_grid(indices, list(color_lookup))
+    assert result['color_statistics'] == grid.color_statistics()
+
+    expected = np.asarray(render_full_image(grid, color_lookup, show_color_codes))
+    with Image.open(output_path) as output:
+        assert output.size == result['output_size']
+        assert np.array_equal(np.asarray(output.convert('RGB')), expected)
+
+
+@pytest.mark.parametrize('resample', RESAMPLE_METHODS)
+@pytest.mark.parametrize('target_size', [(20, None), (None, 7), (30, 30)])
+def test_streaming_downscale(tmp_path, palette, pixel_art, resample, target_size):
+    """流式处理按目标网格尺寸缩小，结果与内存中先裁剪、整幅缩小再匹配相同"""
+    source_path = str(tmp_path / 'src.png')
+    output_path = str(tmp_path / 'out.png')
+    Image.fromarray(pixel_art).save(source_path)
+    color_lookup = palette.color_lookup()
+    codes = list(color_lookup)
+    match_color = PaletteMatcher(palette, METHOD)
+
+    result = process_image_streaming(source_path, output_path, None, color_lookup, band_rows=2,
+                                     matcher=UniqueColorMatcher(match_color, codes),
+                                     target_size=target_size, resample=resample)
+
+    trimmed, _, _ = trim_transparent(pixel_art)
+    assert result['trimmed_size'] == (44, 32)
+    grid_width, grid_height = result['grid_size']
+    assert grid_width <= 44 and grid_height <= 32
+    assert target_size[0] in (None, grid_width) and target_size[1] in (None, grid_height)
+    resized, mask = downscale_masked(trimmed, trimmed[..., 3] == 0, grid_width, grid_height, resample)
+    indices = UniqueColorMatcher(match_color, codes).match(resized, mask)
+    assert np.array_equal(result['indices'], indices)
+
+    expected = np.asarray(render_full_image(build_grid(indices, codes), color_lookup))
+    with Image.open(output_path) as output:
+        assert np.array_equal(np.asarray(output.convert('RGB')), expected)
+
+
+@pytest.mark.parametrize('block_size', [4, 7, 12, 20])
+def test_band_renders_match_full_render(tmp_path, palette, pixel_art, block_size):
+    """并行渲染和内存映射渲染与 render_full_image 逐像素相同（包括放不下色号的小色块）"""
+    color_lookup = palette.color_lookup()
+    trimmed, _, _ = trim_transparent(pixel_art)
+    indices = match_pixels(trimmed, PaletteMatcher(palette, METHOD), list(color_lookup))
+    grid = build_grid(indices, list(color_lookup), block_size)
+    expected = np.asarray(render_full_image(grid, color_lookup))
+
+    assert np.array_equal(np.asarray(render_full_image_parallel(grid, color_lookup, threads=3)), expected)
+    output_path = str(tmp_path / 'mapped.png')
+    render_full_image_mapped(grid, color_lookup, output_path, threads=3, band_rows=2)
+    with Image.open(output_path) as output:
+        assert np.array_equal(np.asarray(output.convert('RGB')), expected)
+
+
+def test_stream_writer_keeps_previous_file_on_error(tmp_path):
+    """写入中途出错时删除临时文件，已有的输出文件保持不变"""
+    output_path = str(tmp_path / 'out.png')
+    with open(output_path, 'wb') as f:
+        f.write(b'previous')
+    with pytest.raises(RuntimeError):
+        with PNGStreamWriter(output_path, 4, 2) as writer:
+            writer.write_rows(np.zeros((1, 4, 3), dtype=np.uint8))
+            raise RuntimeError('中断')
+    with open(output_path, 'rb') as f:
+        assert f.read() == b'previous'
+    assert os.listdir(tmp_path) == ['out.png']
+
+
+def test_stream_writer_incomplete_rows(tmp_path):
+    """写入的行数不足时 close 报错且不生成输出文件"""
+    output_path = str(tmp_path / 'out.png')
+    writer = PNGStreamWriter(output_path, 4, 2)
+    writer.write_rows(np.zeros((1, 4, 3), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        writer.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_stream_writer_replace_failure(tmp_path, monkeypatch):
+    """替换输出文件失败时同样删除临时文件"""
+    output_path = str(tmp_path / 'out.png')
+
+    def fail(source, target):
+        raise PermissionError('文件被占用')
+    monkeypatch.setattr(os, 'replace', fail)
+    writer = PNGStreamWriter(output_path, 4, 1)
+    writer.write_rows(np.zeros((1, 4, 3), dtype=np.uint8))
+    with pytest.raises(PermissionError):
+        writer.close()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,49 @@
+"""阶段计时测试"""
+import threading
+
+from profiling import Profiler
+
+
+def run_in_thread(function):
+    thread = threading.Thread(target=function)
+    thread.start()
+    thread.join()
+
+
+def test_worker_spans_outside_run_not_recorded():
+    """运行之外的工作线程阶段和计数器不计入之后的运行记录"""
+    profiler = Profiler()
+
+    def work():
+        with profiler.span('band'):
+            profiler.count('cells_rendered', 5)
+    run_in_thread(work)
+
+    with profiler.span('process_image'):
+        with profiler.span('match'):
+            pass
+    run = profiler.last_run
+    assert set(run['spans']) == {'process_image/match', 'process_image'}
+    assert run['counters'] == {}
+    assert profiler.spans['band']['count'] == 1
+    assert profiler.counters == {'cells_rendered': 5}
+
+
+def test_worker_spans_during_run_recorded():
+    """运行进行中的工作线程阶段和计数器计入本次运行"""
+    profiler = Profiler()
+
+    def work():
+        with profiler.span('band'):
+            profiler.count('cells_rendered', 3)
+
+    with profiler.span('save_image'):
+        run_in_thread(work)
+    run = profiler.last_run
+    assert run['spans']['band'] > 0
+    assert run['counters'] == {'cells_rendered': 3}
+
+    with profiler.span('save_image'):
+        pass
+    assert 'band' not in profiler.last_run['spans']
+    assert profiler.last_run['counters'] == {}
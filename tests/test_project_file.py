@@ -0,0 +1,84 @@
+"""工程文件读写测试"""
+import numpy as np
+import pytest
+
+from pipeline import build_grid
+from project_file import load_project, referenced_codes, save_project
+
+CODES = ['A1', 'A2', 'B1', 'C3']
+
+
+def make_grid(width=7, height=5):
+    """生成带空白格子的测试网格"""
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, len(CODES), (height, width)).astype(np.uint8)
+    indices[0, :2] = np.iinfo(np.uint8).max
+    indices[2, 3] = 0
+    return build_grid(indices, list(CODES), block_size=12, axis_size=24)
+
+
+def test_round_trip(tmp_path):
+    """保存后重新加载，网格索引和编辑状态保持不变"""
+    grid = make_grid()
+    grid.update_block_color(3, 2, 'C3')
+    brush_changes = [{'x': 3, 'y': 2, 'old_color': 'A1', 'new_color': 'C3'}]
+    path = str(tmp_path / 'test.cmproj')
+    save_project(path, grid, 'Mard144', color_replacement={'A1': 'A2'}, replacement_history=[{}],
+                 brush_changes=brush_changes, image_path='src.png', show_color_codes=False)
+
+    project = load_project(path)
+    loaded = project['grid']
+    assert np.array_equal(loaded.indices, grid.indices)
+    assert np.array_equal(loaded.original_indices, grid.original_indices)
+    assert loaded.codes == grid.codes
+    assert (loaded.width, loaded.height, loaded.block_size, loaded.axis_size) == (7, 5, 12, 24)
+    assert loaded.color_statistics() == grid.color_statistics()
+    assert loaded.get_block_color(3, 2) == 'C3'
+    assert loaded.blocks[(3, 2)].modified
+    assert (0, 0) not in loaded.blocks
+    assert project['source'] == 'Mard144'
+    assert project['color_replacement'] == {'A1': 'A2'}
+    assert project['replacement_history'] == [{}]
+    assert project['brush_changes'] == brush_changes
+    assert project['image_path'] == 'src.png'
+    assert project['show_color_codes'] is False
+
+
+def test_round_trip_memory_mapped(tmp_path):
+    """超过阈值的数组以内存映射加载，编辑不写回文件"""
+    grid = make_grid(64, 48)
+    path = str(tmp_path / 'large.cmproj')
+    save_project(path, grid, 'Mard144')
+
+    project = load_project(path, mmap_threshold=1)
+    loaded = project['grid']
+    assert isinstance(loaded.indices, np.memmap)
+    assert np.array_equal(loaded.indices, grid.indices)
+    loaded.indices[1, 1] = 0
+    assert np.array_equal(load_project(path)['grid'].indices, grid.indices)
+
+    # 保存回同一路径前释放映射，保存的是编辑后的内容
+    save_project(path, loaded, 'Mard144')
+    assert not isinstance(loaded.indices, np.memmap)
+    assert not isinstance(loaded.original_indices, np.memmap)
+    assert load_project(path)['grid'].indices[1, 1] == 0
+
+
+def test_referenced_codes(tmp_path):
+    """工程引用的色号包括网格中使用的色号、颜色替换和画笔记录，不包括色号表中未使用的色号"""
+    grid = build_grid(np.array([[0, 0], [1, 255]], dtype=np.uint8), list(CODES))
+    path = str(tmp_path / 'codes.cmproj')
+    save_project(path, grid, 'Mard144', color_replacement={'A1': 'B1'},
+                 brush_changes=[{'x': 0, 'y': 0, 'old_color': 'A1', 'new_color': 'A1'}])
+    assert referenced_codes(load_project(path)) == {'A1', 'A2', 'B1'}
+
+
+def test_save_does_not_modify_codes(tmp_path):
+    """保存时不向网格的色号表追加色号，画笔记录中有未知色号时报错"""
+    grid = make_grid()
+    path = str(tmp_path / 'unknown.cmproj')
+    with pytest.raises(ValueError):
+        save_project(path, grid, 'Mard144',
+                     brush_changes=[{'x': 0, 'y': 0, 'old_color': 'A1', 'new_color': 'Z9'}])
+    assert grid.codes == CODES
+    assert 'Z9' not in grid.code_index
@@ -0,0 +1,106 @@
+"""限制颜色数测试"""
+import numpy as np
+import pytest
+
+from matching import distance_matrix
+from reduction import plan_color_reduction
+
+METHODS = ['LAB色彩空间', 'CIEDE2000']
+
+
+class Dialog:
+    def close(self):
+        pass
+
+
+def random_statistics(palette, size=20, seed=0):
+    """随机选取 size 个色号和数量"""
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(palette.codes, size, replace=False).tolist()
+    return {code: int(number) for code, number in zip(codes, rng.integers(1, 50, size))}
+
+
+def reference_plan(color_statistics, palette, method, max_colors):
+    """逐步合并的参考实现：每次将用量最少的色号并入距离最近的其余保留色号"""
+    distances = distance_matrix(palette, method)
+    counts = dict(color_statistics)
+    owner = {code: code for code in color_statistics}
+    while len(counts) > max_colors:
+        smallest = min(counts, key=counts.get)
+        nearest = min((code for code in counts if code != smallest),
+                      key=lambda code: distances[palette.code_index[smallest], palette.code_index[code]])
+        counts[nearest] += counts.pop(smallest)
+        owner = {code: nearest if target == smallest else target for code, target in owner.items()}
+    return {code: target for code, target in owner.items() if code != target}
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('max_colors', [1, 5, 19, 20, 30])
+def test_max_colors(palette, method, max_colors):
+    """合并后不超过最大颜色数，合并结果与逐步合并的参考实现相同"""
+    color_statistics = random_statistics(palette)
+    mapping = plan_color_reduction(color_statistics, palette, method, max_colors)
+    assert mapping == reference_plan(color_statistics, palette, method, max_colors)
+    survivors = {mapping.get(code, code) for code in color_statistics}
+    assert len(survivors) == min(max_colors, len(color_statistics))
+    assert not survivors & set(mapping)  # 合并目标都是保留的色号
+    assert sum(color_statistics[code] for code in color_statistics) == \
+        sum(color_statistics[code] for code in color_statistics if mapping.get(code, code) in survivors)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_inventory_only(palette, method):
+    """只指定库存时，不在库存中的色号合并到距离最近的库存色号"""
+    color_statistics = random_statistics(palette, seed=1)
+    used = list(color_statistics)
+    inventory = used[:3] + [code for code in palette.codes if code not in color_statistics][:4]
+    mapping = plan_color_reduction(color_statistics, palette, method, inventory=inventory)
+
+    distances = distance_matrix(palette, method)
+    positions = [palette.code_index[code] for code in inventory]
+    expected = {code: inventory[int(np.argmin(distances[palette.code_index[code], positions]))]
+                for code in used[3:]}
+    assert mapping == expected
+    assert set(mapping.values()) <= set(inventory)
+
+
+def test_inventory_and_max_colors(palette):
+    """同时指定库存和最大颜色数时，结果只使用库存色号且不超过上限"""
+    color_statistics = random_statistics(palette, seed=2)
+    inventory = palette.codes[::7]
+    mapping = plan_color_reduction(color_statistics, palette, 'LAB色彩空间', 3, inventory)
+    survivors = {mapping.get(code, code) for code in color_statistics}
+    assert len(survivors) <= 3
+    assert survivors <= set(inventory)
+
+
+def test_invalid_requests(palette):
+    color_statistics = random_statistics(palette)
+    assert plan_color_reduction({}, palette, 'LAB色彩空间', 3) == {}
+    assert plan_color_reduction(color_statistics, palette, 'LAB色彩空间', 20) == {}
+    with pytest.raises(ValueError):
+        plan_color_reduction(color_statistics, palette, 'LAB色彩空间', 0)
+    with pytest.raises(ValueError):
+        plan_color_reduction(color_statistics, palette, 'LAB色彩空间', inventory=[])
+    with pytest.raises(ValueError):
+        plan_color_reduction(color_statistics, palette, 'LAB色彩空间', inventory=['不存在的色号'])
+
+
+def test_apply_color_reduction(window):
+    """界面中限制颜色数：网格只使用保留的色号，合并并入颜色替换映射，可撤销"""
+    grid = window.image_grid
+    original = grid.color_statistics()
+    assert len(original) > 3
+    window.color_replacement = {'A1': sorted(original)[0]}  # 已有的替换指向被合并的色号时跟随合并
+    window.apply_color_reduction('3', '', Dialog())
+
+    reduced = grid.color_statistics()
+    assert len(reduced) <= 3
+    assert sum(reduced.values()) == sum(original.values())
+    for code in original:
+        assert window.color_replacement.get(code, code) in reduced
+    assert window.color_replacement['A1'] in reduced
+
+    window.undo_last_replacement()
+    assert window.color_replacement == {'A1': sorted(original)[0]}
+    assert grid.color_statistics() == original
@@ -0,0 +1,71 @@
+"""渲染测试：缩略图，并行、内存映射和逐块渲染的一致性"""
+import numpy as np
+import pytest
+from PIL import Image
+
+import rendering
+from pipeline import build_grid
+from rendering import render_full_image, render_full_image_mapped, render_full_image_parallel, render_thumbnail
+
+BLOCK_SIZE = 6
+AXIS_SIZE = 20
+
+
+def block_colors(image, grid):
+    """从完整渲染结果中取出每个色块左上角像素的颜色，形状为 (高, 宽, 3)"""
+    pixels = np.asarray(image)
+    ys = AXIS_SIZE + np.arange(grid.height) * BLOCK_SIZE
+    xs = AXIS_SIZE + np.arange(grid.width) * BLOCK_SIZE
+    return pixels[ys[:, None], xs[None, :]]
+
+
+@pytest.mark.parametrize('scale', [1, 3])
+def test_thumbnail_matches_block_colors(palette, scale):
+    """缩略图每个色块的颜色与完整渲染相同（包括空白格子和不在颜色表中的色号）"""
+    color_lookup = palette.color_lookup()
+    codes = palette.codes[:5] + ['ZZ99']  # 最后一个色号不在颜色表中
+    rng = np.random.default_rng(2)
+    indices = rng.integers(0, len(codes), (9, 11)).astype(np.uint8)
+    indices[0, 0] = indices[3, 4] = np.iinfo(np.uint8).max
+    indices[1, 1] = len(codes) - 1
+    grid = build_grid(indices, codes, BLOCK_SIZE, AXIS_SIZE)
+
+    thumbnail = render_thumbnail(grid, color_lookup, scale)
+    assert thumbnail.shape == (grid.height * scale, grid.width * scale, 3)
+    expected = block_colors(render_full_image_parallel(grid, color_lookup, show_color_codes=False), grid)
+    assert np.array_equal(thumbnail[::scale, ::scale], expected)
+    assert np.array_equal(thumbnail, np.repeat(np.repeat(expected, scale, axis=0), scale, axis=1))
+    assert tuple(thumbnail[scale, scale]) == (255, 255, 255)
+
+
+def random_grid(palette, height, width, block_size, seed=3):
+    """随机色号网格（含空白格子）"""
+    codes = palette.codes[:12]
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, len(codes), (height, width)).astype(np.uint8)
+    indices[rng.random((height, width)) < 0.1] = np.iinfo(np.uint8).max
+    return build_grid(indices, codes, block_size, AXIS_SIZE)
+
+
+@pytest.mark.parametrize('block_size', [6, 16])
+@pytest.mark.parametrize('threads, band_rows', [(1, 1), (4, 3), (3, 5), (2, 13), (4, 40), (4, None)])
+def test_parallel_and_mapped_match_serial(tmp_path, monkeypatch, palette, block_size, threads, band_rows):
+    """同一网格的并行渲染、内存映射渲染与逐块渲染字节相同（行带数不整除网格行数、画布按不整除的行带编码）"""
+    grid = random_grid(palette, 13, 11, block_size)
+    color_lookup = palette.color_lookup()
+    expected = np.asarray(render_full_image(grid, color_lookup))
+
+    parallel = np.asarray(render_full_image_parallel(grid, color_lookup, threads=threads, band_rows=band_rows))
+    assert parallel.dtype == expected.dtype and parallel.shape == expected.shape
+    assert parallel.tobytes() == expected.tobytes()
+
+    # 编码行带为 7 个像素行（未指定色块行带时每个行带一个网格行）
+    row_bytes = expected.shape[1] * 3
+    monkeypatch.setattr(rendering, 'MAPPED_BAND_BYTES', 7 * row_bytes + 1)
+    output_path = str(tmp_path / 'mapped.png')
+    size = render_full_image_mapped(grid, color_lookup, output_path, threads=threads, band_rows=band_rows)
+    assert size == (expected.shape[1], expected.shape[0])
+    with Image.open(output_path) as output:
+        assert output.mode == 'RGB'
+        assert np.asarray(output).tobytes() == expected.tobytes()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['mapped.png']  # 临时画布已删除
@@ -0,0 +1,128 @@
+"""源图片缩小测试"""
+import numpy as np
+import pytest
+
+import resampling
+from resampling import (RESAMPLE_AREA, RESAMPLE_METHODS, RESAMPLE_MODE, BandDownscaler, downscale,
+                        downscale_masked, fit_grid_size)
+
+
+def random_pixels(height, width, seed=0):
+    """少量颜色、带透明像素的随机 RGBA 图片（众数模式下有足够的重复颜色）"""
+    rng = np.random.default_rng(seed)
+    colors = rng.integers(0, 256, (6, 4), dtype=np.uint8)
+    colors[:, 3] = 255
+    colors[0, 3] = 0
+    return colors[rng.integers(0, len(colors), (height, width))]
+
+
+def cells(height, width, out_height, out_width):
+    """逐个格子给出源数组中的 (输出行, 输出列, 行切片, 列切片)，边界为 floor(i * 源尺寸 / 目标尺寸)"""
+    for row in range(out_height):
+        for col in range(out_width):
+            yield (row, col, slice(row * height // out_height, (row + 1) * height // out_height),
+                   slice(col * width // out_width, (col + 1) * width // out_width))
+
+
+def reference_area(pixels, mask, out_width, out_height):
+    """逐格子计算的区域平均：不透明像素的平均颜色（四舍五入），不透明像素不少于一半时不透明"""
+    result = np.zeros((out_height, out_width, 4), dtype=np.uint8)
+    for row, col, rows, cols in cells(*pixels.shape[:2], out_height, out_width):
+        opaque = pixels[rows, cols, :3][~mask[rows, cols]].astype(np.int64)
+        if len(opaque):
+            result[row, col, :3] = (opaque.sum(axis=0) + len(opaque) // 2) // len(opaque)
+        result[row, col, 3] = 255 if len(opaque) * 2 >= mask[rows, cols].size else 0
+    return result
+
+
+def reference_mode(pixels, mask, out_width, out_height):
+    """逐格子计算的众数：透明像素也参与计数，数量相同时取颜色值较小的（透明排在所有颜色之后）"""
+    result = np.zeros((out_height, out_width, 4), dtype=np.uint8)
+    for row, col, rows, cols in cells(*pixels.shape[:2], out_height, out_width):
+        counts = {}
+        for pixel, transparent in zip(pixels[rows, cols].reshape(-1, 4), mask[rows, cols].ravel()):
+            key = (1, 0, 0, 0) if transparent else (0, *map(int, pixel[:3]))
+            counts[key] = counts.get(key, 0) + 1
+        winner = min(counts, key=lambda key: (-counts[key], key))
+        if not winner[0]:
+            result[row, col] = (*winner[1:], 255)
+    return result
+
+
+REFERENCES = {RESAMPLE_AREA: reference_area, RESAMPLE_MODE: reference_mode}
+
+
+@pytest.mark.parametrize('method', RESAMPLE_METHODS)
+@pytest.mark.parametrize('out_size', [(23, 37), (9, 10), (7, 5), (1, 1), (4, 37)])
+@pytest.mark.parametrize('band_pixels', [resampling.RESAMPLE_BAND_PIXELS, 1])
+def test_downscale_matches_reference(monkeypatch, method, out_size, band_pixels):
+    """整除和不整除的目标尺寸、带透明像素时，缩小结果与逐格子计算相同（band_pixels=1 时每个行带只有一个网格行）"""
+    monkeypatch.setattr(resampling, 'RESAMPLE_BAND_PIXELS', band_pixels)
+    pixels = random_pixels(37, 23, seed=1)
+    mask = pixels[..., 3] == 0
+    out_width, out_height = out_size
+    expected = REFERENCES[method](pixels, mask, out_width, out_height)
+    if out_size == (23, 37):
+        expected = pixels  # 尺寸不变时原样返回
+    assert np.array_equal(downscale(pixels, out_width, out_height, method, mask), expected)
+
+
+def test_area_ignores_masked_colors():
+    """区域平均不计入背景像素的颜色，背景像素占多数的格子为透明"""
+    pixels = np.zeros((2, 4, 4), dtype=np.uint8)
+    pixels[..., :3] = [[[10, 20, 30], [250, 250, 250], [0, 0, 0], [0, 0, 0]],
+                       [[30, 40, 50], [250, 250, 250], [0, 0, 0], [90, 90, 90]]]
+    mask = np.array([[False, True, True, True],
+                     [False, True, True, False]])
+    result = downscale(pixels, 2, 1, RESAMPLE_AREA, mask)
+    assert result[0, 0].tolist() == [20, 30, 40, 255]
+    assert result[0, 1].tolist() == [90, 90, 90, 0]
+
+
+def test_mode_tie_break():
+    """众数数量相同时取颜色值较小的，透明与颜色数量相同时取颜色"""
+    pixels = np.zeros((2, 4, 4), dtype=np.uint8)
+    pixels[..., 3] = 255
+    pixels[0, :2, :3] = [[200, 0, 0], [0, 0, 9]]
+    pixels[1, :2, :3] = [[200, 0, 0], [0, 0, 9]]
+    pixels[:, 2:, :3] = [0, 255, 0]
+    pixels[0, 2:, 3] = 0
+    mask = pixels[..., 3] == 0
+    result = downscale(pixels, 2, 1, RESAMPLE_MODE, mask)
+    assert result[0, 0].tolist() == [0, 0, 9, 255]
+    assert result[0, 1].tolist() == [0, 255, 0, 255]
+
+
+@pytest.mark.parametrize('target, expected', [
+    ((None, None), (40, 30)),
+    ((20, None), (20, 15)),
+    ((None, 15), (20, 15)),
+    ((10, 10), (10, 10)),
+    ((80, None), (40, 30)),
+    ((None, 60), (40, 30)),
+    ((100, 100), (40, 30)),
+    ((1, None), (1, 1)),
+])
+def test_fit_grid_size(target, expected):
+    """只指定一边时按比例计算另一边，不会超过源尺寸（不放大）"""
+    assert fit_grid_size(40, 30, *target) == expected
+
+
+@pytest.mark.parametrize('method', RESAMPLE_METHODS)
+@pytest.mark.parametrize('bands', [[37], [1] * 37, [5, 3, 16, 13]])
+def test_band_downscaler_matches_whole_image(method, bands):
+    """按任意行带逐步缩小的结果与整幅缩小相同"""
+    pixels = random_pixels(37, 23)
+    mask = pixels[..., 3] == 0
+    expected, expected_mask = downscale_masked(pixels, mask, 9, 10, method)
+
+    downscaler = BandDownscaler(23, 37, 9, 10, method)
+    parts, part_masks = [], []
+    start = 0
+    for rows in bands:
+        part, part_mask = downscaler.add(pixels[start:start + rows], mask[start:start + rows])
+        parts.append(part)
+        part_masks.append(part_mask)
+        start += rows
+    assert np.array_equal(np.concatenate(parts), expected)
+    assert np.array_equal(np.concatenate(part_masks), expected_mask)
@@ -0,0 +1,85 @@
+"""结果缓存测试：图形界面与 HTTP 服务共用条目、命中 / 未命中和按大小淘汰"""
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+from conftest import ROOT
+from profiling import PROFILER
+from result_cache import ResultCache, data_digest, match_options, result_info, result_key
+from server import PatternWorker, parse_options
+
+
+def png_bytes(pixels):
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, 'PNG')
+    return output.getvalue()
+
+
+def test_server_entry_has_gui_info(tmp_path, monkeypatch, pixel_art):
+    """服务写入的条目包含界面读取的全部信息，界面按相同的键命中"""
+    monkeypatch.chdir(tmp_path)  # 调色板编译缓存写入临时目录
+    sources = {'Mard144': os.path.join(ROOT, 'color', 'Mard144.json')}
+    cache = ResultCache(str(tmp_path / 'cache'))
+    worker = PatternWorker(sources, cache)
+    options = parse_options({}, sources)
+    image_bytes = png_bytes(pixel_art)
+    assert not worker.process(image_bytes, options)['cache_hit']
+    assert worker.process(image_bytes, options)['cache_hit']
+
+    # 与 ColorMatcher.process_image 计算缓存键的方式相同（无颜色替换）
+    key = result_key(data_digest(image_bytes), worker.palettes['Mard144'], options['method'],
+                     match_options(options['dither'], (options['width'], options['height']),
+                                   options['resample'], {}, options['background']))
+    entry = cache.get(key)
+    assert entry is not None
+    assert tuple(entry['info']['original_size']) == (52, 40)
+    assert tuple(entry['info']['trimmed_size']) == (44, 32)
+    assert entry['indices'].shape == (32, 44)
+    assert entry['codes'] == worker.palettes['Mard144'].codes
+
+
+def test_incomplete_info_is_miss(tmp_path):
+    """缺少必需信息的条目（旧版本写入）按未命中处理"""
+    cache = ResultCache(str(tmp_path))
+    indices = np.zeros((2, 3), dtype=np.uint8)
+    cache.put('old', indices, ['A1'], {'A1': 6}, {'original_size': [3, 2]})
+    assert cache.get('old') is None
+    cache.put('new', indices, ['A1'], {'A1': 6}, result_info((3, 2), (3, 2)))
+    entry = cache.get('new')
+    assert np.array_equal(entry['indices'], indices)
+    assert entry['color_statistics'] == {'A1': 6}
+    assert entry['info'] == {'original_size': [3, 2], 'trimmed_size': [3, 2], 'quality': None}
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put('key', np.zeros((1, 1), dtype=np.uint8), ['A1'], {'A1': 1}, result_info((1, 1), (1, 1)))
+    PROFILER.reset()
+    assert cache.get('missing') is None
+    assert cache.get('key') is not None
+    assert cache.get('key') is not None
+    assert PROFILER.counters == {'result_cache_misses': 1, 'result_cache_hits': 2}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    """超过大小上限时删除最久未使用的条目，命中会刷新使用时间"""
+    cache = ResultCache(str(tmp_path))
+    rng = np.random.default_rng(0)
+    for i, key in enumerate(['a', 'b', 'c']):
+        indices = rng.integers(0, 256, (64, 64), dtype=np.uint8)  # 随机数据压缩后大小基本不变
+        cache.put(key, indices, ['A1'], {}, result_info((64, 64), (64, 64)))
+        os.utime(cache.path_for(key), ns=(i * 10 ** 9, i * 10 ** 9))
+    assert cache.get('a') is not None  # a 成为最近使用的条目
+
+    sizes = {key: os.path.getsize(cache.path_for(key)) for key in 'abc'}
+    cache.max_bytes = sizes['a'] + sizes['c']
+    cache.evict()
+    assert not os.path.exists(cache.path_for('b'))
+    assert os.path.exists(cache.path_for('a')) and os.path.exists(cache.path_for('c'))
+    assert cache.size() == sizes['a'] + sizes['c']
+
+    cache.max_bytes = 0
+    cache.evict()
+    assert cache.entries() == []
@@ -0,0 +1,103 @@
+"""HTTP 服务测试：请求名额（用线程池代替进程池）、输出尺寸上限和请求校验"""
+import http.client
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pytest
+from PIL import Image
+
+import server
+from conftest import ROOT
+
+
+@pytest.fixture
+def service():
+    service = server.PatternService(workers=1, max_queue=0, timeout=0.05, sources={'test': 'unused.json'})
+    service.pool.shutdown()
+    service.pool = ThreadPoolExecutor(1)
+    yield service
+    service.pool.shutdown(wait=True)
+
+
+def test_timed_out_request_keeps_slot_until_finished(service, monkeypatch):
+    """等待超时后仍在处理的请求继续占用名额，处理结束后才释放"""
+    release = threading.Event()
+    monkeypatch.setattr(server, '_process', lambda image_bytes, options: release.wait(5))
+    assert service.try_acquire()
+    with pytest.raises(FutureTimeoutError):
+        service.process(b'', {})
+    assert not service.try_acquire()
+    assert service.status()['active'] == 1
+
+    release.set()
+    service.pool.shutdown(wait=True)
+    assert service.status()['active'] == 0
+    assert service.try_acquire()
+
+
+def test_finished_request_releases_slot(service, monkeypatch):
+    monkeypatch.setattr(server, '_process', lambda image_bytes, options: 'result')
+    assert service.try_acquire()
+    result, _ = service.process(b'', {})
+    assert result == 'result'
+    service.pool.shutdown(wait=True)
+    assert service.status()['completed'] == 1
+    assert service.try_acquire()
+
+
+def test_output_size_limit(tmp_path, monkeypatch, pixel_art):
+    """输出图片超过像素数上限时在匹配前拒绝，缩略图按缩略图尺寸计算"""
+    monkeypatch.chdir(tmp_path)  # 调色板编译缓存写入临时目录
+    sources = {'Mard144': os.path.join(ROOT, 'color', 'Mard144.json')}
+    output = io.BytesIO()
+    Image.fromarray(pixel_art).save(output, 'PNG')
+    image_bytes = output.getvalue()
+    options = server.parse_options({}, sources)
+    # 裁剪后网格 44x32，默认色块大小 20、坐标轴 30：不含统计区域 910x670 像素
+    worker = server.PatternWorker(sources, max_output_pixels=910 * 670 - 1)
+    with pytest.raises(server.OutputTooLarge):
+        worker.process(image_bytes, options)
+
+    options['thumbnail'] = 4
+    result = worker.process(image_bytes, options)
+    assert result['output_size'] == (44 * 4, 32 * 4)
+
+    worker = server.PatternWorker(sources, max_output_pixels=910 * 670)
+    with pytest.raises(server.OutputTooLarge):  # 加上色号统计区域后超出
+        worker.process(image_bytes, server.parse_options({}, sources))
+
+
+@pytest.fixture
+def http_server(service):
+    httpd = server.PatternServer(('127.0.0.1', 0), service)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(httpd, body, headers):
+    connection = http.client.HTTPConnection(*httpd.server_address, timeout=5)
+    connection.putrequest('POST', '/process')
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.endheaders(body)
+    response = connection.getresponse()
+    status = response.status
+    response.read()
+    connection.close()
+    return status
+
+
+def test_invalid_content_length(http_server):
+    assert post(http_server, b'', {'Content-Length': 'abc'}) == 400
+
+
+def test_output_too_large_status(http_server, monkeypatch):
+    def too_large(image_bytes, options):
+        raise server.OutputTooLarge('输出图片过大')
+    monkeypatch.setattr(server, '_process', too_large)
+    assert post(http_server, b'data', {'Content-Length': '4'}) == 413